@@ -0,0 +1,91 @@
+"""Measures how fast the Shopify and Woo scraper containers come up: module import time and time until /ready answers.
+
+Import time comes from `python -X importtime`. Each run happens in a fresh interpreter, so nothing is cached
+in memory, and the report lists the heaviest imports directly under the scraper module. Time to ready starts
+the API the way the container does and polls /ready until it returns 200. The DB pool is left off, since the
+readiness probe does not wait for MySQL.
+
+    python bench/bench_cold_start.py --runs 5
+    python bench/bench_cold_start.py --scraper woo --server gunicorn --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCRAPERS = { # (directory, module, port environment variable)
+    "shopify": (os.path.join(BENCH_DIR, "..", "shopify"), "Scrapping_Shop", "FLASK_PORT"),
+    "woo": (os.path.join(BENCH_DIR, "..", "woo"), "Scrapping_Woo", "FLASK_PORT_WOO"),
+}
+
+
+def import_times(scraper):
+    """Returns (total µs, {top-level import: cumulative µs}) for one fresh import of the scraper module."""
+    scraper_dir, module_name, _ = SCRAPERS[scraper]
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                         cwd=scraper_dir, capture_output=True, text=True, check=True)
+    total, children = 0, {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module_name:
+            total = int(cumulative)
+        elif name.startswith("   ") and not name.startswith("     "): # Imported by the module itself
+            children[name.strip()] = int(cumulative)
+    return total, children
+
+
+def time_to_ready(scraper, server, port, timeout_s=30):
+    scraper_dir, module_name, port_env = SCRAPERS[scraper]
+    started_at = time.perf_counter()
+    process = subprocess.Popen([sys.executable, f"{module_name}.py", "--db_pool_size", "0", "--server", server],
+                               cwd=scraper_dir, env=dict(os.environ, **{port_env: str(port)}),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started_at < timeout_s:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started_at
+            except OSError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"{scraper} API did not become ready within {timeout_s}s")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scraper", choices=["shopify", "woo", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement; medians are reported")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest imports to list per scraper")
+    parser.add_argument("--server", choices=["flask", "gunicorn"], default="flask", help="How the API is served for time to ready")
+    parser.add_argument("--port", type=int, default=5990)
+    args = parser.parse_args()
+
+    scrapers = ["shopify", "woo"] if args.scraper == "both" else [args.scraper]
+    print(f"{'scraper':<10}{'import ms':>11}{'ready s':>10}")
+    breakdowns = {}
+    for scraper in scrapers:
+        runs = [import_times(scraper) for _ in range(args.runs)]
+        breakdowns[scraper] = {name: statistics.median(children.get(name, 0) for _, children in runs) for name in runs[0][1]}
+        import_ms = statistics.median(total for total, _ in runs) / 1000
+        ready_s = statistics.median(time_to_ready(scraper, args.server, args.port) for _ in range(args.runs))
+        print(f"{scraper:<10}{import_ms:>11.1f}{ready_s:>10.2f}")
+
+    for scraper, children in breakdowns.items():
+        print(f"\nHeaviest imports of {SCRAPERS[scraper][1]} (cumulative ms):")
+        for name, cumulative in sorted(children.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {name:<32}{cumulative / 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
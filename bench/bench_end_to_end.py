@@ -0,0 +1,322 @@
+"""Runs the Shopify and Woo scrapers end to end against a local stand-in shop server and reports throughput.
+
+The parent process serves synthetic catalogs built from bench/fixtures/ (Shopify /products.json pages and
+Barefoot category/product HTML) with a simulated per-request latency. Each scraper then runs in its own
+subprocess, so peak RSS is the scraper's alone. Writes go to a recording stand-in connection that accepts
+every statement, unless --db_host points at a real MySQL. Either way every execute/executemany/commit/rollback
+is counted as one DB round-trip.
+
+    python bench/bench_end_to_end.py --catalog_size 1000 --latency_ms 50
+    python bench/bench_end_to_end.py --scraper shopify --catalog_size 5000 -- --page_window 1
+    python bench/bench_end_to_end.py --scraper shopify --stores 8 --baseline
+
+Arguments after `--` are passed to the scraper's own parser.
+"""
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import resource
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import fixture_data
+
+SCRAPERS = {
+    "shopify": (os.path.join(BENCH_DIR, "..", "shopify"), "Scrapping_Shop", "run_shopify_scraper_logic"),
+    "woo": (os.path.join(BENCH_DIR, "..", "woo"), "Scrapping_Woo", "run_woo_scraper_logic"),
+}
+
+
+SHOPIFY_PAGE_LIMIT = 250 # The limit the Shopify scraper requests pages with
+
+
+def rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# --- Stand-in Shop Server ---
+class ShopHandler(http.server.BaseHTTPRequestHandler):
+    catalog_size = 0
+    latency_s = 0.0
+    description_kb = None
+    store_api = True # Serve the Woo Store API; without it the Woo scraper falls back to HTML pages
+    rendered = {} # Path -> (body, headers) built before the run starts
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency_s)
+        url = urlparse(self.path)
+        response = self.rendered.get(self.path) or self.build_response(url.path.strip("/").split("/"), parse_qs(url.query))
+        if response is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, headers = response
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def build_response(self, path, query):
+        """Returns (body, headers) for a stand-in shop URL, or None for a 404."""
+        base_url = f"http://{self.headers['Host']}"
+        page = int(query.get("page", ["1"])[0])
+        if path == ["products.json"]:
+            body = fixture_data.shopify_products_page(self.catalog_size, page, int(query.get("limit", ["30"])[0]), self.description_kb)
+            return body, {"Content-Type": "application/json"}
+        if path == ["wp-json", "wc", "store", "v1", "products"] and self.store_api:
+            body, total_pages = fixture_data.woo_store_api_page(base_url, query.get("category", ["all"])[0], self.catalog_size,
+                                                                page, int(query.get("per_page", ["10"])[0]))
+            return body, {"Content-Type": "application/json; charset=UTF-8", "X-WP-TotalPages": str(total_pages)}
+        if len(path) >= 2 and path[0] == "product-category":
+            page = int(path[3]) if len(path) > 3 and path[2] == "page" else 1
+            return fixture_data.woo_category_page(base_url, path[1], self.catalog_size, page), {"Content-Type": "text/html; charset=UTF-8"}
+        if len(path) == 2 and path[0] == "product":
+            return fixture_data.woo_product_page(base_url, path[1]), {"Content-Type": "text/html; charset=UTF-8"}
+        return None
+
+
+class ShopServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_shop_server(catalog_size, latency_s, description_kb=None, store_api=True, shopify_page_limit=None):
+    """Starts a stand-in shop server on a free port and returns (server, base URL).
+
+    With `shopify_page_limit`, every /products.json page is built up front. This server's threads share one
+    GIL, so building ~1 MB pages on request would serialize concurrent crawls here instead of in the scraper.
+    """
+    handler = type("Handler", (ShopHandler,), {"catalog_size": catalog_size, "latency_s": latency_s,
+                                                "description_kb": description_kb, "store_api": store_api, "rendered": {}})
+    if shopify_page_limit:
+        for page in range(1, catalog_size // shopify_page_limit + 2):
+            body = fixture_data.shopify_products_page(catalog_size, page, shopify_page_limit, description_kb)
+            handler.rendered[f"/products.json?page={page}&limit={shopify_page_limit}"] = (body, {"Content-Type": "application/json"})
+    server = ShopServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --- DB Round-Trip Counting ---
+class StandInCursor:
+    """Accepts every statement and returns no rows, like an empty database."""
+    rowcount = 0
+    lastrowid = None
+
+    def execute(self, sql, params=None):
+        self.rowcount = 0
+
+    def executemany(self, sql, seq_params):
+        self.rowcount = len(list(seq_params))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    def cursor(self, *args, **kwargs):
+        return StandInCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class CountingCursor:
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, sql, params=None):
+        self._stats.round_trip()
+        return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        self._stats.round_trip()
+        return self._cursor.executemany(sql, seq_params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    """Wraps a real or stand-in connection and counts the calls that reach the server."""
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def commit(self):
+        self._stats.round_trip()
+        return self._conn.commit()
+
+    def rollback(self):
+        self._stats.round_trip()
+        return self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class DBStats:
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+
+# --- Child Mode: One Scraper Run ---
+def run_scraper(args, scraper_argv):
+    scraper_dir, module_name, logic_name = SCRAPERS[args.scraper]
+    sys.path.insert(0, scraper_dir)
+    sys.argv = [module_name] # The scraper parses its own flags at import time
+    module = __import__(module_name)
+
+    stats = DBStats(args.db_latency_ms / 1000)
+    module.import_mysql() # The stand-in bypasses db_connect, which would import it; the scraper's error handling needs it
+    connect = module.db_connect
+    if args.db_host:
+        module.db_connect = lambda db_config: CountingConnection(connect(db_config), stats)
+    else:
+        module.db_connect = lambda db_config: CountingConnection(StandInConnection(), stats)
+
+    scraper_args = module.parser.parse_args(
+        ["--http_cache_path", "", "--resume", "never", "--per_host_delay", "0", "--max_host_rate", "1000",
+         "--change_feed_path", os.path.join(os.path.dirname(args.targets_file), f"{args.scraper}_changes.ndjson")]
+        + (["--db_host", args.db_host, "--db_user", args.db_user, "--db_password", args.db_password,
+            "--db_name", args.db_name] if args.db_host else [])
+        + (["--stores_file_path", args.targets_file] if args.scraper == "shopify" else ["--categories_file_path", args.targets_file])
+        + scraper_argv)
+
+    baseline_rss = rss_mb()
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        result = getattr(module, logic_name)(scraper_args)
+    wall_time = time.perf_counter() - started_at
+    return {"scraper": args.scraper, "status": result.get("status"), "wall_s": round(wall_time, 2),
+            "rows_written": sum(result.get(key, 0) for key in ("inserted", "updated")),
+            "db_round_trips": stats.round_trips, "baseline_rss_mb": round(baseline_rss, 1), "peak_rss_mb": round(rss_mb(), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scraper", choices=["shopify", "woo", "both"], default="both")
+    parser.add_argument("--catalog_size", type=int, default=1000, help="Products per Shopify store / Woo category")
+    parser.add_argument("--stores", type=int, default=2, help="Shopify stores (one stand-in server each)")
+    parser.add_argument("--categories", type=int, default=2, help="Woo categories (one stand-in server for all)")
+    parser.add_argument("--no_store_api", action="store_true", help="Answer 404 on the Woo Store API, like a store that disabled it")
+    parser.add_argument("--description_kb", type=int, default=None, help="Pad Shopify body_html to roughly this size")
+    parser.add_argument("--latency_ms", type=float, default=20, help="Simulated latency of every HTTP response")
+    parser.add_argument("--db_latency_ms", type=float, default=0, help="Simulated latency of every DB round-trip")
+    parser.add_argument("--db_host", type=str, default="", help="Write to this MySQL instead of the stand-in connection")
+    parser.add_argument("--db_user", type=str, default="root")
+    parser.add_argument("--db_password", type=str, default="")
+    parser.add_argument("--db_name", type=str, default="scraper_bench")
+    parser.add_argument("--baseline", action="store_true", help="Also run Shopify with --max_workers 1 and report the measured speedup")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's own output")
+    parser.add_argument("--targets_file", type=str, help=argparse.SUPPRESS) # Child mode
+    argv = sys.argv[1:]
+    scraper_argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    if args.targets_file:
+        print(json.dumps(run_scraper(args, scraper_argv)))
+        return
+
+    latency_s = args.latency_ms / 1000
+    scrapers = ["shopify", "woo"] if args.scraper == "both" else [args.scraper]
+    runs = [(scraper, scraper, []) for scraper in scrapers] # (scraper, label, extra scraper flags)
+    if args.baseline and "shopify" in scrapers:
+        runs.insert(scrapers.index("shopify") + 1, ("shopify", "shopify/1", ["--max_workers", "1"]))
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scraper, label, extra_argv in runs:
+            if scraper == "shopify":
+                servers = [start_shop_server(args.catalog_size, latency_s, args.description_kb, shopify_page_limit=SHOPIFY_PAGE_LIMIT)
+                           for _ in range(args.stores)]
+                targets = [base_url for _, base_url in servers]
+                products = args.catalog_size * args.stores
+            else:
+                servers = [start_shop_server(args.catalog_size, latency_s, store_api=not args.no_store_api)]
+                targets = [{"name": f"Bench {index}", "url": f"{servers[0][1]}/product-category/bench-{index}/"}
+                           for index in range(args.categories)]
+                products = args.catalog_size * args.categories
+            targets_file = os.path.join(work_dir, f"{scraper}_targets.json")
+            with open(targets_file, "w") as f:
+                json.dump(targets, f)
+
+            child_argv = [sys.executable, __file__, "--scraper", scraper, "--targets_file", targets_file,
+                          "--db_latency_ms", str(args.db_latency_ms)]
+            if args.db_host:
+                child_argv += ["--db_host", args.db_host, "--db_user", args.db_user, "--db_password", args.db_password,
+                               "--db_name", args.db_name]
+            if args.verbose:
+                child_argv.append("--verbose")
+            out = subprocess.run(child_argv + ["--"] + scraper_argv + extra_argv, stdout=subprocess.PIPE, text=True, check=True)
+            for server, _ in servers:
+                server.shutdown()
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            result["scraper"] = label
+            result["products"] = products
+            result["products_per_s"] = round(products / result["wall_s"], 1) if result["wall_s"] > 0 else 0.0
+            results.append(result)
+
+    print(f"Catalog: {args.catalog_size} products per store/category, {args.latency_ms:g} ms HTTP latency, "
+          f"DB: {args.db_host or 'stand-in'} (+{args.db_latency_ms:g} ms/round-trip)")
+    print(f"{'scraper':<10}{'products':>10}{'rows':>8}{'wall s':>9}{'products/s':>12}{'peak RSS MB':>13}{'DB round-trips':>16}")
+    for r in results:
+        print(f"{r['scraper']:<10}{r['products']:>10}{r['rows_written']:>8}{r['wall_s']:>9}{r['products_per_s']:>12}"
+              f"{r['peak_rss_mb']:>13}{r['db_round_trips']:>16}")
+    walls = {r["scraper"]: r["wall_s"] for r in results}
+    if "shopify/1" in walls and walls["shopify"] > 0:
+        print(f"Shopify measured speedup over --max_workers 1: x{walls['shopify/1'] / walls['shopify']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
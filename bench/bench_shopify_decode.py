@@ -0,0 +1,138 @@
+"""Measures time and peak Python memory per /products.json page for the std and streaming decoders.
+
+Peak memory is taken with tracemalloc around decoding plus row building of one page,
+i.e. everything the Shopify scraper holds for a page before handing rows to the writer.
+With --http_cache the streaming decoder is also measured over HTTP through the conditional-request
+cache: a first fetch that stores the page (miss) and a second one answered by a 304 (hit).
+
+    python bench/bench_shopify_decode.py --description_kb 20
+    python bench/bench_shopify_decode.py --description_kb 20 --http_cache
+"""
+import argparse
+import hashlib
+import http.server
+import io
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "shopify"))
+
+import fixture_data
+import Scrapping_Shop as shop
+
+
+def decode_std(body):
+    return [shop.slim_product(p) for p in json.loads(body).get("products", [])]
+
+
+def decode_stream(body):
+    return shop.iter_products_streaming(io.BytesIO(body))
+
+
+class PageServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_page_server(body):
+    """Serves `body` with an ETag on every path and answers a matching If-None-Match with a 304."""
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = PageServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/products.json"
+
+
+def measure_http(url, cache_dir):
+    """Peak memory and time of fetching + decoding one page through the HTTP cache: (miss, hit).
+
+    The pair of fetches runs twice against fresh cache files, timed on the first pass and
+    traced on the second, so tracemalloc's overhead stays out of the timings.
+    """
+    shop.json_decoder = "stream"
+    timings, peaks = [], []
+    for traced in (False, True):
+        cmd_args = shop.parser.parse_args(["--http_cache_path", os.path.join(cache_dir, f"http_cache_{traced}.sqlite"),
+                                           "--per_host_delay", "0", "--max_host_rate", "1000"])
+        cache = shop.configure_http_session(shop.http_session, cmd_args)
+        limiter = shop.limiter_from_args(cmd_args)
+        for _ in ("miss", "hit"):
+            if traced: tracemalloc.start()
+            started_at = time.perf_counter()
+            rows, _ = shop.build_page_rows(shop.fetch_products_page(url, limiter), "bench", "https://bench.example", "bench")
+            if traced:
+                peaks.append((len(rows), tracemalloc.get_traced_memory()[1]))
+                tracemalloc.stop()
+            else:
+                timings.append((time.perf_counter() - started_at) * 1000)
+        stats = cache.snapshot()
+        if stats['stores'] != 1 or stats['hits'] != 1:
+            sys.exit(f"Unexpected cache activity: {stats}")
+    return [(rows, peak, ms) for (rows, peak), ms in zip(peaks, timings)]
+
+
+def measure(decode, body, repeats):
+    rows, _ = shop.build_page_rows(decode(body), "bench", "https://bench.example", "bench")
+    tracemalloc.start()
+    shop.build_page_rows(decode(body), "bench", "https://bench.example", "bench")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        shop.build_page_rows(decode(body), "bench", "https://bench.example", "bench")
+    ms_per_page = (time.perf_counter() - started_at) / repeats * 1000
+    return len(rows), peak, ms_per_page
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=250, help="Products per page")
+    parser.add_argument("--description_kb", type=int, default=20, help="Approximate body_html size per product")
+    parser.add_argument("--repeats", type=int, default=20, help="Pages decoded for the timing figure")
+    parser.add_argument("--http_cache", action="store_true", help="Also fetch the page over HTTP through the HTTP cache")
+    args = parser.parse_args()
+
+    if shop.ijson is None:
+        sys.exit("ijson is not installed; pip install ijson to benchmark the streaming decoder.")
+
+    body = fixture_data.shopify_products_page(args.products, 1, limit=args.products, description_kb=args.description_kb)
+    print(f"Page: {args.products} products, {len(body) / 1024 / 1024:.2f} MB of JSON (ijson backend: {shop.ijson.backend})")
+    print(f"{'decoder':<10}{'rows':>7}{'peak MB/page':>15}{'ms/page':>10}")
+    for name, decode in (("std", decode_std), ("stream", decode_stream)):
+        rows, peak, ms_per_page = measure(decode, body, args.repeats)
+        print(f"{name:<10}{rows:>7}{peak / 1024 / 1024:>15.2f}{ms_per_page:>10.1f}")
+    if args.http_cache:
+        server, url = start_page_server(body)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            miss, hit = measure_http(url, tmp_dir)
+        server.shutdown()
+        for name, (rows, peak, ms) in (("cache miss", miss), ("cache hit", hit)):
+            print(f"{name:<10}{rows:>7}{peak / 1024 / 1024:>15.2f}{ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compares the lxml and requests_html extraction engines of the Woo scraper on saved fixture HTML.
+
+Each engine runs in its own subprocess so peak RSS is not shared between them.
+
+    python bench/bench_woo_parse.py --pages 500
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WOO_DIR = os.path.join(BENCH_DIR, "..", "woo")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures", "woo")
+
+
+def rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_engine(engine, pages):
+    sys.path.insert(0, WOO_DIR)
+    import Scrapping_Woo as woo
+
+    with open(os.path.join(FIXTURES_DIR, "category_page.html"), "rb") as f:
+        category_html = f.read()
+    with open(os.path.join(FIXTURES_DIR, "product_page.html"), "rb") as f:
+        product_html = f.read()
+
+    if engine == "lxml":
+        parse_listing, parse_product = woo.extract_listing_lxml, woo.extract_product_lxml
+    else:
+        from requests_html import HTML
+        parse_listing = lambda content: woo.extract_listing_requests_html(HTML(html=content))
+        parse_product = lambda content: woo.extract_product_requests_html(HTML(html=content))
+
+    baseline_rss = rss_mb()
+    timings = {}
+    for name, parse, content in (("category", parse_listing, category_html), ("product", parse_product, product_html)):
+        parse(content) # Warm-up; compiled selectors and lazy imports are not part of the per-page cost
+        started_at = time.perf_counter()
+        for _ in range(pages):
+            parse(content)
+        timings[name] = (time.perf_counter() - started_at) / pages * 1000
+    return {"engine": engine, "category_ms_per_page": round(timings["category"], 3),
+            "product_ms_per_page": round(timings["product"], 3),
+            "baseline_rss_mb": round(baseline_rss, 1), "peak_rss_mb": round(rss_mb(), 1),
+            "parse_rss_delta_mb": round(rss_mb() - baseline_rss, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300, help="Pages parsed per fixture and engine")
+    parser.add_argument("--engine", choices=["lxml", "requests_html"], help=argparse.SUPPRESS) # Child mode
+    args = parser.parse_args()
+
+    if args.engine:
+        print(json.dumps(run_engine(args.engine, args.pages)))
+        return
+
+    results = []
+    for engine in ("requests_html", "lxml"):
+        out = subprocess.run([sys.executable, __file__, "--engine", engine, "--pages", str(args.pages)],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'engine':<15}{'category ms/page':>18}{'product ms/page':>18}{'peak RSS MB':>14}{'parse RSS +MB':>15}")
+    for r in results:
+        print(f"{r['engine']:<15}{r['category_ms_per_page']:>18}{r['product_ms_per_page']:>18}"
+              f"{r['peak_rss_mb']:>14}{r['parse_rss_delta_mb']:>15}")
+    slow, fast = results
+    print(f"lxml speedup: category x{slow['category_ms_per_page'] / fast['category_ms_per_page']:.1f}, "
+          f"product x{slow['product_ms_per_page'] / fast['product_ms_per_page']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Builds benchmark payloads of any size from the recorded samples in bench/fixtures/."""
+import copy
+import json
+import os
+import re
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_shopify_sample = None
+_woo_templates = {}
+
+# Host and category path of the recorded Barefoot pages, rewritten to the stand-in server
+WOO_SAMPLE_HOST = "https://barefootbuttons.com"
+WOO_SAMPLE_CATEGORY_PATH = "product-category/version-1"
+
+
+def shopify_sample_products():
+    global _shopify_sample
+    if _shopify_sample is None:
+        with open(os.path.join(FIXTURES_DIR, "shopify", "products_sample.json")) as f:
+            _shopify_sample = json.load(f)["products"]
+    return _shopify_sample
+
+
+def shopify_products(start, count, description_kb=None):
+    """Products `start`..`start+count-1` of a synthetic catalog, cycling through the recorded samples.
+
+    `description_kb` pads body_html to roughly that size, to model stores with long descriptions.
+    """
+    sample = shopify_sample_products()
+    products = []
+    for index in range(start, start + count):
+        product = copy.deepcopy(sample[index % len(sample)])
+        product["id"] = 8000000000000 + index
+        product["handle"] = f"{product['handle']}-{index}"
+        product["title"] = f"{product['title']} #{index}"
+        for position, variant in enumerate(product["variants"]):
+            variant["id"] = product["id"] * 100 + position
+            variant["product_id"] = product["id"]
+        if description_kb:
+            paragraph = product["body_html"]
+            product["body_html"] = paragraph * max(1, (description_kb * 1024) // len(paragraph))
+        products.append(product)
+    return products
+
+
+def shopify_products_page(catalog_size, page, limit=250, description_kb=None):
+    """Bytes of /products.json?page=`page`&limit=`limit` for a catalog of `catalog_size` products."""
+    start = (page - 1) * limit
+    count = max(0, min(limit, catalog_size - start))
+    return json.dumps({"products": shopify_products(start, count, description_kb)}).encode("utf-8")
+
+
+def woo_template(name):
+    if name not in _woo_templates:
+        with open(os.path.join(FIXTURES_DIR, "woo", name), encoding="utf-8") as f:
+            _woo_templates[name] = f.read()
+    return _woo_templates[name]
+
+
+def _woo_listing_parts():
+    html = woo_template("category_page.html")
+    first_item = html.index('<div class="product-small col')
+    items_end = html.index('</div>\n<div class="container"><nav class="woocommerce-pagination">')
+    items = ['<div class="product-small col' + item for item in html[first_item:items_end].split('<div class="product-small col')[1:]]
+    return html[:first_item], items, html[items_end:]
+
+
+def woo_category_page(base_url, category, catalog_size, page):
+    """HTML of page `page` of category `category` holding `catalog_size` products, served from `base_url`.
+
+    Items cycle through the recorded listing and link to /product/<category>-item-<n>/; the last page has no next link.
+    """
+    head, items, tail = _woo_listing_parts()
+    start = (page - 1) * len(items)
+    count = max(0, min(len(items), catalog_size - start))
+    listing = [re.sub(r"V1 Button \d+", f"{category} item {index}",
+                      re.sub(r"v1-button-\d+", f"{category}-item-{index}", items[index % len(items)]))
+               for index in range(start, start + count)]
+    if start + count < catalog_size:
+        tail = tail.replace("/page/2/", f"/page/{page + 1}/")
+    else:
+        tail = re.sub(r"<li><a class=\"(next )?page-numbers?\"[^\n]*\n", "", tail)
+    html = head + "".join(listing) + tail
+    return html.replace(WOO_SAMPLE_CATEGORY_PATH, f"product-category/{category}").replace(WOO_SAMPLE_HOST, base_url).encode("utf-8")
+
+
+def woo_product_page(base_url, slug):
+    """HTML of /product/`slug`/ served from `base_url`, built from the recorded product page."""
+    html = woo_template("product_page.html")
+    html = html.replace("v1-button-7/", f"{slug}/").replace("V1 Button 7", slug.replace("-", " ").title())
+    html = html.replace("BB-V1-007", slug.upper())
+    return html.replace(WOO_SAMPLE_HOST, base_url).encode("utf-8")
+
+
+def woo_store_api_page(base_url, category, catalog_size, page, per_page=100):
+    """(JSON body, total pages) of /wp-json/wc/store/v1/products for the category woo_category_page serves.
+
+    Products carry the same URL, title, price, tag and SKU that their woo_product_page shows.
+    """
+    start = (page - 1) * per_page
+    products = []
+    for index in range(start, min(catalog_size, start + per_page)):
+        slug = f"{category}-item-{index}"
+        products.append({
+            "id": 10000 + index, "name": slug.replace("-", " ").title(), "slug": slug,
+            "permalink": f"{base_url}/product/{slug}/", "sku": slug.upper(), "is_in_stock": True,
+            "prices": {"price": "2700", "regular_price": "3200", "sale_price": "2700", "currency_code": "USD",
+                       "currency_symbol": "$", "currency_minor_unit": 2, "currency_decimal_separator": ".",
+                       "currency_thousand_separator": ",", "currency_prefix": "$", "currency_suffix": ""},
+            "tags": [{"id": 12, "name": "Stainless", "slug": "stainless"}],
+        })
+    return json.dumps(products).encode("utf-8"), max(1, -(-catalog_size // per_page))
@@ -0,0 +1,6 @@
+"""Building blocks shared by the Shopify and WooCommerce scrapers: DB writers, delta tracking, change feed,
+revisit scheduling, checkpoints, HTTP cache, rate limiting, sharding and the job/worker machinery of the API.
+
+The scrapers put the repository root on sys.path and import the modules directly, e.g.
+`from common.writers import BulkUpserter`.
+"""
@@ -0,0 +1,139 @@
+"""Change feed: price/availability events appended to the price_history table and/or an NDJSON file."""
+import hashlib
+import json
+import threading
+import time
+from decimal import Decimal
+
+from common import db
+
+
+def _feed_value(value):
+    """Normalizes a price/availability so stored DECIMALs and scraped floats compare equal."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return f"{float(value):.2f}"
+    return str(value)
+
+
+class ChangeFeed:
+    """Publishes price/availability changes as append-only events, so consumers read O(changes), not the catalog.
+
+    load() reads the stored price and availability of every product once, before the run touches the
+    table. observe() then queues a 'new' or 'changed' event when a scraped row differs, and retire()
+    queues 'removed' events for products of fully crawled scopes that were not seen. flush(), called by
+    the bulk writer right after it committed, appends the queued events to the price_history table
+    and/or the NDJSON file at `feed_path`, so an event is never published before its row is written.
+    """
+    def __init__(self, db_conn, scraper, run_id, history=True, feed_path="", track=False):
+        self.db_conn = db_conn
+        self.scraper = scraper
+        self.run_id = run_id
+        self.history = history
+        self.feed_path = feed_path
+        self.enabled = history or bool(feed_path) or track # `track`: count changes even if none are published
+        self.known = {} # key -> (price, availability, scope)
+        self.counts = {'new': 0, 'changed': 0, 'removed': 0}
+        self.scope_counts = {} # scope -> counts like the above
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def load(self, table, key_column, price_column, availability_column, scope_column):
+        if not self.enabled:
+            return 0
+        cursor = self.db_conn.cursor()
+        try:
+            if self.history:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS price_history (
+                        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                        scraper VARCHAR(32) NOT NULL,
+                        run_id VARCHAR(64),
+                        scope VARCHAR(255),
+                        product_key VARCHAR(1024) NOT NULL,
+                        key_hash CHAR(40) NOT NULL,
+                        change_type VARCHAR(16) NOT NULL,
+                        price VARCHAR(50),
+                        availability VARCHAR(50),
+                        old_price VARCHAR(50),
+                        old_availability VARCHAR(50),
+                        observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_price_history_product (scraper, key_hash, observed_at),
+                        INDEX idx_price_history_observed (observed_at)
+                    );
+                """)
+            cursor.execute(f"SELECT {key_column}, {price_column}, {availability_column or 'NULL'}, {scope_column} FROM {table}")
+            self.known = {key: (_feed_value(price), _feed_value(availability), scope)
+                          for key, price, availability, scope in cursor.fetchall()}
+            self.db_conn.commit()
+        finally:
+            cursor.close()
+        return len(self.known)
+
+    def _queue(self, key, scope, change_type, price, availability, previous):
+        self.counts[change_type] += 1
+        scope_counts = self.scope_counts.setdefault(scope, {'new': 0, 'changed': 0, 'removed': 0})
+        scope_counts[change_type] += 1
+        self._pending.append({"scraper": self.scraper, "run_id": self.run_id, "scope": scope, "product_key": key,
+                              "change": change_type, "price": price, "availability": availability,
+                              "old_price": previous[0] if previous else None, "old_availability": previous[1] if previous else None,
+                              "observed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+
+    def observe(self, key, scope, price, availability=None):
+        """Queues an event if the product is new or its price/availability moved. Call once its row is queued for writing."""
+        if not self.enabled:
+            return
+        price, availability = _feed_value(price), _feed_value(availability)
+        with self._lock:
+            previous = self.known.get(key)
+            if previous is not None and previous[:2] == (price, availability):
+                return
+            self.known[key] = (price, availability, scope)
+            self._queue(key, scope, 'new' if previous is None else 'changed', price, availability, previous)
+
+    def retire(self, seen, completed_scopes):
+        """Queues 'removed' events for stored products of `completed_scopes` missing from `seen`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stale = [(key, state) for key, state in self.known.items() if state[2] in completed_scopes and key not in seen]
+            for key, state in stale:
+                del self.known[key]
+                self._queue(key, state[2], 'removed', None, None, state)
+
+    def flush(self):
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return
+        if self.history:
+            cursor = self.db_conn.cursor()
+            try:
+                cursor.executemany("""
+                    INSERT INTO price_history (scraper, run_id, scope, product_key, key_hash, change_type,
+                                               price, availability, old_price, old_availability)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [(e["scraper"], e["run_id"], e["scope"], str(e["product_key"]),
+                       hashlib.sha1(str(e["product_key"]).encode('utf-8')).hexdigest(), e["change"],
+                       e["price"], e["availability"], e["old_price"], e["old_availability"]) for e in events])
+                self.db_conn.commit()
+            except db.mysql.connector.Error as err:
+                # Keep the events for the next flush; the file only gets them once the table has them too.
+                print(f"Error writing {len(events)} price_history events for '{self.scraper}': {err}")
+                self.db_conn.rollback()
+                with self._lock:
+                    self._pending[:0] = events
+                return
+            finally:
+                cursor.close()
+        if self.feed_path:
+            with open(self.feed_path, 'a', encoding='utf-8') as feed_file:
+                feed_file.write("".join(json.dumps(event, default=str) + "\n" for event in events))
+
+    def close(self):
+        self.flush()
+        if self.enabled:
+            print(f"Change feed for '{self.scraper}': {self.counts}"
+                  + (f" (appended to {self.feed_path})" if self.feed_path else ""))
+        return self.counts
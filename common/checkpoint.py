@@ -0,0 +1,145 @@
+"""Crawl checkpoints in MySQL, so a run that dies midway resumes where it stopped."""
+import hashlib
+import threading
+
+from common import db
+
+
+class CrawlCheckpoint:
+    """Records crawl progress in MySQL so a run that dies midway resumes where it stopped.
+
+    A run is unfinished while its crawl_runs row has no finished_at; the next run picks up its
+    page cursors, completed scopes and processed product URLs instead of starting over.
+    Marks are only persisted from on_flush(), which the BulkUpserter calls after committing its
+    buffered rows, so a checkpoint never gets ahead of the data it covers.
+    A disabled checkpoint (used by scoped runs) neither resumes nor touches the stored progress.
+    """
+    def __init__(self, db_conn, scraper, enabled=True):
+        self.db_conn = db_conn
+        self.scraper = scraper
+        self.enabled = enabled
+        self.resumed = False
+        self.page_cursors = {} # scope -> next page to fetch
+        self.completed_scopes = set()
+        self.done_urls = {} # scope -> product URLs already processed
+        self._pending_cursors = {}
+        self._pending_completed = set()
+        self._pending_urls = []
+        self._lock = threading.Lock()
+
+    def _create_tables(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                scraper VARCHAR(32) PRIMARY KEY,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP NULL DEFAULT NULL
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+                scraper VARCHAR(32) NOT NULL,
+                scope VARCHAR(255) NOT NULL,
+                next_page INT NOT NULL DEFAULT 1,
+                completed BOOLEAN NOT NULL DEFAULT FALSE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                PRIMARY KEY (scraper, scope)
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_checkpoint_urls (
+                scraper VARCHAR(32) NOT NULL,
+                url_hash CHAR(40) NOT NULL,
+                scope VARCHAR(255) NOT NULL,
+                product_url VARCHAR(1024) NOT NULL,
+                PRIMARY KEY (scraper, url_hash)
+            );
+        """)
+
+    def begin(self, resume=True):
+        """Resumes the unfinished previous run if there is one (and `resume`), otherwise starts a fresh one."""
+        if not self.enabled:
+            return False
+        cursor = self.db_conn.cursor()
+        try:
+            self._create_tables(cursor)
+            cursor.execute("SELECT finished_at FROM crawl_runs WHERE scraper = %s", (self.scraper,))
+            run_row = cursor.fetchone()
+            if resume and run_row is not None and run_row[0] is None:
+                self.resumed = True
+                cursor.execute("SELECT scope, next_page, completed FROM crawl_checkpoints WHERE scraper = %s", (self.scraper,))
+                for scope, next_page, completed in cursor.fetchall():
+                    self.page_cursors[scope] = next_page
+                    if completed: self.completed_scopes.add(scope)
+                cursor.execute("SELECT scope, product_url FROM crawl_checkpoint_urls WHERE scraper = %s", (self.scraper,))
+                for scope, product_url in cursor.fetchall():
+                    self.done_urls.setdefault(scope, set()).add(product_url)
+            else:
+                self._clear(cursor)
+                cursor.execute("REPLACE INTO crawl_runs (scraper, started_at, finished_at) VALUES (%s, CURRENT_TIMESTAMP, NULL)",
+                               (self.scraper,))
+            self.db_conn.commit()
+        finally:
+            cursor.close()
+        return self.resumed
+
+    def _clear(self, cursor):
+        cursor.execute("DELETE FROM crawl_checkpoints WHERE scraper = %s", (self.scraper,))
+        cursor.execute("DELETE FROM crawl_checkpoint_urls WHERE scraper = %s", (self.scraper,))
+
+    def advance(self, scope, next_page):
+        with self._lock:
+            self._pending_cursors[scope] = next_page
+
+    def complete(self, scope):
+        with self._lock:
+            self._pending_completed.add(scope)
+
+    def url_done(self, scope, product_url):
+        with self._lock:
+            self._pending_urls.append((scope, product_url))
+
+    def on_flush(self):
+        """Persists the marks recorded so far. Called by the bulk writer right after it committed."""
+        with self._lock:
+            cursors, completed, urls = self._pending_cursors, self._pending_completed, self._pending_urls
+            self._pending_cursors, self._pending_completed, self._pending_urls = {}, set(), []
+        if not self.enabled or not (cursors or completed or urls):
+            return
+        cursor = self.db_conn.cursor()
+        try:
+            scopes = set(cursors) | completed
+            if scopes:
+                cursor.executemany("""
+                    INSERT INTO crawl_checkpoints (scraper, scope, next_page, completed) VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE next_page = GREATEST(next_page, VALUES(next_page)), completed = completed OR VALUES(completed)
+                """, [(self.scraper, scope, cursors.get(scope, 1), scope in completed) for scope in scopes])
+            if urls:
+                cursor.executemany("INSERT IGNORE INTO crawl_checkpoint_urls (scraper, url_hash, scope, product_url) VALUES (%s, %s, %s, %s)",
+                                   [(self.scraper, hashlib.sha1(url.encode('utf-8')).hexdigest(), scope, url) for scope, url in urls])
+            self.db_conn.commit()
+        except db.mysql.connector.Error as err:
+            # Keep the marks for the next flush; a lost checkpoint only means re-fetching some pages.
+            print(f"Error saving crawl checkpoint for '{self.scraper}': {err}")
+            self.db_conn.rollback()
+            with self._lock:
+                for scope, next_page in cursors.items():
+                    self._pending_cursors[scope] = max(next_page, self._pending_cursors.get(scope, 1))
+                self._pending_completed |= completed
+                self._pending_urls[:0] = urls
+        finally:
+            cursor.close()
+
+    def finish(self):
+        """Marks the run finished and drops its checkpoints, so the next run starts from scratch."""
+        if not self.enabled:
+            return
+        cursor = self.db_conn.cursor()
+        try:
+            self._clear(cursor)
+            cursor.execute("UPDATE crawl_runs SET finished_at = CURRENT_TIMESTAMP WHERE scraper = %s", (self.scraper,))
+            self.db_conn.commit()
+        except db.mysql.connector.Error as err:
+            print(f"Error closing crawl checkpoint for '{self.scraper}': {err}")
+            self.db_conn.rollback()
+        finally:
+            cursor.close()
@@ -0,0 +1,18 @@
+"""Deferred MySQL import shared by the scrapers and the common classes."""
+mysql = None # Bound by import_mysql(); the common classes read it as db.mysql, since it is only bound on first use
+
+
+def import_mysql():
+    """Imports mysql.connector (and its pooling module) on first use."""
+    global mysql
+    if mysql is None:
+        import mysql.connector
+        import mysql.connector.pooling
+    return mysql
+
+
+def db_config_from_args(cmd_args):
+    return {
+        'host': cmd_args.db_host, 'user': cmd_args.db_user,
+        'password': cmd_args.db_password, 'database': cmd_args.db_name
+    }
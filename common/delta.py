@@ -0,0 +1,97 @@
+"""Incremental (delta) mode: row fingerprints, classification against the stored rows and retirement of unseen ones."""
+import hashlib
+import threading
+
+from common import db
+from common.writers import DEFAULT_DB_BATCH_SIZE
+
+
+def row_fingerprint(row):
+    """Stable hash of every value a row writes; equal fingerprints mean the stored row is already current."""
+    return hashlib.sha1("\x1f".join(str(value) for value in row).encode('utf-8')).hexdigest()
+
+
+def load_existing_fingerprints(db_conn, table, scope_column, key_column='product_url'):
+    """Returns {key: (content_hash, scope)} for every stored row, in one query."""
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute(f"SELECT {key_column}, content_hash, {scope_column} FROM {table}")
+        return {key: (content_hash, scope) for key, content_hash, scope in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+class DeltaTracker:
+    """Classifies scraped rows against the stored fingerprints and retires rows not seen this run."""
+    def __init__(self, known):
+        self.known = known
+        self.seen = set()
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'retired': 0}
+        self._run_scopes = {}
+        self._lock = threading.Lock()
+
+    def classify(self, product_url, content_hash, scope):
+        with self._lock:
+            self.seen.add(product_url)
+            previous = self.known.get(product_url)
+            if previous is None:
+                kind = 'inserted'
+            elif previous[0] != content_hash:
+                kind = 'updated'
+            else:
+                kind = 'unchanged'
+            self.known[product_url] = (content_hash, scope)
+            self.counts[kind] += 1
+            return kind
+
+    def first_scope(self, key, scope):
+        """Scope `key` was first listed under in this run; records `scope` if this is the first time.
+
+        Only the current run counts: a row stored under another scope by an earlier run moves to
+        the scope it is listed under now.
+        """
+        with self._lock:
+            return self._run_scopes.setdefault(key, scope)
+
+    def seen_by_scope(self):
+        """Number of products this run saw per scope."""
+        counts = {}
+        with self._lock:
+            for key in self.seen:
+                state = self.known.get(key)
+                if state is not None:
+                    counts[state[1]] = counts.get(state[1], 0) + 1
+        return counts
+
+    def mark_seen(self, product_url):
+        """Protects a stored row from retirement when its page could not be fetched this run."""
+        with self._lock:
+            self.seen.add(product_url)
+
+    def retire_unseen(self, db_conn, table, completed_scopes, key_column='product_url', batch_size=DEFAULT_DB_BATCH_SIZE):
+        """Deletes stored rows of fully crawled scopes that this run did not see.
+
+        Keys are deleted `batch_size` at a time, one committed `DELETE ... IN (...)` per batch,
+        so a large catalog never builds a statement beyond max_allowed_packet.
+        """
+        with self._lock:
+            stale_keys = [key for key, (_, scope) in self.known.items()
+                          if scope in completed_scopes and key not in self.seen]
+        if not stale_keys:
+            return 0
+        batch_size = max(1, batch_size)
+        cursor = db_conn.cursor()
+        try:
+            for start in range(0, len(stale_keys), batch_size):
+                batch = stale_keys[start:start + batch_size]
+                placeholders = ", ".join(["%s"] * len(batch))
+                cursor.execute(f"DELETE FROM {table} WHERE {key_column} IN ({placeholders})", batch)
+                db_conn.commit()
+                self.counts['retired'] += cursor.rowcount
+        except db.mysql.connector.Error as err:
+            # Rows left behind are still unseen next run, so they are retired then
+            print(f"Error retiring {len(stale_keys)} unseen rows from '{table}': {err}")
+            db_conn.rollback()
+        finally:
+            cursor.close()
+        return self.counts['retired']
@@ -0,0 +1,155 @@
+"""Polite HTTP fetching: an adaptive per-host rate limiter and GETs that back off on 429/5xx."""
+import email.utils
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+from common.metrics import run_metrics
+
+DEFAULT_PER_HOST_CONCURRENCY = 4
+DEFAULT_INITIAL_HOST_RATE = 1.0 # Requests/s a host starts at; adapts from there. Each scraper passes its own from --per_host_delay
+DEFAULT_MIN_HOST_RATE = 0.1
+DEFAULT_MAX_HOST_RATE = 4.0
+DEFAULT_FAST_RESPONSE_S = 1.0 # Successful responses faster than this let the host's rate grow
+
+
+class HostRateLimiter:
+    """Per-host token bucket plus in-flight cap that adapts to how each host responds.
+
+    Every host starts at `initial_rate` requests/s. Quick successful responses raise the rate
+    step by step up to `max_rate`. A 429/5xx halves it (floor `min_rate`) and closes the host
+    until its Retry-After time, or an exponential backoff with full jitter when no header is sent.
+    """
+    def __init__(self, initial_rate=DEFAULT_INITIAL_HOST_RATE, min_rate=DEFAULT_MIN_HOST_RATE,
+                 max_rate=DEFAULT_MAX_HOST_RATE, max_concurrency=DEFAULT_PER_HOST_CONCURRENCY,
+                 fast_response_s=DEFAULT_FAST_RESPONSE_S, rate_step=0.1, max_backoff_s=120.0):
+        self.min_rate = max(0.01, min_rate)
+        self.max_rate = max(self.min_rate, max_rate)
+        self.initial_rate = min(self.max_rate, max(self.min_rate, initial_rate))
+        self.max_concurrency = max(1, max_concurrency)
+        self.fast_response_s = fast_response_s
+        self.rate_step = rate_step
+        self.max_backoff_s = max_backoff_s
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host_state(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = {'lock': threading.Lock(), 'sem': threading.Semaphore(self.max_concurrency),
+                         'rate': self.initial_rate, 'tokens': 1.0, 'updated_at': time.monotonic(),
+                         'blocked_until': 0.0, 'failures': 0, 'requests': 0, 'throttled': 0}
+                self._hosts[host] = state
+            return state
+
+    def _acquire_token(self, state):
+        while True:
+            with state['lock']:
+                now = time.monotonic()
+                state['tokens'] = min(1.0, state['tokens'] + (now - state['updated_at']) * state['rate'])
+                state['updated_at'] = now
+                if now < state['blocked_until']:
+                    wait = state['blocked_until'] - now
+                elif state['tokens'] >= 1.0:
+                    state['tokens'] -= 1.0
+                    state['requests'] += 1
+                    return
+                else:
+                    wait = (1.0 - state['tokens']) / state['rate']
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, url):
+        state = self._host_state(url)
+        with state['sem']:
+            self._acquire_token(state)
+            yield
+
+    def record_success(self, url, elapsed_s):
+        state = self._host_state(url)
+        with state['lock']:
+            state['failures'] = 0
+            if elapsed_s <= self.fast_response_s:
+                state['rate'] = min(self.max_rate, state['rate'] + self.rate_step)
+
+    def record_pushback(self, url, retry_after_s=None):
+        """Slows the host down after a 429/5xx/connection error. Returns the seconds it stays closed."""
+        state = self._host_state(url)
+        with state['lock']:
+            state['failures'] += 1
+            state['throttled'] += 1
+            state['rate'] = max(self.min_rate, state['rate'] / 2)
+            if retry_after_s is None:
+                retry_after_s = random.uniform(0, min(self.max_backoff_s, 2 ** state['failures']))
+            retry_after_s = min(retry_after_s, self.max_backoff_s * 5)
+            state['blocked_until'] = max(state['blocked_until'], time.monotonic() + retry_after_s)
+            return retry_after_s
+
+    def snapshot(self):
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: {'rate': round(s['rate'], 2), 'requests': s['requests'], 'throttled': s['throttled']}
+                for host, s in hosts.items()}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request_with_backoff(session, url, limiter, retries=3, **kwargs):
+    """GETs `url` through the host's rate limiter, retrying 429/5xx and connection errors.
+
+    Returns the last response (which may still be an error status) or raises the last
+    RequestException once retries are exhausted.
+    """
+    host = urlparse(url).netloc
+    for attempt in range(1, retries + 1):
+        try:
+            wait_started_at = time.monotonic()
+            with limiter.slot(url):
+                started_at = time.monotonic()
+                run_metrics.observe('rate_limit_wait_seconds', started_at - wait_started_at, host=host)
+                response = session.get(url, **kwargs)
+            run_metrics.observe('fetch_seconds', time.monotonic() - started_at, host=host)
+            run_metrics.inc('requests_total', host=host, status=response.status_code)
+        except requests.exceptions.RequestException as req_err:
+            wait = limiter.record_pushback(url)
+            if attempt == retries:
+                raise
+            run_metrics.inc('retries_total', host=host, reason="connection_error")
+            print(f"Request error fetching {url} (attempt {attempt}/{retries}): {req_err}. Retrying in ~{wait:.1f}s.")
+            continue
+
+        if response.status_code == 429 or response.status_code >= 500:
+            wait = limiter.record_pushback(url, parse_retry_after(response.headers.get('Retry-After')))
+            if attempt == retries:
+                return response
+            run_metrics.inc('retries_total', host=host, reason=str(response.status_code))
+            print(f"{url} answered {response.status_code} (attempt {attempt}/{retries}). Host slowed down, retrying in ~{wait:.1f}s.")
+            response.close()
+            continue
+
+        limiter.record_success(url, time.monotonic() - started_at)
+        return response
+
+
+def limiter_from_args(cmd_args):
+    initial_rate = 1 / cmd_args.per_host_delay if cmd_args.per_host_delay > 0 else cmd_args.max_host_rate
+    return HostRateLimiter(initial_rate, cmd_args.min_host_rate, cmd_args.max_host_rate, cmd_args.per_host_concurrency)
@@ -0,0 +1,287 @@
+"""HTTP conditional-request cache: an on-disk store of validators and bodies, and the session adapter that uses it."""
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+
+class HTTPCache:
+    """On-disk (SQLite) store of response bodies and their ETag/Last-Modified validators.
+
+    Entries are evicted least-recently-used once the stored bodies exceed `max_bytes`.
+    The file survives between runs, so repeat crawls can revalidate instead of re-downloading.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                body BLOB,
+                size INTEGER,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS http_cache_last_access ON http_cache (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_saved': 0}
+
+    def lookup(self, url):
+        """Validators of the cached entry for `url`, or None. The body is only read by load_body() on a 304."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_type FROM http_cache WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'content_type': row[2]}
+
+    def load_body(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM http_cache WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def spool_body(self, url, spool_bytes=1024 * 1024, chunk_size=256 * 1024):
+        """Copies the cached body of `url` in chunks into a spool file rewound to its start, or returns None."""
+        with self._lock:
+            row = self._conn.execute("SELECT rowid FROM http_cache WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+            with self._conn.blobopen('http_cache', 'body', row[0], readonly=True) as blob:
+                shutil.copyfileobj(blob, spool, chunk_size)
+        spool.seek(0)
+        return spool
+
+    def record_hit(self, url, size):
+        with self._lock:
+            self._conn.execute("UPDATE http_cache SET last_access = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += size
+
+    def record_miss(self):
+        with self._lock:
+            self.stats['misses'] += 1
+
+    def store(self, url, etag, last_modified, content_type, body):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._replace_locked(url, etag, last_modified, content_type, body, size)
+            self._evict_locked()
+            self._conn.commit()
+
+    def store_file(self, url, etag, last_modified, content_type, fileobj, size, chunk_size=256 * 1024):
+        """Like store(), but copies the body from `fileobj` into the row in chunks instead of holding it in memory."""
+        if size > self.max_bytes:
+            return
+        fileobj.seek(0)
+        with self._lock:
+            rowid = self._replace_locked(url, etag, last_modified, content_type, None, size)
+            with self._conn.blobopen('http_cache', 'body', rowid) as blob:
+                shutil.copyfileobj(fileobj, blob, chunk_size)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _replace_locked(self, url, etag, last_modified, content_type, body, size):
+        previous = self._conn.execute("SELECT size FROM http_cache WHERE url = ?", (url,)).fetchone()
+        cursor = self._conn.execute(
+            "INSERT OR REPLACE INTO http_cache (url, etag, last_modified, content_type, body, size, last_access) "
+            "VALUES (?, ?, ?, ?, COALESCE(?, zeroblob(?)), ?, ?)",
+            (url, etag, last_modified, content_type, body, size, size, time.time()))
+        self._total_bytes += size - (previous[0] if previous else 0)
+        self.stats['stores'] += 1
+        return cursor.lastrowid
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT url, size FROM http_cache ORDER BY last_access LIMIT 64").fetchall()
+            if not oldest:
+                self._total_bytes = 0
+                return
+            for url, size in oldest:
+                self._conn.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+                self._total_bytes -= size
+                self.stats['evictions'] += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries_bytes=self._total_bytes)
+
+
+class _CacheTee:
+    """Wraps a streamed response's urllib3 body and copies every decoded chunk into a spool file.
+
+    The caller keeps reading the body incrementally (e.g. ijson over response.raw); once the body
+    has been read to the end, `on_complete(spool, size)` stores it. Bodies that outgrow the cache,
+    are read undecoded, or are abandoned part-way are dropped without touching the cache.
+    """
+    def __init__(self, raw, max_bytes, on_complete, spool_bytes=1024 * 1024):
+        self.__dict__['_raw'] = raw
+        self.__dict__['_max_bytes'] = max_bytes
+        self.__dict__['_on_complete'] = on_complete
+        self.__dict__['_spool'] = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self.__dict__['_size'] = 0
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        if self._spool is not None:
+            decoded = self._raw.decode_content if decode_content is None else decode_content
+            if not decoded or self._size + len(data) > self._max_bytes:
+                self._discard()
+            elif data:
+                self._spool.write(data)
+                self.__dict__['_size'] += len(data)
+            if self._spool is not None and (amt is None or (amt != 0 and not data)): # read(0) probes, it is not EOF
+                self._finish()
+        return data
+
+    def readinto(self, b): # ijson's C backend reads this way
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        while True:
+            data = self.read(amt, decode_content=decode_content)
+            if not data:
+                return
+            yield data
+
+    def _finish(self):
+        try:
+            self._on_complete(self._spool, self._size)
+        finally:
+            self._discard()
+
+    def _discard(self):
+        if self._spool is not None:
+            self._spool.close()
+            self.__dict__['_spool'] = None
+
+    def close(self):
+        self._discard()
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    """Transport adapter that turns GETs into conditional requests against an HTTPCache.
+
+    A 304 is rewritten into a 200 carrying the cached body, so callers never see the difference.
+    For streamed (stream=True) requests the body never has to fit in memory: a 200 is copied into
+    the cache while the caller consumes it, and a 304 is answered from a spool file of the entry.
+    """
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        entry = self.cache.lookup(request.url)
+        if entry:
+            if entry['etag']: request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']: request.headers['If-Modified-Since'] = entry['last_modified']
+        response = super().send(request, **kwargs)
+
+        streamed = kwargs.get('stream')
+        if response.status_code == 304 and entry:
+            body = self.cache.spool_body(request.url) if streamed else self.cache.load_body(request.url)
+            if body is None: # Evicted since lookup(); fetch it unconditionally
+                request.headers.pop('If-None-Match', None)
+                request.headers.pop('If-Modified-Since', None)
+                response = super().send(request, **kwargs)
+            else:
+                response.status_code = 200
+                response.reason = 'OK (revalidated)'
+                if streamed:
+                    response.raw.release_conn() # The 304 has no body; hand the connection back before swapping raw
+                    response.raw = body
+                    size = body.seek(0, 2)
+                    body.seek(0)
+                else:
+                    response._content = body
+                    response._content_consumed = True
+                    size = len(body)
+                if entry['content_type']: response.headers['Content-Type'] = entry['content_type']
+                response.from_cache = True
+                self.cache.record_hit(request.url, size)
+                return response
+
+        response.from_cache = False
+        self.cache.record_miss()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 200 and (etag or last_modified):
+            url, content_type = request.url, response.headers.get('Content-Type')
+            if streamed:
+                response.raw = _CacheTee(response.raw, self.cache.max_bytes, lambda spool, size:
+                                         self.cache.store_file(url, etag, last_modified, content_type, spool, size))
+            else:
+                self.cache.store(url, etag, last_modified, content_type, response.content)
+        return response
+
+
+http_cache = None # Opened once per process and shared by every run
+_mounted_adapter_key = None # Settings of the adapter currently mounted on the shared session
+
+def open_http_cache(cache_path, cache_max_mb):
+    """Returns the process-wide HTTPCache for `cache_path`, or None if disabled/unavailable."""
+    global http_cache
+    if not cache_path:
+        return None
+    if http_cache is None or http_cache.path != cache_path:
+        try:
+            http_cache = HTTPCache(cache_path, int(cache_max_mb * 1024 * 1024))
+            print(f"HTTP cache opened at '{cache_path}' (max {cache_max_mb} MB).")
+        except sqlite3.Error as err:
+            print(f"Could not open HTTP cache at '{cache_path}': {err}. Continuing without cache.")
+            http_cache = None
+            return None
+    http_cache.max_bytes = int(cache_max_mb * 1024 * 1024)
+    return http_cache
+
+
+def configure_http_session(session, cmd_args):
+    """Mounts a pooled (and, unless disabled, caching) transport adapter on `session`.
+
+    The adapter is only replaced when its settings change, so keep-alive connections and TLS
+    sessions to each host are reused across pages, worker threads and runs.
+    Returns the HTTP cache, or None if disabled.
+    """
+    global _mounted_adapter_key
+    cache = open_http_cache(cmd_args.http_cache_path, cmd_args.http_cache_max_mb)
+    adapter_key = (cache.path if cache else None, cmd_args.http_pool_hosts, cmd_args.http_pool_maxsize)
+    if adapter_key != _mounted_adapter_key:
+        pool_kwargs = {'pool_connections': cmd_args.http_pool_hosts, 'pool_maxsize': cmd_args.http_pool_maxsize}
+        adapter = CachingHTTPAdapter(cache, **pool_kwargs) if cache else HTTPAdapter(**pool_kwargs)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _mounted_adapter_key = adapter_key
+        print(f"HTTP adapter mounted: {cmd_args.http_pool_hosts} host pools x {cmd_args.http_pool_maxsize} keep-alive connections"
+              f"{', with cache' if cache else ''}.")
+    return cache
+
+
+def cache_stats_delta(before, after):
+    return {key: after[key] - before.get(key, 0) for key in ('hits', 'misses', 'stores', 'evictions', 'bytes_saved')}
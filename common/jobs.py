@@ -0,0 +1,94 @@
+"""Job registry of the API: one ScrapeJob per triggered run, with live progress and an ETA."""
+import threading
+import time
+import uuid
+
+
+class ScrapeJob:
+    """One triggered run: its status, scope, live progress counters and final result.
+
+    Progress counters are plain integers bumped with advance() from the scraper threads.
+    `unit` names the work items the ETA is based on ("stores" or "categories"); when a
+    `products_total` counter is present the ETA uses products instead.
+    """
+    def __init__(self, job_id, unit, scope=None):
+        self.id = job_id
+        self.unit = unit
+        self.scope = scope
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.progress = {f"{unit}_total": 0, f"{unit}_done": 0, "pages": 0, "products": 0}
+        self._lock = threading.Lock()
+
+    def start(self, units_total):
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+            self.progress[f"{self.unit}_total"] = units_total
+
+    def advance(self, **increments):
+        with self._lock:
+            for counter, amount in increments.items():
+                self.progress[counter] = self.progress.get(counter, 0) + amount
+
+    def finish(self, result):
+        with self._lock:
+            self.result = result
+            self.status = "succeeded" if result and result.get("status") == "success" else "failed"
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            progress = dict(self.progress)
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            snapshot = {"job_id": self.id, "status": self.status, "scope": self.scope, "created_at": self.created_at,
+                        "started_at": self.started_at, "finished_at": self.finished_at, "elapsed_s": round(elapsed, 1),
+                        "progress": progress, "result": self.result}
+        products_per_s = progress["products"] / elapsed if elapsed > 0 else 0.0
+        snapshot["products_per_s"] = round(products_per_s, 2)
+        done, total = progress[f"{self.unit}_done"], progress[f"{self.unit}_total"]
+        if self.status != "running":
+            snapshot["eta_s"] = 0.0 if self.finished_at else None
+        elif progress.get("products_total") and products_per_s:
+            snapshot["eta_s"] = round(max(0, progress["products_total"] - progress["products"]) / products_per_s, 1)
+        elif done and total:
+            snapshot["eta_s"] = round(elapsed * (total - done) / done, 1)
+        else:
+            snapshot["eta_s"] = None # Not enough progress to estimate yet
+        return snapshot
+
+
+class JobRegistry:
+    """In-process registry of scrape jobs; keeps the `max_jobs` most recent ones."""
+    def __init__(self, unit, max_jobs=50):
+        self.unit = unit
+        self.max_jobs = max_jobs
+        self._jobs = {} # job_id -> ScrapeJob, in creation order
+        self._lock = threading.Lock()
+
+    def create(self, scope=None):
+        job = ScrapeJob(uuid.uuid4().hex[:12], self.unit, scope)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest_id = next(iter(self._jobs))
+                if self._jobs[oldest_id].status in ("queued", "running"):
+                    break
+                del self._jobs[oldest_id]
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self):
+        with self._lock:
+            return next((job for job in self._jobs.values() if job.status in ("queued", "running")), None)
+
+    def recent(self):
+        with self._lock:
+            return list(reversed(self._jobs.values()))
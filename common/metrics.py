@@ -0,0 +1,150 @@
+"""Run and process metrics: counters and fixed-bucket histograms, rendered for Prometheus on /metrics."""
+import bisect
+import copy
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_HELP = { # name -> (Prometheus type, help text)
+    'fetch_seconds': ('histogram', 'Time from sending a request to receiving its response headers'),
+    'rate_limit_wait_seconds': ('histogram', 'Time a request waited for its host rate limiter slot'),
+    'parse_seconds': ('histogram', 'Time spent decoding and parsing one page'),
+    'db_upsert_seconds': ('histogram', 'Latency of one bulk upsert statement including its commit'),
+    'requests_total': ('counter', 'HTTP responses received'),
+    'retries_total': ('counter', 'Requests retried after a 429/5xx or a connection error'),
+    'bytes_downloaded_total': ('counter', 'Response body bytes received from the network (cache hits count 0)'),
+    'db_rows_written_total': ('counter', 'Rows written by the bulk writer'),
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics (cumulative `le` buckets, sum and count)."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the largest value seen."""
+        rank, seen = q * self.count, 0
+        for upper, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if bucket_count and seen >= rank:
+                return min(upper, self.max)
+        return self.max
+
+    def merge(self, other):
+        self.bucket_counts = [mine + theirs for mine, theirs in zip(self.bucket_counts, other.bucket_counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        return {"count": self.count, "sum_s": round(self.sum, 3), "avg_s": round(self.sum / self.count, 4) if self.count else 0.0,
+                "p50_s": round(self.quantile(0.5), 4), "p95_s": round(self.quantile(0.95), 4), "max_s": round(self.max, 4)}
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and label values.
+
+    A run records into its own registry, which forwards every observation to `parent` (the
+    process-wide registry served on /metrics), so the per-run summary and the cumulative
+    Prometheus series come from the same calls.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+        if self.parent: self.parent.observe(name, value, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        if self.parent: self.parent.inc(name, amount, **labels)
+
+    def reset(self):
+        """Drops every series, e.g. when a new run starts; totals already forwarded to `parent` stay there."""
+        with self._lock:
+            self._histograms, self._counters = {}, {}
+
+    def export(self):
+        """Copies of every series as (histograms, counters) dicts, picklable so another process can merge() them."""
+        with self._lock:
+            histograms = {key: copy.copy(histogram) for key, histogram in self._histograms.items()}
+            for histogram in histograms.values():
+                histogram.bucket_counts = list(histogram.bucket_counts)
+            return histograms, dict(self._counters)
+
+    def merge(self, histograms, counters):
+        """Adds another registry's export() (e.g. from a scrape process) to this one's series."""
+        with self._lock:
+            for key, other in histograms.items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(other.buckets)
+                histogram.merge(other)
+            for key, amount in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + amount
+        if self.parent: self.parent.merge(histograms, counters)
+
+    def summary(self):
+        """{metric: {"label=value,...": histogram summary or counter value}} ("all" for unlabelled series)."""
+        out = {}
+        with self._lock:
+            series = sorted(list(self._histograms.items()) + list(self._counters.items()), key=lambda item: item[0])
+            for (name, labels), value in series:
+                label_key = ",".join(f"{k}={v}" for k, v in labels) or "all"
+                out.setdefault(name, {})[label_key] = value.summary() if isinstance(value, Histogram) else value
+        return out
+
+    def render_prometheus(self, prefix):
+        """Text exposition format (version 0.0.4) of every series, metric names prefixed with `prefix`."""
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), value in list(self._histograms.items()) + list(self._counters.items()):
+                by_name.setdefault(name, []).append((labels, value))
+            for name in sorted(by_name):
+                kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+                metric = prefix + name
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+                for labels, value in sorted(by_name[name], key=lambda series: series[0]):
+                    if isinstance(value, Histogram):
+                        cumulative = 0
+                        for upper, bucket_count in zip(value.buckets + (None,), value.bucket_counts):
+                            cumulative += bucket_count
+                            le = "+Inf" if upper is None else repr(upper)
+                            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                        lines.append(f"{metric}_sum{_format_labels(labels)} {value.sum}")
+                        lines.append(f"{metric}_count{_format_labels(labels)} {value.count}")
+                    else:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+process_metrics = MetricsRegistry() # Cumulative since process start, served on /metrics
+run_metrics = MetricsRegistry(parent=process_metrics) # Reset at the start of every run
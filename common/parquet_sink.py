@@ -0,0 +1,89 @@
+"""Columnar snapshot sink: a run's rows as Parquet files partitioned by scope and date. Needs the optional pyarrow."""
+import os
+import threading
+import time
+from urllib.parse import quote
+
+pyarrow = None # Bound by import_pyarrow(); optional, enables the --parquet_dir snapshot sink
+DEFAULT_PARQUET_ROW_GROUP = 10000 # Rows buffered per partition before a row group is written
+
+
+def import_pyarrow():
+    """Imports pyarrow for the Parquet sink on first use; returns None if it is not installed."""
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            pyarrow = None
+    return pyarrow
+
+
+class ParquetSink:
+    """Streams a run's rows into Parquet files partitioned Hive-style by scope and date, beside the MySQL writer.
+
+    Files land at <root>/<scraper>/<partition_field>=<value>/date=<YYYY-MM-DD>/part-<run_id>.parquet.
+    Rows are buffered per partition and written as a row group every `row_group_size` rows.
+    `fields` are (name, pyarrow type name) pairs. As usual for Hive partitioning, the partition field
+    lives only in the directory name. `dictionary_fields` are dictionary-encoded and read back as categoricals. Files are written under a .tmp name and renamed by close(), so readers never
+    memory-map a half-written file. Safe to share between worker threads.
+    """
+    def __init__(self, root_dir, scraper, run_id, fields, partition_field, dictionary_fields=(),
+                 row_group_size=DEFAULT_PARQUET_ROW_GROUP):
+        self.root_dir = root_dir
+        self.scraper = scraper
+        self.run_id = run_id
+        self.partition_field = partition_field
+        self.dictionary_fields = [name for name, _ in fields if name in dictionary_fields and name != partition_field]
+        self.row_group_size = max(1, row_group_size)
+        self.schema = pyarrow.schema([(name, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if name in dictionary_fields
+                                       else getattr(pyarrow, type_name)()) for name, type_name in fields if name != partition_field])
+        self.date = time.strftime("%Y-%m-%d", time.gmtime())
+        self.rows_written = 0
+        self.files = []
+        self._partition_index = [name for name, _ in fields].index(partition_field)
+        self._buffers = {} # partition value -> rows not yet written
+        self._writers = {} # partition value -> (ParquetWriter, .tmp path, final path)
+        self._lock = threading.Lock()
+
+    def add_many(self, rows):
+        with self._lock:
+            for row in rows:
+                partition = row[self._partition_index]
+                buffer = self._buffers.setdefault(partition, [])
+                buffer.append(row)
+                if len(buffer) >= self.row_group_size:
+                    self._write_locked(partition)
+
+    def _write_locked(self, partition):
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        try:
+            if partition not in self._writers:
+                directory = os.path.join(self.root_dir, self.scraper, f"{self.partition_field}={quote(str(partition), safe='')}",
+                                         f"date={self.date}")
+                os.makedirs(directory, exist_ok=True)
+                final_path = os.path.join(directory, f"part-{self.run_id}.parquet")
+                writer = pyarrow.parquet.ParquetWriter(final_path + ".tmp", self.schema, use_dictionary=self.dictionary_fields)
+                self._writers[partition] = (writer, final_path + ".tmp", final_path)
+            values_by_column = [values for index, values in enumerate(zip(*rows)) if index != self._partition_index]
+            columns = [pyarrow.array(values, type=field.type) for values, field in zip(values_by_column, self.schema)]
+            self._writers[partition][0].write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+            self.rows_written += len(rows)
+        except (OSError, pyarrow.ArrowException) as err:
+            # The snapshot is a side output; a failed write must not stop the crawl.
+            print(f"Error writing {len(rows)} rows of '{partition}' to the Parquet snapshot: {err}")
+
+    def close(self):
+        with self._lock:
+            for partition in list(self._buffers):
+                self._write_locked(partition)
+            for writer, tmp_path, final_path in self._writers.values():
+                writer.close()
+                os.replace(tmp_path, final_path)
+                self.files.append(final_path)
+            self._writers = {}
+        print(f"Parquet sink for '{self.scraper}': {self.rows_written} rows in {len(self.files)} files under {self.root_dir}.")
+        return self.files
@@ -0,0 +1,95 @@
+"""Adaptive revisit scheduling: crawl each scope about as often as its catalog changes."""
+from common import db
+
+DEFAULT_MIN_REVISIT_HOURS = 1.0
+DEFAULT_MAX_REVISIT_HOURS = 168.0 # A catalog that never changes is still checked weekly
+DEFAULT_REVISIT_TARGET_SHARE = 0.05 # Revisit once about this share of a catalog is expected to have changed
+
+
+class RevisitScheduler:
+    """Learns how fast each scope (store or category) changes and spaces its crawls to match.
+
+    After a complete crawl, record() turns the share of products whose price or availability changed
+    since the previous crawl into a per-hour change rate, averaged over past runs, and schedules the
+    next visit for when about `target_share` of the catalog should have changed again, clamped to
+    [min_hours, max_hours]. due() filters a run's scopes to those whose visit has come; a scope
+    without history is always due. State lives in the crawl_schedule table; save() writes it back.
+    """
+    def __init__(self, db_conn, scraper, min_hours=DEFAULT_MIN_REVISIT_HOURS, max_hours=DEFAULT_MAX_REVISIT_HOURS,
+                 target_share=DEFAULT_REVISIT_TARGET_SHARE, smoothing=0.5):
+        self.db_conn = db_conn
+        self.scraper = scraper
+        self.min_hours = min_hours
+        self.max_hours = max(min_hours, max_hours)
+        self.target_share = target_share
+        self.smoothing = smoothing
+        self.state = {} # scope -> (change rate per hour or None, seconds since its last crawl, due now)
+        self.next_visit_hours = {}
+        self._pending = []
+
+    def load(self):
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_schedule (
+                    scraper VARCHAR(32) NOT NULL,
+                    scope VARCHAR(255) NOT NULL,
+                    change_rate DOUBLE,
+                    interval_s INT NOT NULL,
+                    last_products INT,
+                    last_changed INT,
+                    last_crawled_at DATETIME NOT NULL,
+                    next_due_at DATETIME NOT NULL,
+                    PRIMARY KEY (scraper, scope)
+                );
+            """)
+            cursor.execute("SELECT scope, change_rate, TIMESTAMPDIFF(SECOND, last_crawled_at, NOW()), next_due_at <= NOW() "
+                           "FROM crawl_schedule WHERE scraper = %s", (self.scraper,))
+            self.state = {scope: (rate, since_s, bool(due)) for scope, rate, since_s, due in cursor.fetchall()}
+            self.db_conn.commit()
+        finally:
+            cursor.close()
+        return len(self.state)
+
+    def due(self, scopes):
+        return [scope for scope in scopes if scope not in self.state or self.state[scope][2]]
+
+    def record(self, scope, products, changed):
+        """Updates the scope's change rate from one complete crawl and returns the hours until its next visit."""
+        previous_rate, since_s, _ = self.state.get(scope, (None, None, True))
+        rate = previous_rate
+        if since_s is not None: # The first crawl only sets the baseline the next one is compared with
+            observed = (changed / products if products else 0.0) / max(since_s / 3600, 1 / 60)
+            rate = observed if previous_rate is None else self.smoothing * observed + (1 - self.smoothing) * previous_rate
+        if rate is None:
+            hours = self.min_hours # Come back soon to measure a rate
+        elif rate <= 0:
+            hours = self.max_hours
+        else:
+            hours = min(self.max_hours, max(self.min_hours, self.target_share / rate))
+        interval_s = int(hours * 3600)
+        self._pending.append((self.scraper, scope, rate, interval_s, products, changed, interval_s))
+        self.next_visit_hours[scope] = round(hours, 2)
+        return hours
+
+    def save(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.executemany("""
+                INSERT INTO crawl_schedule (scraper, scope, change_rate, interval_s, last_products, last_changed,
+                                            last_crawled_at, next_due_at)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE change_rate = VALUES(change_rate), interval_s = VALUES(interval_s),
+                    last_products = VALUES(last_products), last_changed = VALUES(last_changed),
+                    last_crawled_at = VALUES(last_crawled_at), next_due_at = VALUES(next_due_at)
+            """, rows)
+            self.db_conn.commit()
+        except db.mysql.connector.Error as err:
+            print(f"Error saving the revisit schedule for '{self.scraper}': {err}")
+            self.db_conn.rollback()
+        finally:
+            cursor.close()
+        return len(rows)
@@ -0,0 +1,22 @@
+"""Production serving of a scraper API under gunicorn."""
+
+
+def serve_with_gunicorn(app, port, threads, on_worker_start=None):
+    """Serves `app` from one gunicorn gthread worker; `on_worker_start()` runs inside the worker once it is up.
+
+    One worker, because the job registry lives in process memory; the threads keep the
+    endpoints responsive, and --scrape_in process keeps the crawl's CPU work out of the worker.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class ScraperApplication(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": f"0.0.0.0:{port}", "workers": 1, "worker_class": "gthread", "threads": threads}.items():
+                self.cfg.set(key, value)
+            if on_worker_start:
+                self.cfg.set("post_worker_init", lambda worker: on_worker_start())
+
+        def load(self):
+            return app
+
+    ScraperApplication().run()
@@ -0,0 +1,149 @@
+"""Sharded crawling: scopes split between replicas through a MySQL lease table, and fan-out of a run to the peers."""
+import os
+import socket
+import threading
+
+import requests
+
+from common import db
+
+DEFAULT_LEASE_TTL = 300 # Seconds a store/category lease lives without a heartbeat
+
+
+class ShardLeases:
+    """Splits the scopes (stores or categories) of one sharded run between replicas via a MySQL lease table.
+
+    Every replica taking part in run `run_id` calls claim() before crawling a scope and exactly one
+    caller wins it. Held leases are renewed by a heartbeat thread; a lease that is not renewed within
+    `ttl_s` (its replica died) can be taken over by another replica. Uses its own connection, because
+    claims come from worker threads while the run's connection is busy writing rows.
+    """
+    def __init__(self, db_conn, scraper, run_id, ttl_s=DEFAULT_LEASE_TTL):
+        self.db_conn = db_conn
+        self.scraper = scraper
+        self.run_id = run_id
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl_s = max(10, int(ttl_s))
+        self.held = set()
+        self.claimed = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def open(self):
+        with self._lock:
+            cursor = self.db_conn.cursor()
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS crawl_leases (
+                        scraper VARCHAR(32) NOT NULL,
+                        run_id VARCHAR(64) NOT NULL,
+                        scope VARCHAR(255) NOT NULL,
+                        owner VARCHAR(255) NOT NULL,
+                        leased_until DATETIME NOT NULL,
+                        done BOOLEAN NOT NULL DEFAULT FALSE,
+                        PRIMARY KEY (scraper, run_id, scope)
+                    );
+                """)
+                cursor.execute("DELETE FROM crawl_leases WHERE scraper = %s AND run_id <> %s AND leased_until < NOW() - INTERVAL 1 DAY",
+                               (self.scraper, self.run_id))
+                self.db_conn.commit()
+            finally:
+                cursor.close()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name=f"{self.scraper}-lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def claim(self, scope, prepare=None):
+        """Tries to take `scope` for this replica. `prepare(cursor)` runs in the same transaction when it wins."""
+        with self._lock:
+            cursor = self.db_conn.cursor()
+            try:
+                cursor.execute("INSERT IGNORE INTO crawl_leases (scraper, run_id, scope, owner, leased_until) "
+                               "VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)",
+                               (self.scraper, self.run_id, scope, self.owner, self.ttl_s))
+                won = cursor.rowcount == 1
+                if not won: # Take over a lease whose replica stopped renewing it
+                    cursor.execute("UPDATE crawl_leases SET owner = %s, leased_until = NOW() + INTERVAL %s SECOND "
+                                   "WHERE scraper = %s AND run_id = %s AND scope = %s AND done = FALSE AND leased_until < NOW()",
+                                   (self.owner, self.ttl_s, self.scraper, self.run_id, scope))
+                    won = cursor.rowcount == 1
+                if won and prepare:
+                    prepare(cursor)
+                self.db_conn.commit()
+            except db.mysql.connector.Error as err:
+                print(f"Error claiming lease on '{scope}' for run {self.run_id}: {err}")
+                self.db_conn.rollback()
+                won = False
+            finally:
+                cursor.close()
+            if won:
+                self.held.add(scope)
+                self.claimed.append(scope)
+            return won
+
+    def release(self, scope, done=True):
+        """Gives `scope` up: marked done, or (not done) left for another replica to take right away."""
+        with self._lock:
+            self.held.discard(scope)
+            cursor = self.db_conn.cursor()
+            try:
+                if done:
+                    cursor.execute("UPDATE crawl_leases SET done = TRUE WHERE scraper = %s AND run_id = %s AND scope = %s AND owner = %s",
+                                   (self.scraper, self.run_id, scope, self.owner))
+                else:
+                    cursor.execute("UPDATE crawl_leases SET leased_until = NOW() WHERE scraper = %s AND run_id = %s AND scope = %s AND owner = %s",
+                                   (self.scraper, self.run_id, scope, self.owner))
+                self.db_conn.commit()
+            except db.mysql.connector.Error as err:
+                print(f"Error releasing lease on '{scope}' for run {self.run_id}: {err}")
+                self.db_conn.rollback()
+            finally:
+                cursor.close()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl_s / 3):
+            with self._lock:
+                held = list(self.held)
+                if not held:
+                    continue
+                cursor = self.db_conn.cursor()
+                try:
+                    placeholders = ", ".join(["%s"] * len(held))
+                    cursor.execute(f"UPDATE crawl_leases SET leased_until = NOW() + INTERVAL %s SECOND "
+                                   f"WHERE scraper = %s AND run_id = %s AND owner = %s AND scope IN ({placeholders})",
+                                   [self.ttl_s, self.scraper, self.run_id, self.owner] + held)
+                    self.db_conn.commit()
+                except db.mysql.connector.Error as err:
+                    print(f"Error renewing {len(held)} leases for run {self.run_id}: {err}")
+                    self.db_conn.rollback()
+                finally:
+                    cursor.close()
+
+    def close(self):
+        """Stops the heartbeat and hands back any scope still held (e.g. after an error) to the other replicas."""
+        self._stop.set()
+        for scope in list(self.held):
+            self.release(scope, done=False)
+        if self.db_conn and self.db_conn.is_connected(): self.db_conn.close()
+
+
+def fan_out_to_peers(peer_service, trigger_path, run_id, port, scope_key=None, scope=None):
+    """POSTs the sharded run `run_id` to every other replica resolved from the headless `peer_service` (--peer_service)."""
+    try:
+        peer_ips = {info[4][0] for info in socket.getaddrinfo(peer_service, port, proto=socket.IPPROTO_TCP)}
+        own_ips = set(socket.gethostbyname_ex(socket.gethostname())[2])
+    except OSError as err:
+        print(f"Could not resolve peers from '{peer_service}': {err}")
+        return []
+    body = {"shard_run_id": run_id}
+    if scope: body[scope_key] = scope
+    triggered = []
+    for peer_ip in sorted(peer_ips - own_ips):
+        try:
+            response = requests.post(f"http://{peer_ip}:{port}{trigger_path}", json=body, timeout=5)
+            triggered.append({"peer": peer_ip, "status": response.status_code})
+        except requests.exceptions.RequestException as err:
+            triggered.append({"peer": peer_ip, "error": str(err)})
+    print(f"Sharded run {run_id} fanned out to peers: {triggered}")
+    return triggered
@@ -0,0 +1,183 @@
+"""Scrape processes: the long-lived scrape worker behind --scrape_in process, and the --parse_processes pool."""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common.db import db_config_from_args
+from common.metrics import MetricsRegistry, process_metrics
+
+METRICS_RELAY_INTERVAL = 5.0 # Seconds between metrics snapshots a scrape process sends to the API process
+
+
+def open_parse_pool(processes):
+    """Process pool for --parse_processes, or None. Spawned, so workers do not inherit the crawl's threads and locks."""
+    if processes <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+
+class JobEvents:
+    """Stands in for the API process's ScrapeJob inside a scrape process: start() and advance() are sent over `events`."""
+    def __init__(self, job_id, unit, scope, events):
+        self.id = job_id
+        self.unit = unit
+        self.scope = scope
+        self._events = events
+
+    def start(self, units_total):
+        self._events.put(("start", units_total))
+
+    def advance(self, **increments):
+        self._events.put(("advance", increments))
+
+
+def scrape_worker_main(name, label, unit, run_scrape, open_db_pool, cmd_args, commands, events):
+    """Entry point of the --scrape_in process worker, which runs every crawl of the API's lifetime.
+
+    Living as long as the API, it keeps the DB pool and the keep-alive HTTP session between runs.
+    `run_scrape` and `open_db_pool` are the scraper's run logic and init_db_pool, so its module-level
+    state (the pool, the HTTP session) lives in this process. Commands are (job_id, cmd_args, scope,
+    shard_run_id), or None to exit. Events are (job_id, kind, payload); worker-wide events ("ready",
+    "pool", "metrics") carry job_id None.
+    """
+    def relay_metrics():
+        while True:
+            time.sleep(METRICS_RELAY_INTERVAL)
+            events.put((None, "metrics", process_metrics.export()))
+    def open_pool():
+        events.put((None, "pool", open_db_pool(db_config_from_args(cmd_args), cmd_args.db_pool_size) is not None))
+    threading.Thread(target=relay_metrics, daemon=True).start()
+    if cmd_args.db_pool_size > 0:
+        threading.Thread(target=open_pool, name=f"{name}-db-pool", daemon=True).start()
+    events.put((None, "ready", None))
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            command = commands.get(timeout=5.0)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        if command is None:
+            break
+        job_id, job_args, scope, shard_run_id = command
+        try:
+            result = run_scrape(job_args, job=JobEvents(job_id, unit, scope, events), scope=scope, shard_run_id=shard_run_id)
+        except Exception as e:
+            print(f"Exception in {label} scrape worker: {e}")
+            result = {"status": "error", "message": f"Exception during {label} scraping: {e}"}
+        events.put((None, "metrics", process_metrics.export()))
+        events.put((job_id, "result", result))
+
+
+class ScrapeWorker:
+    """The API process's handle on the scrape worker process: hands it jobs and applies its events.
+
+    The worker's metrics are cumulative over its lifetime; they are merged into process_metrics
+    only if it dies, and it is started again (taking its settings from the last start) right away.
+    `name` prefixes the process and thread names, `label` the log lines; `unit`, `run_scrape` and
+    `open_db_pool` are handed to scrape_worker_main. Both functions must be module-level, since the
+    worker is spawned and receives them pickled.
+    """
+    def __init__(self, name, label, unit, run_scrape, open_db_pool):
+        self.name = name
+        self.label = label
+        self.unit = unit
+        self.run_scrape = run_scrape
+        self.open_db_pool = open_db_pool
+        self.process = None
+        self.cmd_args = None
+        self.ready = False # The worker is up and takes jobs
+        self.db_pool = None # Whether the worker's DB pool opened; None while it is opening (or with --db_pool_size 0)
+        self.metrics = None # Latest process_metrics.export() of the worker
+        self.job = None
+        self.result = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, cmd_args):
+        context = multiprocessing.get_context("spawn") # Not forked: the API process has threads (and locks) of its own
+        self.cmd_args = cmd_args
+        self.commands, events = context.Queue(), context.Queue()
+        self.ready, self.db_pool, self.metrics = False, None, None
+        # Not daemonic, so the worker can start its own --parse_processes pool; stop() ends it at exit
+        self.process = context.Process(target=scrape_worker_main, name=f"{self.name}-scrape-worker",
+                                       args=(self.name, self.label, self.unit, self.run_scrape, self.open_db_pool,
+                                             cmd_args, self.commands, events))
+        self.process.start()
+        threading.Thread(target=self._apply_events, args=(self.process, events), name=f"{self.name}-scrape-events", daemon=True).start()
+        print(f"Started {self.label} scrape worker (pid {self.process.pid}).")
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def _apply_events(self, process, events):
+        while True:
+            try:
+                job_id, kind, payload = events.get(timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+                continue
+            job = self.job
+            if kind == "ready":
+                self.ready = True
+            elif kind == "pool":
+                self.db_pool = payload
+            elif kind == "metrics":
+                self.metrics = payload
+            elif job is None or job_id != job.id:
+                continue # Left over from a job the API already gave up on
+            elif kind == "start":
+                job.start(payload)
+            elif kind == "advance":
+                job.advance(**payload)
+            elif kind == "result":
+                self.result = payload
+                self.done.set()
+        if process is not self.process:
+            return
+        print(f"{self.label} scrape worker exited with code {process.exitcode}.")
+        self.ready = False
+        if self.metrics: process_metrics.merge(*self.metrics) # Keeps /metrics counters monotonic across restarts
+        self.metrics = None
+        self.done.set()
+        if self.cmd_args is not None:
+            time.sleep(1.0) # A worker that dies at startup is not restarted in a tight loop
+            with self._lock:
+                if process is self.process: self.start(self.cmd_args)
+
+    def run(self, cmd_args, job, scope=None, shard_run_id=None):
+        """Runs one job in the worker and returns its result; starts the worker first if it is not running."""
+        with self._lock:
+            if not self.alive():
+                self.start(cmd_args)
+            self.job, self.result = job, None
+            self.done.clear()
+            self.commands.put((job.id, cmd_args, scope, shard_run_id))
+        self.done.wait()
+        result, self.job = self.result, None
+        if result is None:
+            result = {"status": "error", "message": f"{self.label} scrape worker exited with code {self.process.exitcode} before reporting a result."}
+        return result
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            process, self.cmd_args = self.process, None
+        if process is None or not process.is_alive():
+            return
+        self.commands.put(None)
+        process.join(timeout)
+        if process.is_alive(): process.terminate() # Still crawling
+
+    def current_metrics(self):
+        """process_metrics plus this worker's series, if it is running."""
+        running = self.metrics
+        if not running:
+            return process_metrics
+        merged = MetricsRegistry()
+        merged.merge(*process_metrics.export())
+        merged.merge(*running)
+        return merged
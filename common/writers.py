@@ -0,0 +1,239 @@
+"""Bulk writers (multi-row upserts and LOAD DATA for shadow tables) and the shadow-table swap of a full refresh."""
+import os
+import tempfile
+import threading
+import time
+
+from common import db
+from common.metrics import run_metrics
+
+DEFAULT_DB_BATCH_SIZE = 500
+DEFAULT_DB_FLUSH_INTERVAL = 5.0 # Seconds; flush a partial batch if it has been waiting this long
+
+
+class BulkUpserter:
+    """Buffers rows and writes them as one multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+
+    With no update columns and no `extra_updates`, the statement is INSERT IGNORE: rows whose key
+    is already stored are left as they are.
+
+    A flush (one round-trip plus commit) happens once `batch_size` rows are buffered,
+    when `flush_interval` seconds have passed since the previous flush, or on flush()/close().
+    `on_flush`, if given, is called after every flush once its rows are committed.
+    Safe to share between worker threads. Writers on the same connection must share one `lock`
+    (reentrant, so one writer's on_flush may flush another).
+    """
+    def __init__(self, db_conn, table, columns, update_columns, batch_size=DEFAULT_DB_BATCH_SIZE,
+                 flush_interval=DEFAULT_DB_FLUSH_INTERVAL, extra_updates=("scraped_at = CURRENT_TIMESTAMP",), on_flush=None,
+                 lock=None):
+        self.db_conn = db_conn
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        updates = [f"{col} = VALUES({col})" for col in update_columns] + list(extra_updates)
+        self._insert_prefix = f"INSERT {'' if updates else 'IGNORE '}INTO {table} ({', '.join(self.columns)}) VALUES "
+        self._row_placeholder = "(" + ", ".join(["%s"] * len(self.columns)) + ")"
+        self._update_clause = " ON DUPLICATE KEY UPDATE " + ", ".join(updates) if updates else ""
+        self._buffer = []
+        self._lock = lock or threading.RLock()
+        self._last_flush_at = time.monotonic()
+        self.rows_written = 0
+        self.round_trips = 0
+
+    def _sql_for(self, row_count):
+        return self._insert_prefix + ", ".join([self._row_placeholder] * row_count) + self._update_clause
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.batch_size or \
+               (self.flush_interval and time.monotonic() - self._last_flush_at >= self.flush_interval):
+                self._flush_locked()
+
+    def poll(self):
+        """Flushes if `flush_interval` has elapsed, even when nothing new was added (so on_flush still runs)."""
+        self.add_many([])
+
+    def flush(self):
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush_at = time.monotonic()
+        written = 0
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            written += self._write_batch(batch)
+        if self.on_flush:
+            self.on_flush()
+        return written
+
+    def _write_batch(self, batch):
+        cursor = self.db_conn.cursor()
+        started_at = time.monotonic()
+        try:
+            cursor.execute(self._sql_for(len(batch)), [value for row in batch for value in row])
+            self.db_conn.commit()
+            run_metrics.observe('db_upsert_seconds', time.monotonic() - started_at, table=self.table)
+            run_metrics.inc('db_rows_written_total', len(batch), table=self.table)
+            self.round_trips += 1
+            self.rows_written += len(batch)
+            return len(batch)
+        except db.mysql.connector.Error as err:
+            # One bad row shouldn't cost the whole batch: retry row by row to isolate it.
+            print(f"Bulk upsert of {len(batch)} rows into '{self.table}' failed ({err}). Retrying row by row.")
+            self.db_conn.rollback()
+            written = 0
+            for row in batch:
+                try:
+                    cursor.execute(self._sql_for(1), row)
+                    self.round_trips += 1
+                    written += 1
+                except db.mysql.connector.Error as row_err:
+                    print(f"DB Error for {row[0]} in '{self.table}': {row_err}")
+            self.db_conn.commit()
+            run_metrics.observe('db_upsert_seconds', time.monotonic() - started_at, table=self.table)
+            run_metrics.inc('db_rows_written_total', written, table=self.table)
+            self.rows_written += written
+            return written
+        finally:
+            cursor.close()
+
+    def close(self):
+        written = self.flush()
+        print(f"Bulk writer for '{self.table}': {self.rows_written} rows in {self.round_trips} round-trips.")
+        return written
+
+# --- Shadow-Table Full Refresh ---
+def _infile_field(value):
+    """One LOAD DATA field: \\N for NULL, otherwise quoted, with MySQL's backslash escapes."""
+    if value is None:
+        return "\\N"
+    text = str(value)
+    for raw, escaped in (("\\", "\\\\"), ('"', '\\"'), ("\n", "\\n"), ("\r", "\\r"), ("\0", "\\0")):
+        text = text.replace(raw, escaped)
+    return f'"{text}"'
+
+
+class InfileUpserter(BulkUpserter):
+    """BulkUpserter for a shadow table: every batch is spooled to a CSV file and sent with one LOAD DATA LOCAL INFILE.
+
+    REPLACE keeps the last row of a duplicate key, like the upsert would. If the server or the
+    connection refuses LOCAL INFILE (or `infile` is False), batches are written as multi-row
+    inserts of `insert_batch_size` rows instead.
+    """
+    def __init__(self, *args, infile=True, insert_batch_size=DEFAULT_DB_BATCH_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.infile = infile
+        self.insert_batch_size = max(1, insert_batch_size)
+        self._load_sql = (f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {self.table} CHARACTER SET utf8mb4 "
+                          r"""FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '\\' LINES TERMINATED BY '\n' """
+                          f"({', '.join(self.columns)})")
+
+    def _write_batch(self, batch):
+        if not self.infile:
+            return sum(super(InfileUpserter, self)._write_batch(batch[start:start + self.insert_batch_size])
+                       for start in range(0, len(batch), self.insert_batch_size))
+        started_at = time.monotonic()
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.csv', delete=False) as spool:
+            spool.write("".join(",".join(_infile_field(value) for value in row) + "\n" for row in batch))
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute(self._load_sql, (spool.name,))
+            self.db_conn.commit()
+        except db.mysql.connector.Error as err:
+            print(f"LOAD DATA LOCAL INFILE into '{self.table}' failed ({err}). Loading with multi-row inserts instead.")
+            self.db_conn.rollback()
+            self.infile = False
+            return self._write_batch(batch)
+        finally:
+            cursor.close()
+            os.remove(spool.name)
+        run_metrics.observe('db_upsert_seconds', time.monotonic() - started_at, table=self.table)
+        run_metrics.inc('db_rows_written_total', len(batch), table=self.table)
+        self.round_trips += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+
+class ShadowSwap:
+    """Full refresh readers never see half-done: rows go to shadow copies of the live tables, published by one RENAME TABLE.
+
+    `tables` maps each live table to the columns its writer fills. open() recreates `<table>_shadow`
+    like the live table, minus its non-unique secondary indexes; publish() adds those back in one
+    ALTER per table once the rows are in, copies over the live rows of scopes this run did not
+    complete (so a failed or skipped store keeps its products), and swaps all tables in one
+    statement. abort() drops the shadows and leaves the live tables as they were.
+    """
+    def __init__(self, db_conn, tables, scope_column):
+        self.db_conn = db_conn
+        self.tables = dict(tables)
+        self.scope_column = scope_column
+        self.deferred_indexes = {} # table -> [(index name, [column, ...])]
+
+    @staticmethod
+    def shadow_name(table):
+        return f"{table}_shadow"
+
+    def open(self):
+        cursor = self.db_conn.cursor()
+        try:
+            for table in self.tables:
+                shadow = self.shadow_name(table)
+                # Left behind by a run that died before publishing, or between the swap and the cleanup
+                cursor.execute(f"DROP TABLE IF EXISTS {shadow}, {table}_old")
+                cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+                cursor.execute("SELECT index_name, column_name, sub_part FROM information_schema.statistics "
+                               "WHERE table_schema = DATABASE() AND table_name = %s AND non_unique = 1 "
+                               "ORDER BY index_name, seq_in_index", (shadow,))
+                indexes = {}
+                for index_name, column_name, sub_part in cursor.fetchall():
+                    indexes.setdefault(index_name, []).append(f"{column_name}({sub_part})" if sub_part else column_name)
+                self.deferred_indexes[table] = list(indexes.items())
+                if indexes:
+                    cursor.execute(f"ALTER TABLE {shadow} " + ", ".join(f"DROP INDEX {name}" for name in indexes))
+            self.db_conn.commit()
+        finally:
+            cursor.close()
+        return self
+
+    def publish(self, completed_scopes):
+        """Carries over the rows of other scopes, rebuilds the deferred indexes and swaps. Returns rows carried over."""
+        carried = 0
+        scopes = sorted(completed_scopes)
+        where_clause = (f" WHERE {self.scope_column} IS NULL OR {self.scope_column} NOT IN ({', '.join(['%s'] * len(scopes))})"
+                        if scopes else "")
+        cursor = self.db_conn.cursor()
+        try:
+            for table, columns in self.tables.items():
+                shadow = self.shadow_name(table)
+                column_list = ", ".join(tuple(columns) + ('scraped_at',))
+                cursor.execute(f"INSERT IGNORE INTO {shadow} ({column_list}) SELECT {column_list} FROM {table}{where_clause}",
+                               scopes or None)
+                carried += cursor.rowcount
+                if self.deferred_indexes[table]:
+                    cursor.execute(f"ALTER TABLE {shadow} " + ", ".join(f"ADD INDEX {name} ({', '.join(index_columns)})"
+                                                                         for name, index_columns in self.deferred_indexes[table]))
+            self.db_conn.commit()
+            cursor.execute("RENAME TABLE " + ", ".join(f"{table} TO {table}_old, {self.shadow_name(table)} TO {table}"
+                                                       for table in self.tables))
+            cursor.execute(f"DROP TABLE {', '.join(f'{table}_old' for table in self.tables)}")
+            self.db_conn.commit()
+        finally:
+            cursor.close()
+        return carried
+
+    def abort(self):
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {', '.join(self.shadow_name(table) for table in self.tables)}")
+            self.db_conn.commit()
+        except db.mysql.connector.Error as err:
+            print(f"Error dropping shadow tables: {err}")
+        finally:
+            cursor.close()
@@ -1,12 +1,50 @@
 
 import requests
-import mysql.connector
+try:
+    import ijson # Optional: enables streaming decoding of /products.json pages
+except ImportError:
+    ijson = None
 import time
 import argparse
 import json
-from flask import Flask, jsonify, request
 import threading
 import os
+import sys
+import uuid
+import io
+import atexit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The common package sits at the repository root
+from common import db, httpcache
+from common.changes import ChangeFeed
+from common.checkpoint import CrawlCheckpoint
+from common.db import db_config_from_args
+from common.delta import DeltaTracker, load_existing_fingerprints, row_fingerprint
+from common.fetch import DEFAULT_MAX_HOST_RATE, DEFAULT_MIN_HOST_RATE, limiter_from_args, request_with_backoff
+from common.httpcache import cache_stats_delta, configure_http_session
+from common.jobs import JobRegistry, ScrapeJob
+from common.metrics import run_metrics
+from common.parquet_sink import ParquetSink, import_pyarrow
+from common.revisit import DEFAULT_MAX_REVISIT_HOURS, DEFAULT_MIN_REVISIT_HOURS, DEFAULT_REVISIT_TARGET_SHARE, RevisitScheduler
+from common.server import serve_with_gunicorn
+from common.sharding import DEFAULT_LEASE_TTL, ShardLeases, fan_out_to_peers
+from common.workers import ScrapeWorker, open_parse_pool
+from common.writers import BulkUpserter, InfileUpserter, ShadowSwap
+
+# --- Deferred Imports ---
+# mysql.connector, pyarrow and flask are imported on first use rather than here: spawned scrape and
+# parse processes import this module too, and the API should answer /ready before MySQL is needed.
+mysql = None # Bound by import_mysql()
+
+
+def import_mysql():
+    """Imports mysql.connector (and its pooling module) on first use, here and in the common package."""
+    global mysql
+    if mysql is None:
+        mysql = db.import_mysql()
+    return mysql
 
 # --- Default Configurations ---
 DEFAULT_STORES_FILE = "stores.json"
@@ -23,6 +61,35 @@ DEFAULT_DB_CONFIG_DEFAULTS = { # Renamed to avoid confusion with the instance
     'password': '',
     'database': 'scrap_test'
 }
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PAGE_WINDOW = 4 # Max /products.json pages of one store in flight
+SHOPIFY_PAGE_LIMIT = 250 # Products per /products.json page (Shopify's maximum)
+DEFAULT_PER_HOST_CONCURRENCY = 4 # Lets a store's page window overlap its requests; the rate limit still applies
+DEFAULT_PER_HOST_DELAY = 1.5 # Same politeness as the old per-page sleep, but only towards the same host
+DEFAULT_DB_BATCH_SIZE = 500
+DEFAULT_DB_FLUSH_INTERVAL = 5.0 # Seconds; flush a partial batch if it has been waiting this long
+DEFAULT_SCRAPE_MODE = "incremental"
+DEFAULT_RESUME = "auto"
+DEFAULT_FULL_REFRESH = "delete" # "swap" loads a full refresh into shadow tables and publishes them with RENAME TABLE
+DEFAULT_SHADOW_LOAD = "infile" # How rows reach the shadow tables: LOAD DATA LOCAL INFILE, or "insert" for multi-row inserts
+DEFAULT_SHADOW_BATCH_ROWS = 50000 # Rows spooled per LOAD DATA
+DEFAULT_SHARD_MODE = "off"
+DEFAULT_PRICE_HISTORY = "on" # Append price/availability changes to the price_history table
+DEFAULT_CHANGE_FEED_PATH = "" # Disabled; enable with a file on persistent storage (a container's working directory is lost on restart)
+DEFAULT_PARQUET_DIR = "" # Root of the Parquet snapshots; empty string disables the sink
+DEFAULT_REVISIT = "off" # "adaptive" only crawls the scopes the revisit scheduler says are due
+DEFAULT_SCHEDULE_EVERY_MINUTES = 0 # Built-in timer that triggers runs (0 = only on POST)
+DEFAULT_HTTP_CACHE_PATH = "http_cache.sqlite" # Empty string disables the cache
+DEFAULT_HTTP_CACHE_MAX_MB = 256
+DEFAULT_DB_POOL_SIZE = 4 # MySQL connections kept open between runs (0 disables the pool)
+DEFAULT_HTTP_POOL_HOSTS = 128 # Hosts whose keep-alive connection pools are kept
+DEFAULT_HTTP_POOL_MAXSIZE = 8 # Keep-alive connections kept per host
+DEFAULT_JSON_DECODER = "stream" # Falls back to "std" when ijson is not installed
+DEFAULT_PRODUCT_SCHEMA = "flat" # "normalized" writes shopify_products + product_variants keyed by Shopify IDs
+DEFAULT_SERVER = "flask" # "gunicorn" serves the API from one gthread worker, for production
+DEFAULT_SERVER_THREADS = 8 # Request threads of the gunicorn worker
+DEFAULT_SCRAPE_IN = "thread" # "process" runs each crawl in its own process, so it never holds the API's GIL
+DEFAULT_PARSE_PROCESSES = 0 # Processes CPU-bound page parsing is spread over (0 = parse in the fetch threads)
 
 # --- Argument Parsing ---
 parser = argparse.ArgumentParser(description="Scrape product data from Shopify stores.")
@@ -31,16 +98,90 @@ parser.add_argument("--db_user", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['u
 parser.add_argument("--db_password", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['password'], help="...")
 parser.add_argument("--db_name", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['database'], help="...")
 parser.add_argument("--stores_file_path", type=str, default=DEFAULT_STORES_FILE, help="...")
+parser.add_argument("--max_workers", type=int, default=DEFAULT_MAX_WORKERS, help="Number of stores crawled at the same time (1 = one store after another)")
+parser.add_argument("--page_window", type=int, default=DEFAULT_PAGE_WINDOW, help="Max pages of one store fetched at the same time (1 = one page after another)")
+parser.add_argument("--per_host_concurrency", type=int, default=DEFAULT_PER_HOST_CONCURRENCY, help="Max in-flight requests per store host")
+parser.add_argument("--per_host_delay", type=float, default=DEFAULT_PER_HOST_DELAY, help="Initial seconds between requests to the same host (the rate then adapts)")
+parser.add_argument("--min_host_rate", type=float, default=DEFAULT_MIN_HOST_RATE, help="Lowest requests/s a host is slowed down to after 429/5xx")
+parser.add_argument("--max_host_rate", type=float, default=DEFAULT_MAX_HOST_RATE, help="Highest requests/s a fast, healthy host is sped up to")
+parser.add_argument("--db_batch_size", type=int, default=DEFAULT_DB_BATCH_SIZE, help="Rows per multi-row upsert")
+parser.add_argument("--db_flush_interval", type=float, default=DEFAULT_DB_FLUSH_INTERVAL, help="Max seconds rows wait in the write buffer")
+parser.add_argument("--scrape_mode", choices=["incremental", "full"], default=DEFAULT_SCRAPE_MODE,
+                    help="incremental: write only changed rows and retire unseen ones; full: empty the table first")
+parser.add_argument("--full_refresh", choices=["delete", "swap"], default=DEFAULT_FULL_REFRESH,
+                    help="How --scrape_mode full replaces rows. delete: empty the table first; swap: fill shadow tables, then swap them in atomically")
+parser.add_argument("--shadow_load", choices=["infile", "insert"], default=DEFAULT_SHADOW_LOAD,
+                    help="infile: LOAD DATA LOCAL INFILE from spooled CSV batches (falls back to insert if refused); insert: multi-row inserts")
+parser.add_argument("--resume", choices=["auto", "never"], default=DEFAULT_RESUME,
+                    help="auto: continue an interrupted run from its checkpoints; never: always start over")
+parser.add_argument("--shard_mode", choices=["off", "lease"], default=DEFAULT_SHARD_MODE,
+                    help="lease: replicas split the work by claiming scopes in the crawl_leases table")
+parser.add_argument("--peer_service", type=str, default="", help="Headless service name resolving to all replicas; a trigger fans out to them")
+parser.add_argument("--lease_ttl", type=int, default=DEFAULT_LEASE_TTL, help="Seconds before an unrenewed lease can be taken over")
+parser.add_argument("--price_history", choices=["on", "off"], default=DEFAULT_PRICE_HISTORY,
+                    help="Append an event to the price_history table whenever a product's price or availability changes")
+parser.add_argument("--change_feed_path", type=str, default=DEFAULT_CHANGE_FEED_PATH, help="NDJSON file the change events are appended to ('' to disable)")
+parser.add_argument("--revisit", choices=["off", "adaptive"], default=DEFAULT_REVISIT,
+                    help="adaptive: crawl only the stores due for a revisit, spaced by their learned change rate")
+parser.add_argument("--min_revisit_hours", type=float, default=DEFAULT_MIN_REVISIT_HOURS, help="Shortest interval between two crawls of a store")
+parser.add_argument("--max_revisit_hours", type=float, default=DEFAULT_MAX_REVISIT_HOURS, help="Longest interval between two crawls of a store")
+parser.add_argument("--revisit_target_share", type=float, default=DEFAULT_REVISIT_TARGET_SHARE,
+                    help="Revisit a store once about this share of its products is expected to have changed")
+parser.add_argument("--schedule_every_minutes", type=float, default=DEFAULT_SCHEDULE_EVERY_MINUTES,
+                    help="Trigger a run this often from inside the API process (0 = only when triggered over HTTP)")
+parser.add_argument("--parquet_dir", type=str, default=DEFAULT_PARQUET_DIR,
+                    help="Also write each run's products as Parquet files partitioned by store and date under this directory (needs pyarrow)")
+parser.add_argument("--http_cache_path", type=str, default=DEFAULT_HTTP_CACHE_PATH, help="SQLite file for the conditional-request HTTP cache ('' to disable)")
+parser.add_argument("--http_cache_max_mb", type=float, default=DEFAULT_HTTP_CACHE_MAX_MB, help="Max size of cached bodies before LRU eviction")
+parser.add_argument("--db_pool_size", type=int, default=DEFAULT_DB_POOL_SIZE, help="MySQL connection pool size created at startup (0 = no pool)")
+parser.add_argument("--http_pool_hosts", type=int, default=DEFAULT_HTTP_POOL_HOSTS, help="Number of per-host keep-alive pools kept by the HTTP session")
+parser.add_argument("--http_pool_maxsize", type=int, default=DEFAULT_HTTP_POOL_MAXSIZE, help="Keep-alive connections kept per host")
+parser.add_argument("--product_schema", choices=["flat", "normalized"], default=DEFAULT_PRODUCT_SCHEMA,
+                    help="flat: one products row per product (first variant only); normalized: shopify_products + product_variants rows keyed by Shopify IDs")
+parser.add_argument("--json_decoder", choices=["stream", "std"], default=DEFAULT_JSON_DECODER,
+                    help="stream: decode /products.json incrementally with ijson, one product at a time; std: response.json()")
+parser.add_argument("--server", choices=["flask", "gunicorn"], default=DEFAULT_SERVER,
+                    help="flask: Flask's development server; gunicorn: one gthread worker serving the API (needs gunicorn)")
+parser.add_argument("--server_threads", type=int, default=DEFAULT_SERVER_THREADS, help="Request threads of the gunicorn worker")
+parser.add_argument("--scrape_in", choices=["thread", "process"], default=DEFAULT_SCRAPE_IN,
+                    help="thread: crawl in a thread of the API process; process: crawl in a separate process that reports progress back")
+parser.add_argument("--parse_processes", type=int, default=DEFAULT_PARSE_PROCESSES, help="Processes that parse fetched pages (0 = parse in the fetch threads)")
 
 # This will be the single source of truth for startup configuration
 script_args = None # Will be populated in __main__
 
+# --- Connection Pooling ---
+db_pool = None # Created once at Flask startup; db_connect() falls back to plain connections without it
+db_pool_config = None
+
+def init_db_pool(db_config, pool_size):
+    """Creates the process-wide MySQL connection pool. Returns None (and logs) if MySQL is unreachable."""
+    global db_pool, db_pool_config
+    import_mysql()
+    try:
+        db_pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name="shopify_scraper", pool_size=pool_size, pool_reset_session=True, **db_config)
+        db_pool_config = dict(db_config)
+        print(f"MySQL connection pool created ({pool_size} connections to {db_config.get('database', 'N/A')}).")
+    except mysql.connector.Error as err:
+        print(f"Could not create MySQL connection pool ({err}); runs will open their own connections.")
+        db_pool, db_pool_config = None, None
+    return db_pool
+
 # --- Database Connection Function (Modified) ---
 def db_connect(current_db_config): # <<<< NOW ACCEPTS current_db_config
     """Establishes a connection to the MySQL database using the provided config."""
     if not current_db_config:
         print("Error: db_connect called with no configuration.")
         return None
+    import_mysql()
+    if db_pool is not None and current_db_config == db_pool_config:
+        try:
+            conn = db_pool.get_connection() # close() hands it back to the pool
+            print(f"Reusing pooled MySQL connection for Shopify: {current_db_config.get('database', 'N/A')}")
+            return conn
+        except mysql.connector.Error as pool_err:
+            print(f"MySQL pool unavailable ({pool_err}); opening a dedicated connection.")
     try:
         # print(f"DEBUG db_connect: Connecting with {current_db_config}") # Optional debug
         conn = mysql.connector.connect(**current_db_config)
@@ -70,204 +211,829 @@ def create_table_if_not_exists(cursor):
                 scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
             );
         """)
+        try:
+            cursor.execute("ALTER TABLE products ADD COLUMN content_hash CHAR(40) AFTER store_name;")
+        except mysql.connector.Error as alter_err:
+            if alter_err.errno == 1060: pass # Column already exists
+            else: raise
         print("Table 'products' checked/created successfully.")
     except mysql.connector.Error as err:
         print(f"Error creating table: {err}")
 
-# --- Main Scraping Logic (refactored from your original main) ---
-def run_shopify_scraper_logic(cmd_args): # cmd_args comes from the global script_args
-    # ... (DB_CONFIG setup, stores loading, REQUEST_HEADERS, db_connection, cursor, create_table as before) ...
-    print(f"Shopify scraper logic triggered with args: {cmd_args}")
-    current_run_db_config = {
-        'host': cmd_args.db_host, 'user': cmd_args.db_user,
-        'password': cmd_args.db_password, 'database': cmd_args.db_name
-    }
-    print(f"DEBUG (scraper logic): current_run_db_config set to: {current_run_db_config}")
 
+def create_normalized_tables_if_not_exist(cursor):
+    """Tables of --product_schema normalized: one row per product and per variant, keyed by Shopify's numeric IDs."""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS shopify_products (
+                product_id BIGINT UNSIGNED PRIMARY KEY,
+                store_name VARCHAR(100) NOT NULL,
+                product_url VARCHAR(1024),
+                title VARCHAR(512) NOT NULL,
+                vendor VARCHAR(255),
+                price DECIMAL(10, 2),
+                availability VARCHAR(50),
+                description TEXT,
+                category VARCHAR(255),
+                variant_count SMALLINT UNSIGNED,
+                content_hash CHAR(40),
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_shopify_products_store (store_name),
+                INDEX idx_shopify_products_category (category),
+                INDEX idx_shopify_products_price (price)
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_variants (
+                variant_id BIGINT UNSIGNED PRIMARY KEY,
+                product_id BIGINT UNSIGNED NOT NULL,
+                store_name VARCHAR(100) NOT NULL,
+                title VARCHAR(255),
+                sku VARCHAR(255),
+                price DECIMAL(10, 2),
+                compare_at_price DECIMAL(10, 2),
+                availability VARCHAR(50),
+                position SMALLINT UNSIGNED,
+                content_hash CHAR(40),
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_product_variants_product (product_id),
+                INDEX idx_product_variants_store (store_name),
+                INDEX idx_product_variants_price (price)
+            );
+        """)
+        print("Tables 'shopify_products' and 'product_variants' checked/created successfully.")
+    except mysql.connector.Error as err:
+        print(f"Error creating normalized tables: {err}")
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36'
+}
+http_session = requests.Session() # Shared by all store workers; the HTTP cache adapter is mounted per run
+http_session.headers.update(REQUEST_HEADERS)
+
+PRODUCT_COLUMNS = ('product_url', 'title', 'vendor', 'price', 'availability', 'description', 'category', 'store_name', 'content_hash')
+NORMALIZED_PRODUCT_COLUMNS = ('product_id', 'store_name', 'product_url', 'title', 'vendor', 'price', 'availability',
+                              'description', 'category', 'variant_count', 'content_hash')
+# Columns of the Parquet snapshot (no content_hash) as (name, pyarrow type) pairs
+PRODUCT_PARQUET_FIELDS = (('product_url', 'string'), ('title', 'string'), ('vendor', 'string'), ('price', 'float64'),
+                          ('availability', 'string'), ('description', 'string'), ('category', 'string'), ('store_name', 'string'))
+NORMALIZED_PRODUCT_PARQUET_FIELDS = (('product_id', 'int64'), ('store_name', 'string'), ('product_url', 'string'), ('title', 'string'),
+                                     ('vendor', 'string'), ('price', 'float64'), ('availability', 'string'), ('description', 'string'),
+                                     ('category', 'string'), ('variant_count', 'int32'))
+PARQUET_DICTIONARY_FIELDS = ('vendor', 'availability', 'category', 'store_name')
+VARIANT_COLUMNS = ('variant_id', 'product_id', 'store_name', 'title', 'sku', 'price', 'compare_at_price', 'availability',
+                   'position', 'content_hash')
+
+# --- Run Metrics ---
+METRICS_PREFIX = "shopify_scraper_" # Metric names on /metrics; the series themselves live in common.metrics
+
+# --- Product Rows ---
+def store_name_from_url(base_url):
+    store_name_parts = base_url.replace("https://www.", "").replace("https://", "").split('.')
+    return store_name_parts[0] if store_name_parts else base_url
+
+
+def build_product_row(product, base_url, store_name):
+    """Maps one /products.json entry to the column tuple of the products table."""
+    title = product.get('title', 'N/A')
+    vendor = product.get('vendor', 'N/A')
+    variants = product.get('variants', [])
+    first_variant = variants[0] if variants else {}
+    price_str = first_variant.get('price', '0.0')
+    price = float(price_str) if price_str else 0.0
+    availability = "Available" if first_variant.get('available', False) else "Out of Stock"
+    description = product.get('body_html', '')
+    category = product.get('product_type', 'N/A')
+    handle = product.get('handle')
+    product_link = f"{base_url}/products/{handle}" if handle else 'N/A'
+    return (product_link, title, vendor, price, availability, description, category, store_name)
+
+
+def build_variant_rows(product, store_name):
+    """Maps every variant of one /products.json entry to a product_variants column tuple."""
+    rows = []
+    for position, variant in enumerate(product.get('variants', []), start=1):
+        compare_at_price = variant.get('compare_at_price')
+        rows.append((variant['id'], product['id'], store_name, variant.get('title'), variant.get('sku'),
+                     float(variant.get('price') or 0.0), float(compare_at_price) if compare_at_price else None,
+                     "Available" if variant.get('available', False) else "Out of Stock", variant.get('position', position)))
+    return rows
+
+
+def build_normalized_rows(product, base_url, store_name):
+    """Maps one /products.json entry to (shopify_products tuple, product_variants tuples).
+
+    The product's price is its lowest variant price, and it is available if any variant is.
+    """
+    variant_rows = build_variant_rows(product, store_name)
+    handle = product.get('handle')
+    product_row = (product['id'], store_name, f"{base_url}/products/{handle}" if handle else 'N/A', product.get('title', 'N/A'),
+                   product.get('vendor', 'N/A'), min((row[5] for row in variant_rows), default=0.0),
+                   "Available" if any(row[7] == "Available" for row in variant_rows) else "Out of Stock",
+                   product.get('body_html', ''), product.get('product_type', 'N/A'), len(variant_rows))
+    return product_row, variant_rows
+
+
+# --- Streaming /products.json Decoding ---
+json_decoder = DEFAULT_JSON_DECODER # Set from the run arguments in run_shopify_scraper_logic
+product_schema = DEFAULT_PRODUCT_SCHEMA # Likewise; picks the row builder used by build_page_rows
+parse_pool = None # ProcessPoolExecutor of the run with --parse_processes; pages are then decoded there
+
+# Only these top-level product fields are kept; images, options, tags etc. are skipped while decoding.
+SHOPIFY_PRODUCT_FIELDS = frozenset({'id', 'title', 'vendor', 'variants', 'body_html', 'product_type', 'handle', 'updated_at'})
+
+
+def slim_product(product):
+    return {key: value for key, value in product.items() if key in SHOPIFY_PRODUCT_FIELDS}
+
+
+def iter_products_streaming(source):
+    """Yields the products of a /products.json body one at a time, building only SHOPIFY_PRODUCT_FIELDS.
+
+    `source` is any binary file-like object (the raw HTTP stream or a buffer), so the whole page
+    never exists as one Python object graph.
+    """
+    product, field, builder = None, None, None
+    for prefix, event, value in ijson.parse(source):
+        if prefix == 'products.item':
+            if event in ('map_key', 'end_map') and builder is not None:
+                product[field] = builder.value
+                builder = None
+            if event == 'start_map':
+                product = {}
+            elif event == 'map_key':
+                field = value
+                builder = ijson.ObjectBuilder() if value in SHOPIFY_PRODUCT_FIELDS else None
+            elif event == 'end_map':
+                yield product
+                product = None
+        elif builder is not None:
+            builder.event(event, value)
+
+
+def iter_counting_stream_bytes(products, response, host):
+    """Passes `products` through and, once the stream is drained, counts the bytes read off the wire."""
+    yield from products
+    run_metrics.inc('bytes_downloaded_total', response.raw.tell(), host=host)
+
+
+def fetch_products_page(url, limiter, raw=False):
+    """Fetches one /products.json page.
+
+    Returns an iterable of (slimmed) product dicts ([] past the end of the catalog), or None if the
+    page could not be fetched. In stream mode the body is decoded lazily while it is iterated.
+    With `raw`, a fetched page is returned as its undecoded body bytes instead.
+    """
+    try:
+        response = request_with_backoff(http_session, url, limiter, timeout=30, stream=True)
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        status_code = http_err.response.status_code
+        if status_code == 404:
+            print(f"{url} not found (404), likely end of products for this store.")
+            return []
+        print(f"HTTP error fetching {url}: {http_err}")
+        return None
+    except requests.exceptions.RequestException as req_err:
+        print(f"Request error fetching {url}: {req_err}")
+        return None
+
+    host = urlparse(url).netloc
+    if raw:
+        if not getattr(response, 'from_cache', False):
+            run_metrics.inc('bytes_downloaded_total', len(response.content), host=host)
+        return response.content
+    if json_decoder == "stream" and ijson is not None:
+        if response._content_consumed: # Body already buffered
+            run_metrics.inc('bytes_downloaded_total', len(response.content), host=host)
+            return iter_products_streaming(io.BytesIO(response.content))
+        if getattr(response, 'from_cache', False): # Spool file of the cached body
+            return iter_products_streaming(response.raw)
+        response.raw.decode_content = True # Let urllib3 undo gzip/deflate while we stream
+        return iter_counting_stream_bytes(iter_products_streaming(response.raw), response, host)
+
+    try:
+        data = response.json()
+    except requests.exceptions.JSONDecodeError:
+        print(f"Failed to decode JSON from {url}. Content snippet: {response.text[:200]}")
+        return None
+    if not getattr(response, 'from_cache', False):
+        run_metrics.inc('bytes_downloaded_total', len(response.content), host=host)
+    return [slim_product(product) for product in data.get("products", [])]
+
+
+def build_page_rows(products, url, base_url, store_name):
+    """Turns a page's products into rows as they are decoded.
+
+    Rows are build_product_row tuples, or build_normalized_rows pairs with the normalized schema.
+    Returns (rows, products seen on the page), or (None, 0) if the body turns out to be unreadable.
+    """
+    rows = []
+    product_count = 0
+    try:
+        for product in products:
+            product_count += 1
+            try:
+                rows.append(build_product_row(product, base_url, store_name) if product_schema == "flat"
+                            else build_normalized_rows(product, base_url, store_name))
+            except Exception as e_prod:
+                print(f"Error processing product {product.get('title', 'Unknown')}: {e_prod}")
+    except (ValueError, requests.exceptions.RequestException) as decode_err: # ijson.JSONError is a ValueError
+        print(f"Failed to decode JSON from {url}: {decode_err}")
+        return None, 0
+    return rows, product_count
+
+
+def parse_page_body(body, url, base_url, store_name, schema):
+    """build_page_rows for an undecoded page body; runs in a --parse_processes worker, which has its own globals."""
+    global product_schema
+    product_schema = schema
+    try:
+        products = json.loads(body).get("products", [])
+    except ValueError as decode_err:
+        print(f"Failed to decode JSON from {url}: {decode_err}")
+        return None, 0
+    return build_page_rows((slim_product(product) for product in products), url, base_url, store_name)
+
+
+def fetch_page_rows(base_url, store_name, page, limiter):
+    """Fetches and decodes one /products.json page. Returns (rows, products seen), (None, 0) on failure."""
+    url = f"{base_url}/products.json?page={page}&limit={SHOPIFY_PAGE_LIMIT}"
+    print(f"(Scraper Logic) Fetching: {url}")
+    products_on_page = fetch_products_page(url, limiter, raw=parse_pool is not None)
+    if products_on_page is None:
+        return None, 0
+    parse_started_at = time.monotonic()
+    if isinstance(products_on_page, bytes):
+        rows, product_count = parse_pool.submit(parse_page_body, products_on_page, url, base_url, store_name, product_schema).result()
+    else:
+        rows, product_count = build_page_rows(products_on_page, url, base_url, store_name)
+    if rows: run_metrics.observe('parse_seconds', time.monotonic() - parse_started_at, kind="products_page")
+    return rows, product_count
+
+
+def scrape_store(base_url, limiter, write_rows, checkpoint=None, job=None, page_window=DEFAULT_PAGE_WINDOW):
+    """Crawls every /products.json page of one store and hands each page's rows to `write_rows`.
+
+    Runs inside a worker thread; `write_rows` must be safe to call from several threads.
+    Pages are fetched in windows that start at one page and double up to `page_window` pages in
+    flight, so small stores cost no extra requests while big ones are fetched in parallel (the
+    host's rate limiter still decides how fast). Results are handled in page order; an empty page
+    or a 404 ends the catalog. After a page with fewer than SHOPIFY_PAGE_LIMIT products only one
+    more page is requested to confirm the end, since some stores serve smaller pages.
+    With a checkpoint, the crawl starts at the store's saved page cursor and advances it page by page.
+    Pages and products are counted on `job` as they are queued.
+    """
+    store_name = store_name_from_url(base_url)
+    if checkpoint and base_url in checkpoint.completed_scopes:
+        print(f"(Scraper Logic) Skipping {store_name}: already completed by the interrupted run.")
+        return {"store_name": store_name, "products": 0, "pages": 0, "elapsed": 0.0, "complete": True, "resumed": True}
+    start_page = checkpoint.page_cursors.get(base_url, 1) if checkpoint else 1
+    print(f"\n(Scraper Logic) Scraping store: {store_name} from {base_url}"
+          + (f" (resuming at page {start_page})" if start_page > 1 else ""))
+    started_at = time.monotonic()
+    page = start_page # Next page to hand to write_rows
+    products_this_store_count = 0
+    complete = False # True once the end of the catalog was reached, i.e. every product was seen
+    window = 1
+    page_window = max(1, page_window)
+    finished = False
+
+    with ThreadPoolExecutor(max_workers=page_window, thread_name_prefix="shopify-page") as page_pool:
+        while not finished:
+            window_pages = range(page, page + window)
+            fetches = [page_pool.submit(fetch_page_rows, base_url, store_name, p, limiter) for p in window_pages]
+            for window_page, fetch in zip(window_pages, fetches):
+                if finished:
+                    fetch.cancel() # Past the end of the catalog; drop pages fetched speculatively
+                    continue
+                rows, product_count = fetch.result()
+                if rows is None:
+                    finished = True
+                    continue
+                if product_count == 0:
+                    if window_page == 1:
+                        print(f"No products found on the first page for {store_name}. The /products.json endpoint might be disabled or empty.")
+                    else:
+                        print(f"No more products found on page {window_page} for {store_name}.")
+                        complete = True
+                    finished = True
+                    continue
+
+                products_this_store_count += write_rows(rows)
+                if checkpoint: checkpoint.advance(base_url, window_page + 1) # Saved once this page's rows are flushed
+                if job: job.advance(pages=1, products=len(rows))
+                print(f"Page {window_page} for {store_name} (found {len(rows)} products) queued for DB. Total for this store so far: {products_this_store_count}")
+                page = window_page + 1
+            # A short page is most likely the last one: confirm with a single page instead of a full window
+            window = 1 if product_count < SHOPIFY_PAGE_LIMIT else min(page_window, window * 2)
+
+    if complete and checkpoint: checkpoint.complete(base_url)
+    elapsed = time.monotonic() - started_at
+    print(f"Finished scraping {store_name}. Total products from this store: {products_this_store_count} ({elapsed:.1f}s)")
+    return {"store_name": store_name, "products": products_this_store_count, "pages": page - start_page,
+            "elapsed": elapsed, "complete": complete, "resumed": start_page > 1}
+
+# --- Main Scraping Logic (refactored from your original main) ---
+def load_stores(stores_file_path):
     stores = [] # Initialize
-    # ... (stores loading logic as you have it) ...
     try:
-        print(f"DEBUG (scraper logic): Attempting to load stores from file: {cmd_args.stores_file_path}")
-        with open(cmd_args.stores_file_path, 'r') as f:
+        print(f"DEBUG (scraper logic): Attempting to load stores from file: {stores_file_path}")
+        with open(stores_file_path, 'r') as f:
             stores_data_from_file = json.load(f)
         if isinstance(stores_data_from_file, list):
             stores = stores_data_from_file
             print(f"DEBUG (scraper logic): Stores loaded successfully: {stores}")
         else:
-            print(f"Error (scraper logic): Content of '{cmd_args.stores_file_path}' is not a valid JSON list. Using fallback.")
+            print(f"Error (scraper logic): Content of '{stores_file_path}' is not a valid JSON list. Using fallback.")
             stores = DEFAULT_STORES_LIST_CONTENT
     except Exception as e:
-        print(f"Error (scraper logic): Loading stores from '{cmd_args.stores_file_path}': {e}. Using fallback.")
+        print(f"Error (scraper logic): Loading stores from '{stores_file_path}': {e}. Using fallback.")
         stores = DEFAULT_STORES_LIST_CONTENT
+    return stores
+
+
+def select_stores(stores, requested):
+    """Picks the configured stores named in `requested` (base URLs or store names). Returns (selected, unknown)."""
+    by_key = {}
+    for base_url in stores:
+        by_key[base_url.rstrip('/')] = base_url
+        by_key[store_name_from_url(base_url)] = base_url
+    selected, unknown = [], []
+    for entry in requested:
+        base_url = by_key.get(str(entry).rstrip('/'))
+        if base_url is None:
+            unknown.append(entry)
+        elif base_url not in selected:
+            selected.append(base_url)
+    return selected, unknown
+
+
+def run_shopify_scraper_logic(cmd_args, job=None, scope=None, shard_run_id=None): # cmd_args comes from the global script_args
+    """Runs one crawl. `scope` limits it to some configured stores; progress is reported on `job`.
+
+    With --shard_mode lease, this replica only crawls the stores it claims for run `shard_run_id`
+    (defaults to the job ID when this replica is the one that was triggered).
+    """
+    global json_decoder, product_schema, parse_pool
+    print(f"Shopify scraper logic triggered with args: {cmd_args}")
+    run_metrics.reset()
+    current_run_db_config = db_config_from_args(cmd_args)
+    print(f"DEBUG (scraper logic): current_run_db_config set to: {current_run_db_config}")
+
+    stores = load_stores(cmd_args.stores_file_path)
+    if scope:
+        stores, unknown_stores = select_stores(stores, scope)
+        if unknown_stores:
+            return {"status": "error", "message": f"Stores not in the configured list: {unknown_stores}"}
+        print(f"(Scraper Logic) Scoped run over {len(stores)} stores: {stores}")
 
     if not stores:
         print("Critical (scraper logic): No stores to process. Exiting scraper logic.")
         return {"status": "error", "message": "No stores configured or loaded."}
+    job = job or ScrapeJob(None, "stores", scope)
 
-    REQUEST_HEADERS = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36'
-    }
     db_connection = db_connect(current_run_db_config)
     if not db_connection:
         print("Could not connect to database for Shopify scraper. Exiting scraper logic.")
         return {"status": "error", "message": "Database connection failed."}
 
+    scheduler = None
+    skipped_stores = []
+    if cmd_args.revisit == "adaptive":
+        scheduler = RevisitScheduler(db_connection, 'shopify', cmd_args.min_revisit_hours, cmd_args.max_revisit_hours,
+                                     cmd_args.revisit_target_share)
+        scheduler.load()
+        if not scope: # An explicitly scoped run crawls its stores whether or not they are due
+            due_stores = set(scheduler.due([store_name_from_url(base_url) for base_url in stores]))
+            skipped_stores = [base_url for base_url in stores if store_name_from_url(base_url) not in due_stores]
+            stores = [base_url for base_url in stores if store_name_from_url(base_url) in due_stores]
+            print(f"(Scraper Logic) Revisit schedule: {len(stores)} stores due, {len(skipped_stores)} skipped until their next visit.")
+        if not stores:
+            if db_connection.is_connected(): db_connection.close()
+            return {"status": "success", "message": "No Shopify stores are due for a revisit.",
+                    "revisit": {"skipped": len(skipped_stores), "next_visit_hours": {}}}
+    job.start(len(stores))
+
+    product_schema = cmd_args.product_schema
+    normalized = product_schema == "normalized"
+    # (table, key column) pairs this run writes; the first table has one row per product
+    tables = [('shopify_products', 'product_id'), ('product_variants', 'variant_id')] if normalized else [('products', 'product_url')]
+    product_table, product_key = tables[0]
     cursor = db_connection.cursor()
-    create_table_if_not_exists(cursor)
-    total_products_affected = 0
+    if normalized:
+        create_normalized_tables_if_not_exist(cursor)
+    else:
+        create_table_if_not_exists(cursor)
     
+    leases = None
+    if cmd_args.shard_mode == "lease":
+        lease_connection = db_connect(current_run_db_config)
+        if not lease_connection:
+            if cursor: cursor.close()
+            if db_connection and db_connection.is_connected(): db_connection.close()
+            return {"status": "error", "message": "Database connection for shard leases failed."}
+        leases = ShardLeases(lease_connection, 'shopify', shard_run_id or job.id or uuid.uuid4().hex[:12], cmd_args.lease_ttl).open()
+        print(f"(Scraper Logic) Sharded run {leases.run_id}: claiming stores as {leases.owner}.")
+
+    shadow = None
+    if cmd_args.scrape_mode == "full" and cmd_args.full_refresh == "swap":
+        if leases:
+            print("(Scraper Logic) Full mode, sharded: replicas write to the live tables, so --full_refresh swap is not used.")
+        else:
+            shadow = ShadowSwap(db_connection, {'shopify_products': NORMALIZED_PRODUCT_COLUMNS, 'product_variants': VARIANT_COLUMNS}
+                                if normalized else {'products': PRODUCT_COLUMNS}, 'store_name')
+
+    # Scoped and sharded runs cover only part of the store list, so they leave full-run progress alone.
+    # A swapped refresh always starts over, since its shadow tables are rebuilt.
+    checkpoint = CrawlCheckpoint(db_connection, 'shopify', enabled=not scope and not leases and not shadow)
+    run_id = leases.run_id if leases else job.id or uuid.uuid4().hex[:12]
+    feed = ChangeFeed(db_connection, 'shopify', run_id, history=cmd_args.price_history == "on", feed_path=cmd_args.change_feed_path,
+                      track=scheduler is not None)
     try:
-        delete_query = "DELETE FROM products" # Deletes all rows
-        # For safety, you could use TRUNCATE TABLE products for faster deletion if no FK constraints,
-        # but DELETE is generally safer and logs individual row deletions if binlog is enabled.
-        # delete_query = "TRUNCATE TABLE products" # Alternative, typically faster, resets AUTO_INCREMENT
-        
-        cursor.execute(delete_query)
-        deleted_rows_count = cursor.rowcount
-        db_connection.commit() # Commit the delete operation
-        print(f"(Scraper Logic) DELETED {deleted_rows_count} existing product entries from the 'products' table.")
+        if checkpoint.begin(resume=cmd_args.resume == "auto"):
+            print(f"(Scraper Logic) Resuming interrupted run: {len(checkpoint.completed_scopes)} stores done, "
+                  f"{len(checkpoint.page_cursors)} with saved page cursors.")
+        # Read before full mode empties the table, so the feed still compares against the previous run
+        if normalized: feed.load('product_variants', 'variant_id', 'price', 'availability', 'store_name')
+        else: feed.load('products', 'product_url', 'price', 'availability', 'store_name')
+        tracker, variant_tracker = DeltaTracker({}), DeltaTracker({})
+        if cmd_args.scrape_mode == "full" and checkpoint.resumed:
+            print("(Scraper Logic) Full mode: table was already emptied by the interrupted run; keeping its rows.")
+        elif cmd_args.scrape_mode == "full" and leases:
+            print("(Scraper Logic) Full mode, sharded: each store's rows are deleted when this replica claims it.")
+        elif cmd_args.scrape_mode == "full" and shadow:
+            shadow.open()
+            print(f"(Scraper Logic) Full mode, shadow swap: loading {', '.join(map(ShadowSwap.shadow_name, shadow.tables))}; "
+                  "the live tables stay readable until the swap.")
+        elif cmd_args.scrape_mode == "full":
+            where_clause = "" # Deletes all rows
+            # For safety, you could use TRUNCATE TABLE products for faster deletion if no FK constraints,
+            # but DELETE is generally safer and logs individual row deletions if binlog is enabled.
+            # delete_query = "TRUNCATE TABLE products" # Alternative, typically faster, resets AUTO_INCREMENT
+            delete_params = None
+            if scope or skipped_stores: # Only empty the stores this run is going to re-crawl
+                delete_params = [store_name_from_url(base_url) for base_url in stores]
+                where_clause = f" WHERE store_name IN ({', '.join(['%s'] * len(delete_params))})"
+
+            for table, _ in tables:
+                cursor.execute(f"DELETE FROM {table}{where_clause}", delete_params)
+                print(f"(Scraper Logic) DELETED {cursor.rowcount} existing entries from the '{table}' table.")
+            db_connection.commit() # Commit the delete operation
+        else:
+            tracker = DeltaTracker(load_existing_fingerprints(db_connection, product_table, 'store_name', product_key))
+            if normalized:
+                variant_tracker = DeltaTracker(load_existing_fingerprints(db_connection, 'product_variants', 'store_name', 'variant_id'))
+            print(f"(Scraper Logic) Incremental mode: {len(tracker.known)} stored products"
+                  + (f" and {len(variant_tracker.known)} variants" if normalized else "") + " loaded for change detection.")
     except mysql.connector.Error as err:
-        print(f"Error deleting all data from 'products' table: {err}")
+        print(f"Error preparing '{product_table}' table ({cmd_args.scrape_mode} mode): {err}")
         # CRITICAL: Decide if you want to stop if deletion fails.
         # It might be safer to stop to avoid inserting into a table with old data.
+        if leases: leases.close()
         if cursor: cursor.close()
         if db_connection and db_connection.is_connected(): db_connection.close()
-        return {"status": "error", "message": f"Failed to clear products table: {err}"}
+        return {"status": "error", "message": f"Failed to prepare products table: {err}"}
     except Exception as e_del:
-        print(f"Unexpected error during data deletion: {e_del}")
+        print(f"Unexpected error preparing '{product_table}' table: {e_del}")
+        if leases: leases.close()
         if cursor: cursor.close()
         if db_connection and db_connection.is_connected(): db_connection.close()
-        return {"status": "error", "message": f"Unexpected error clearing products table: {e_del}"}
-    # --- End of NEW deletion logic ---
+        return {"status": "error", "message": f"Unexpected error preparing products table: {e_del}"}
+    # --- End of deletion / delta-baseline logic ---
 
 
-    for base_url in stores:
-        store_name_parts = base_url.replace("https://www.", "").replace("https://", "").split('.')
-        store_name = store_name_parts[0] if store_name_parts else base_url
-        print(f"\n(Scraper Logic) Scraping store: {store_name} from {base_url}")
-        page = 1
-        products_this_store_count = 0
+    write_lock = threading.RLock() # Both writers share one connection
+    load_connection = db_connection
+    if shadow and cmd_args.shadow_load == "infile": # LOCAL INFILE has to be allowed when the connection is opened
+        load_connection = db_connect({**current_run_db_config, 'allow_local_infile': True}) or db_connection
 
-        while True:
-            url = f"{base_url}/products.json?page={page}&limit=250" # Define URL for the current page
-            print(f"(Scraper Logic) Fetching: {url}")
+    def new_writer(table, columns, on_flush=None):
+        if shadow:
+            return InfileUpserter(load_connection, ShadowSwap.shadow_name(table), columns, columns[1:], batch_size=DEFAULT_SHADOW_BATCH_ROWS,
+                                  flush_interval=cmd_args.db_flush_interval, on_flush=on_flush, lock=write_lock,
+                                  infile=cmd_args.shadow_load == "infile", insert_batch_size=cmd_args.db_batch_size)
+        return BulkUpserter(db_connection, table, columns, columns[1:], batch_size=cmd_args.db_batch_size,
+                            flush_interval=cmd_args.db_flush_interval, on_flush=on_flush, lock=write_lock)
 
-            try:
-                response = requests.get(url, headers=REQUEST_HEADERS, timeout=30)
-                response.raise_for_status()
-            except requests.exceptions.HTTPError as http_err:
-                status_code = http_err.response.status_code
-                if status_code == 404:
-                    print(f"Page {page} not found for {store_name} (404), likely end of products for this store.")
-                # ... (other HTTPError handling) ...
-                else:
-                    print(f"HTTP error fetching {url}: {http_err}")
-                break # Stop processing this store on HTTP errors
-            except requests.exceptions.RequestException as req_err:
-                print(f"Request error fetching {url}: {req_err}")
-                break # Stop processing this store
+    variant_writer = new_writer('product_variants', VARIANT_COLUMNS) if normalized else None
+
+    def on_products_flush():
+        if variant_writer: variant_writer.flush() # A page only counts as written once its variants are too
+        feed.flush()
+        checkpoint.on_flush()
+
+    writer = new_writer(product_table, NORMALIZED_PRODUCT_COLUMNS if normalized else PRODUCT_COLUMNS, on_flush=on_products_flush)
+
+    sink = None
+    if cmd_args.parquet_dir and import_pyarrow() is None:
+        print("(Scraper Logic) pyarrow is not installed; --parquet_dir is ignored.")
+    elif cmd_args.parquet_dir:
+        sink = ParquetSink(cmd_args.parquet_dir, 'shopify', run_id,
+                           NORMALIZED_PRODUCT_PARQUET_FIELDS if normalized else PRODUCT_PARQUET_FIELDS, 'store_name', PARQUET_DICTIONARY_FIELDS)
+
+    def write_rows(rows):
+        if sink: sink.add_many(rows) # The snapshot holds every product, changed or not
+        changed_rows = []
+        for row in rows:
+            content_hash = row_fingerprint(row)
+            if tracker.classify(row[0], content_hash, row[7]) != 'unchanged':
+                changed_rows.append(row + (content_hash,))
+        writer.add_many(changed_rows)
+        for row in changed_rows:
+            feed.observe(row[0], row[7], row[3], row[4])
+        return len(rows)
+
+    def write_normalized_rows(rows):
+        if sink: sink.add_many([product_row for product_row, _ in rows])
+        changed_products, changed_variants = [], []
+        for product_row, variant_rows in rows:
+            content_hash = row_fingerprint(product_row)
+            if tracker.classify(product_row[0], content_hash, product_row[1]) != 'unchanged':
+                changed_products.append(product_row + (content_hash,))
+            for variant_row in variant_rows: # Classified on their own, so a price change touches only that variant
+                variant_hash = row_fingerprint(variant_row)
+                if variant_tracker.classify(variant_row[0], variant_hash, variant_row[2]) != 'unchanged':
+                    changed_variants.append(variant_row + (variant_hash,))
+        variant_writer.add_many(changed_variants)
+        writer.add_many(changed_products)
+        for variant_row in changed_variants: # Prices live on variants in this schema
+            feed.observe(variant_row[0], variant_row[2], variant_row[5], variant_row[7])
+        return len(rows)
+
+    write_page = write_normalized_rows if normalized else write_rows
+
+    json_decoder = cmd_args.json_decoder
+    if json_decoder == "stream" and ijson is None:
+        print("(Scraper Logic) ijson is not installed; decoding /products.json pages with response.json().")
+    cache = configure_http_session(http_session, cmd_args)
+    cache_stats_before = cache.snapshot() if cache else None
+    limiter = limiter_from_args(cmd_args)
+    max_workers = max(1, min(cmd_args.max_workers, len(stores)))
+    print(f"(Scraper Logic) Crawling {len(stores)} stores with {max_workers} workers, up to {cmd_args.page_window} pages per store "
+          f"(per-host concurrency {limiter.max_concurrency}, per-host rate {limiter.initial_rate:.2f}/s adapting within "
+          f"{limiter.min_rate}-{limiter.max_rate}/s)")
+    parse_pool = open_parse_pool(cmd_args.parse_processes)
+    if parse_pool: print(f"(Scraper Logic) Decoding pages in {cmd_args.parse_processes} parse processes.")
 
+    def delete_store_rows(base_url, lease_cursor):
+        for table, _ in tables:
+            lease_cursor.execute(f"DELETE FROM {table} WHERE store_name = %s", (store_name_from_url(base_url),))
+
+    def crawl_store(base_url):
+        if not leases:
+            return scrape_store(base_url, limiter, write_page, checkpoint, job, cmd_args.page_window)
+        # Claimed only when a worker is free, so idle replicas pick up the remaining stores
+        prepare = (lambda lease_cursor: delete_store_rows(base_url, lease_cursor)) if cmd_args.scrape_mode == "full" else None
+        if not leases.claim(base_url, prepare=prepare):
+            return None
+        try:
+            return scrape_store(base_url, limiter, write_page, checkpoint, job, cmd_args.page_window)
+        finally:
+            leases.release(base_url)
+
+    run_started_at = time.monotonic()
+    store_results = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shopify-store") as executor:
+        futures = {executor.submit(crawl_store, base_url): base_url for base_url in stores}
+        for future in as_completed(futures):
             try:
-                data = response.json()
-            except requests.exceptions.JSONDecodeError:
-                print(f"Failed to decode JSON from {url}. Content snippet: {response.text[:200]}")
-                break # Stop processing this store
-
-            products_on_page = data.get("products", []) # <<<< ASSIGNMENT OF products_on_page
-
-            if not products_on_page: # Now this check is valid
-                if page == 1:
-                    print(f"No products found on the first page for {store_name}. The /products.json endpoint might be disabled or empty.")
-                else:
-                    print(f"No more products found on page {page} for {store_name}.")
-                break # End of products for this store
-
-            for product in products_on_page:
-                try:
-                    # ... (your product extraction and DB insertion logic) ...
-                    title = product.get('title', 'N/A')
-                    vendor = product.get('vendor', 'N/A')
-                    variants = product.get('variants', [])
-                    first_variant = variants[0] if variants else {}
-                    price_str = first_variant.get('price', '0.0')
-                    price = float(price_str) if price_str else 0.0
-                    availability = "Available" if first_variant.get('available', False) else "Out of Stock"
-                    description = product.get('body_html', '')
-                    category = product.get('product_type', 'N/A')
-                    handle = product.get('handle')
-                    product_link = f"{base_url}/products/{handle}" if handle else 'N/A'
-
-                    values_tuple = (
-                        product_link, title, vendor, price, availability,
-                        description, category, store_name
-                    )
-                    # Ensure your SQL query is defined here or accessible
-                    sql_query = """
-                    INSERT INTO products (product_url, title, vendor, price, availability, description, category, store_name)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        title = VALUES(title), vendor = VALUES(vendor), price = VALUES(price),
-                        availability = VALUES(availability), description = VALUES(description),
-                        category = VALUES(category), store_name = VALUES(store_name),
-                        scraped_at = CURRENT_TIMESTAMP;
-                    """
-                    cursor.execute(sql_query, values_tuple)
-                    total_products_affected += 1
-                    products_this_store_count +=1
-                except Exception as e_prod:
-                    print(f"Error processing product {product.get('title', 'Unknown')}: {e_prod}")
-
-            db_connection.commit()
-            print(f"Page {page} for {store_name} (found {len(products_on_page)} products) committed to DB. Total for this store so far: {products_this_store_count}")
-            page += 1
-            time.sleep(1.5)
-
-        print(f"Finished scraping {store_name}. Total products from this store: {products_this_store_count}")
-        time.sleep(3)
+                store_result = future.result()
+                if store_result: store_results.append(store_result)
+            except Exception as e_store:
+                print(f"Unexpected error scraping store {futures[future]}: {e_store}")
+            job.advance(stores_done=1)
+    if parse_pool:
+        parse_pool.shutdown()
+        parse_pool = None
+    if leases:
+        leases.close()
+        print(f"(Scraper Logic) This replica crawled {len(leases.claimed)} of {len(stores)} stores in sharded run {leases.run_id}.")
+    writer.close()
+    if variant_writer: variant_writer.close()
+    # A resumed store's earlier pages were not seen by this process, so only stores crawled from page 1 retire rows.
+    completed_stores = {r["store_name"] for r in store_results if r["complete"] and not r["resumed"]}
+    if load_connection is not db_connection and load_connection.is_connected(): load_connection.close()
+    shadow_result = None
+    if shadow:
+        try:
+            carried = shadow.publish(completed_stores)
+            shadow_result = {"published": True, "carried_over": carried}
+            print(f"(Scraper Logic) Shadow tables swapped in; {carried} rows of stores not crawled completely were carried over.")
+        except mysql.connector.Error as err:
+            print(f"(Scraper Logic) Publishing the shadow tables failed ({err}); the live tables are unchanged.")
+            db_connection.rollback()
+            shadow.abort()
+            shadow_result = {"published": False, "error": str(err)}
+    if cmd_args.scrape_mode == "incremental":
+        tracker.retire_unseen(db_connection, product_table, completed_stores, product_key, cmd_args.db_batch_size)
+        if normalized: variant_tracker.retire_unseen(db_connection, 'product_variants', completed_stores, 'variant_id', cmd_args.db_batch_size)
+    feed.retire((variant_tracker if normalized else tracker).seen, completed_stores)
+    feed.close()
+    if scheduler:
+        seen_by_store = (variant_tracker if normalized else tracker).seen_by_scope()
+        for store_name in completed_stores:
+            scheduler.record(store_name, seen_by_store.get(store_name, 0), feed.scope_counts.get(store_name, {}).get('changed', 0))
+        scheduler.save()
+        print(f"(Scraper Logic) Next visits in hours: {scheduler.next_visit_hours}")
+    if sink: sink.close()
+    checkpoint.finish()
+    wall_time = time.monotonic() - run_started_at
+
+    total_products_affected = writer.rows_written + tracker.counts['retired']
 
     print(f"\nShopify scraper logic finished. Total products affected: {total_products_affected}")
+    print(f"(Scraper Logic) Delta counters: {tracker.counts}" + (f", variants: {variant_tracker.counts}" if normalized else ""))
+    run_cache_stats = cache_stats_delta(cache_stats_before, cache.snapshot()) if cache else None
+    if run_cache_stats: print(f"(Scraper Logic) HTTP cache: {run_cache_stats}")
+    print(f"(Scraper Logic) Wall time {wall_time:.1f}s for {len(store_results)} stores with {max_workers} workers")
+    run_summary = {"rows_per_s": round(writer.rows_written / wall_time, 2) if wall_time > 0 else 0.0, **run_metrics.summary()}
+    print(f"(Scraper Logic) Run metrics: {run_summary}")
     if cursor: cursor.close()
     if db_connection and db_connection.is_connected(): db_connection.close()
-    return {"status": "success", "message": f"Shopify scraping finished. Products affected: {total_products_affected}"}
+    return {"status": "error" if shadow_result and not shadow_result["published"] else "success",
+            "message": f"Shopify scraping finished. Products affected: {total_products_affected}",
+            "shadow": shadow_result,
+            "wall_time_s": round(wall_time, 2),
+            "db_round_trips": writer.round_trips + (variant_writer.round_trips if variant_writer else 0),
+            "variants": variant_tracker.counts if normalized else None, "changes": feed.counts,
+            "revisit": {"skipped": len(skipped_stores), "next_visit_hours": scheduler.next_visit_hours} if scheduler else None,
+            "parquet_files": sink.files if sink else None, "resumed": checkpoint.resumed, **tracker.counts, "http_cache": run_cache_stats,
+            "host_rates": limiter.snapshot(), "metrics": run_summary,
+            "shard": {"run_id": leases.run_id, "owner": leases.owner, "stores": leases.claimed} if leases else None}
+
+
+# --- Scrape Processes ---
+scrape_worker = ScrapeWorker("shopify", "Shopify", "stores", run_shopify_scraper_logic, init_db_pool)
+atexit.register(scrape_worker.stop) # Runs before multiprocessing's own exit handler would wait for the worker
+
+
+def run_in_scrape_process(cmd_args, job, scope=None, shard_run_id=None):
+    """run_shopify_scraper_logic in the scrape worker process; its progress is applied to `job`.
+
+    The API process then only relays events, so parsing in the crawl never competes with requests for the GIL.
+    """
+    return scrape_worker.run(cmd_args, job, scope=scope, shard_run_id=shard_run_id)
+
 
 # --- Flask App Setup ---
 # ... (Flask app setup as before, no changes needed here) ...
-app = Flask(__name__)
-is_scraping_shopify = False
+jobs = JobRegistry("stores")
 scraper_thread_shopify = None
+trigger_lock = threading.Lock() # Held while checking for a running job and starting a new one
+last_run_result = None # Result (with its metrics summary) of the most recently finished run
+
+def create_app():
+    """Builds the Flask API. Flask is imported here, so processes that only run scrapes never load it."""
+    from flask import Flask, jsonify, request, Response
+    app = Flask(__name__)
+
+    @app.route('/run_shopify_scrape', methods=['POST'])
+    def trigger_shopify_scrape():
+        if script_args is None: # Should have been set in __main__
+            return jsonify({"status": "error", "message": "Script arguments not initialized."}), 500
+
+        # Optional JSON body {"stores": [...]} limits the run to some of the configured stores.
+        # "shard_run_id" is sent by the replica that fanned a sharded run out to this one.
+        body = request.get_json(silent=True) or {}
+        scope = body.get("stores")
+        shard_run_id = body.get("shard_run_id")
+        if scope is not None:
+            if not isinstance(scope, list) or not scope:
+                return jsonify({"status": "error", "message": "'stores' must be a non-empty list of store URLs or names."}), 400
+            _, unknown_stores = select_stores(load_stores(script_args.stores_file_path), scope)
+            if unknown_stores:
+                return jsonify({"status": "error", "message": f"Stores not in the configured list: {unknown_stores}"}), 400
+
+        print("API: Received request to run Shopify scraper.")
+        with trigger_lock: # Checked and started together, so two triggers (or a trigger and the timer) cannot both start a run
+            active_job = jobs.active()
+            if active_job and scraper_thread_shopify and scraper_thread_shopify.is_alive():
+                return jsonify({"status": "busy", "message": "Shopify scraping is already in progress.",
+                                "job_id": active_job.id, "status_url": f"/jobs/{active_job.id}"}), 429
+            job = start_scrape_job(scope, shard_run_id)
+
+        peers = None
+        if script_args.shard_mode == "lease" and script_args.peer_service and not shard_run_id:
+            peers = fan_out_to_peers(script_args.peer_service, '/run_shopify_scrape', job.id, int(os.environ.get("FLASK_PORT", 5001)), "stores", scope)
+
+        return jsonify({"status": "triggered", "message": "Shopify scraping process started in background.",
+                        "job_id": job.id, "status_url": f"/jobs/{job.id}",
+                        "shard_run_id": (shard_run_id or job.id) if script_args.shard_mode == "lease" else None, "peers": peers}), 202
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        return jsonify([{key: value for key, value in job.snapshot().items() if key != "result"} for job in jobs.recent()]), 200
 
-@app.route('/run_shopify_scrape', methods=['POST'])
-def trigger_shopify_scrape():
-    global is_scraping_shopify, scraper_thread_shopify, script_args
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Unknown job '{job_id}'."}), 404
+        return jsonify(job.snapshot()), 200
 
-    if script_args is None: # Should have been set in __main__
-        return jsonify({"status": "error", "message": "Script arguments not initialized."}), 500
+    @app.route('/http_cache_stats', methods=['GET'])
+    def get_http_cache_stats():
+        cache = httpcache.http_cache
+        if cache is None:
+            return jsonify({"enabled": False}), 200
+        return jsonify({"enabled": True, "path": cache.path, **cache.snapshot()}), 200
 
-    if is_scraping_shopify and scraper_thread_shopify and scraper_thread_shopify.is_alive():
-        return jsonify({"status": "busy", "message": "Shopify scraping is already in progress."}), 429
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(scrape_worker.current_metrics().render_prometheus(METRICS_PREFIX), mimetype="text/plain; version=0.0.4")
 
-    print("API: Received request to run Shopify scraper.")
-    is_scraping_shopify = True
+    @app.route('/last_run', methods=['GET'])
+    def get_last_run():
+        if last_run_result is None:
+            return jsonify({"status": "none", "message": "No Shopify run has finished yet."}), 404
+        return jsonify(last_run_result), 200
 
-    scraper_thread_shopify = threading.Thread(target=run_scraper_with_status_update_shopify, args=(script_args,))
+    @app.route('/ready', methods=['GET'])
+    def get_ready():
+        """Readiness probe: ready once whatever runs crawls (the scrape worker with --scrape_in process) takes triggers.
+
+        `db_pool` is the state of the pool those crawls use; until it is open they use direct connections.
+        """
+        if script_args is None:
+            return jsonify({"status": "starting"}), 503
+        if script_args.scrape_in == "process":
+            # Crawls run in the scrape worker, with its pool; until it is up a trigger would have to wait for it
+            if not scrape_worker.ready:
+                return jsonify({"status": "starting", "scrape_worker": False, "db_pool": None}), 503
+            return jsonify({"status": "ready", "scrape_worker": True, "db_pool": scrape_worker.db_pool}), 200
+        return jsonify({"status": "ready", "scrape_worker": None, "db_pool": db_pool is not None}), 200
+
+    return app
+
+def start_scrape_job(scope=None, shard_run_id=None):
+    """Creates a job and starts its run in the background. Callers hold trigger_lock."""
+    global scraper_thread_shopify
+    job = jobs.create(scope)
+    scraper_thread_shopify = threading.Thread(target=run_scraper_with_status_update_shopify, args=(script_args, job, shard_run_id))
     scraper_thread_shopify.start()
+    return job
+
+def run_schedule_timer(interval_s):
+    """Built-in trigger (--schedule_every_minutes): starts a run every `interval_s` seconds unless one is still going.
+
+    Combined with --revisit adaptive, each of these runs only crawls what is due.
+    """
+    while True:
+        time.sleep(interval_s)
+        with trigger_lock:
+            if scraper_thread_shopify and scraper_thread_shopify.is_alive():
+                print("Scheduler: the previous Shopify run is still in progress; skipping this tick.")
+                continue
+            job = start_scrape_job()
+        print(f"Scheduler: started Shopify run (job {job.id}).")
+
+def start_schedule_timer():
+    if script_args.schedule_every_minutes <= 0:
+        return
+    if script_args.shard_mode == "lease":
+        # Every replica would run its own timer; trigger sharded runs from outside (e.g. a CronJob) instead
+        print("Scheduler: --schedule_every_minutes is ignored with --shard_mode lease.")
+        return
+    print(f"Scheduler: triggering a Shopify run every {script_args.schedule_every_minutes:g} minutes.")
+    threading.Thread(target=run_schedule_timer, args=(script_args.schedule_every_minutes * 60,), name="shopify-schedule", daemon=True).start()
+
+def on_server_start():
+    """Runs in the serving process (the gunicorn worker) once it is up.
 
-    return jsonify({"status": "triggered", "message": "Shopify scraping process started in background."}), 202
+    The DB pool opens where crawls run: in the scrape worker with --scrape_in process, otherwise in the
+    background here, so a slow or unreachable MySQL does not hold up /ready.
+    """
+    if script_args.scrape_in == "process":
+        scrape_worker.start(script_args)
+    elif script_args.db_pool_size > 0:
+        threading.Thread(target=init_db_pool, args=(db_config_from_args(script_args), script_args.db_pool_size),
+                         name="shopify-db-pool", daemon=True).start()
+    start_schedule_timer()
 
-def run_scraper_with_status_update_shopify(current_script_args_for_thread):
-    global is_scraping_shopify
+def run_scraper_with_status_update_shopify(current_script_args_for_thread, job, shard_run_id=None):
+    global last_run_result
+    result = None
     try:
-        run_shopify_scraper_logic(current_script_args_for_thread)
+        run = run_in_scrape_process if current_script_args_for_thread.scrape_in == "process" else run_shopify_scraper_logic
+        result = last_run_result = run(current_script_args_for_thread, job=job, scope=job.scope, shard_run_id=shard_run_id)
     except Exception as e:
         print(f"Exception during Shopify scraper execution thread: {e}") # Log the error
+        result = {"status": "error", "message": f"Exception during Shopify scraping: {e}"}
     finally:
-        is_scraping_shopify = False
-        print("Shopify scraper thread finished.")
+        job.finish(result)
+        print(f"Shopify scraper thread finished (job {job.id}: {job.status}).")
 
 if __name__ == '__main__':
     script_args = parser.parse_args()
     print(f"Initial script arguments parsed: {script_args}")
 
     port = int(os.environ.get("FLASK_PORT", 5001))
-    print(f"Starting Shopify Scraper Flask API on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    if script_args.server == "gunicorn":
+        print(f"Starting Shopify Scraper API under gunicorn on port {port} ({script_args.server_threads} threads)")
+        serve_with_gunicorn(create_app(), port, script_args.server_threads, on_worker_start=on_server_start)
+    else:
+        app = create_app()
+        on_server_start()
+        print(f"Starting Shopify Scraper Flask API on port {port}")
+        app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""Shared test helpers: import paths and a recording stand-in for a MySQL connection."""
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from common import db
+
+db.import_mysql() # The common classes catch db.mysql.connector.Error
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((" ".join(sql.split()), params))
+        if self.conn.fail and self.conn.fail(sql):
+            raise db.mysql.connector.Error(msg="recorded failure")
+        self._rows = list(self.conn.respond(sql, params) or [])
+        deleting = params and sql.lstrip().upper().startswith("DELETE")
+        self.rowcount = len(params) // self.conn.params_per_row if deleting else len(self._rows)
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        self.conn.statements.append((" ".join(sql.split()), seq_params))
+        if self.conn.fail and self.conn.fail(sql):
+            raise db.mysql.connector.Error(msg="recorded failure")
+        self.rowcount = len(seq_params)
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    """Records every statement as (normalized SQL, params).
+
+    `respond(sql, params)` returns the rows a SELECT should see. `fail(sql)` returning True makes that
+    execute raise mysql.connector.Error. A DELETE reports one affected row per `params_per_row` parameters.
+    """
+    def __init__(self, respond=None, fail=None, params_per_row=1):
+        self.respond = respond or (lambda sql, params: [])
+        self.fail = fail
+        self.params_per_row = params_per_row
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+    def sql(self, prefix=""):
+        """Recorded statements that start with `prefix`."""
+        return [sql for sql, _ in self.statements if sql.startswith(prefix)]
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import unittest
+
+from support import RecordingConnection
+
+from common.checkpoint import CrawlCheckpoint
+
+
+def stored_run(finished_at, checkpoints=(), urls=()):
+    """Responder for a database holding one crawl_runs row and the given checkpoint rows."""
+    def respond(sql, params):
+        if sql.startswith("SELECT finished_at"):
+            return [(finished_at,)]
+        if sql.startswith("SELECT scope, next_page"):
+            return list(checkpoints)
+        if sql.startswith("SELECT scope, product_url"):
+            return list(urls)
+        return []
+    return respond
+
+
+class BeginTest(unittest.TestCase):
+    def test_resumes_unfinished_run(self):
+        conn = RecordingConnection(stored_run(None, [('store-a', 3, False), ('store-b', 5, True)], [('cat', 'https://x/p1')]))
+        checkpoint = CrawlCheckpoint(conn, 'shopify')
+        self.assertTrue(checkpoint.begin())
+        self.assertEqual(checkpoint.page_cursors, {'store-a': 3, 'store-b': 5})
+        self.assertEqual(checkpoint.completed_scopes, {'store-b'})
+        self.assertEqual(checkpoint.done_urls, {'cat': {'https://x/p1'}})
+        self.assertEqual(conn.sql("DELETE"), [])
+
+    def test_finished_run_starts_fresh(self):
+        conn = RecordingConnection(stored_run('2024-01-01 00:00:00', [('store-a', 3, False)]))
+        checkpoint = CrawlCheckpoint(conn, 'shopify')
+        self.assertFalse(checkpoint.begin())
+        self.assertEqual(checkpoint.page_cursors, {})
+        self.assertEqual(len(conn.sql("DELETE FROM crawl_checkpoint")), 2)
+        self.assertEqual(len(conn.sql("REPLACE INTO crawl_runs")), 1)
+
+    def test_resume_never_starts_fresh(self):
+        conn = RecordingConnection(stored_run(None, [('store-a', 3, False)]))
+        self.assertFalse(CrawlCheckpoint(conn, 'shopify').begin(resume=False))
+        self.assertEqual(len(conn.sql("REPLACE INTO crawl_runs")), 1)
+
+    def test_disabled_checkpoint_touches_nothing(self):
+        conn = RecordingConnection(stored_run(None))
+        checkpoint = CrawlCheckpoint(conn, 'shopify', enabled=False)
+        self.assertFalse(checkpoint.begin())
+        checkpoint.advance('store-a', 2)
+        checkpoint.on_flush()
+        checkpoint.finish()
+        self.assertEqual(conn.statements, [])
+
+
+class OnFlushTest(unittest.TestCase):
+    def test_persists_marks_once(self):
+        conn = RecordingConnection()
+        checkpoint = CrawlCheckpoint(conn, 'woo')
+        checkpoint.advance('A', 2)
+        checkpoint.complete('B')
+        checkpoint.url_done('A', 'https://x/p1')
+        checkpoint.on_flush()
+        (_, cursor_rows), (_, url_rows) = conn.statements
+        self.assertEqual(sorted(cursor_rows), [('woo', 'A', 2, False), ('woo', 'B', 1, True)])
+        self.assertEqual([(scope, url) for _, _, scope, url in url_rows], [('A', 'https://x/p1')])
+        checkpoint.on_flush()
+        self.assertEqual(len(conn.statements), 2) # Nothing new to persist
+
+    def test_failed_save_keeps_marks_for_next_flush(self):
+        failing = [True]
+        conn = RecordingConnection(fail=lambda sql: failing[0])
+        checkpoint = CrawlCheckpoint(conn, 'woo')
+        checkpoint.advance('A', 4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            checkpoint.on_flush()
+        self.assertEqual(conn.rollbacks, 1)
+        failing[0] = False
+        checkpoint.on_flush()
+        self.assertEqual(conn.statements[-1][1], [('woo', 'A', 4, False)])
+        self.assertIn("next_page = GREATEST(next_page, VALUES(next_page))", conn.statements[-1][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import unittest
+
+from support import RecordingConnection
+
+from common.delta import DeltaTracker, row_fingerprint
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_kinds(self):
+        tracker = DeltaTracker({'same': ('h1', 'A'), 'moved': ('h1', 'A')})
+        self.assertEqual(tracker.classify('same', 'h1', 'A'), 'unchanged')
+        self.assertEqual(tracker.classify('moved', 'h2', 'A'), 'updated')
+        self.assertEqual(tracker.classify('new', 'h3', 'B'), 'inserted')
+        self.assertEqual(tracker.counts, {'inserted': 1, 'updated': 1, 'unchanged': 1, 'retired': 0})
+
+    def test_fingerprint_covers_every_value(self):
+        self.assertNotEqual(row_fingerprint(('u', 'A', '1')), row_fingerprint(('u', 'A', '2')))
+        self.assertEqual(row_fingerprint(('u', None)), row_fingerprint(('u', None)))
+
+    def test_first_scope_is_run_local(self):
+        tracker = DeltaTracker({'u': ('h', 'Stored')}) # Stored under another category by an earlier run
+        self.assertEqual(tracker.first_scope('u', 'A'), 'A')
+        self.assertEqual(tracker.first_scope('u', 'B'), 'A')
+
+
+class RetireUnseenTest(unittest.TestCase):
+    def tracker(self, keys, scope='A'):
+        return DeltaTracker({key: ('h', scope) for key in keys})
+
+    def test_deletes_in_batches(self):
+        tracker = self.tracker([f"u{i}" for i in range(7)])
+        conn = RecordingConnection()
+        self.assertEqual(tracker.retire_unseen(conn, 'products', {'A'}, batch_size=3), 7)
+        self.assertEqual([len(params) for _, params in conn.statements], [3, 3, 1])
+        self.assertEqual(conn.sql()[0], "DELETE FROM products WHERE product_url IN (%s, %s, %s)")
+        self.assertEqual(conn.commits, 3)
+        self.assertEqual(sorted(key for _, params in conn.statements for key in params), sorted(f"u{i}" for i in range(7)))
+
+    def test_only_unseen_rows_of_completed_scopes(self):
+        tracker = DeltaTracker({'seen': ('h', 'A'), 'marked': ('h', 'A'), 'stale': ('h', 'A'), 'other': ('h', 'B')})
+        tracker.classify('seen', 'h', 'A')
+        tracker.mark_seen('marked')
+        conn = RecordingConnection()
+        tracker.retire_unseen(conn, 'products', {'A'})
+        self.assertEqual(conn.statements, [("DELETE FROM products WHERE product_url IN (%s)", ['stale'])])
+
+    def test_custom_key_column(self):
+        conn = RecordingConnection()
+        self.tracker(['v1']).retire_unseen(conn, 'product_variants', {'A'}, 'variant_id')
+        self.assertEqual(conn.sql(), ["DELETE FROM product_variants WHERE variant_id IN (%s)"])
+
+    def test_nothing_to_retire(self):
+        conn = RecordingConnection()
+        self.assertEqual(self.tracker(['u']).retire_unseen(conn, 'products', set()), 0)
+        self.assertEqual(conn.statements, [])
+
+    def test_error_rolls_back(self):
+        conn = RecordingConnection(fail=lambda sql: True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(self.tracker(['u']).retire_unseen(conn, 'products', {'A'}), 0)
+        self.assertEqual((conn.commits, conn.rollbacks), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
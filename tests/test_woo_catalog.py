@@ -0,0 +1,147 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+from support import REPO_DIR, RecordingConnection
+
+sys.path.insert(0, os.path.join(REPO_DIR, "woo"))
+import Scrapping_Woo as woo
+
+STORE = "https://shop.example"
+CATEGORY_URL = f"{STORE}/product-category/buttons/"
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, content_type="application/json", total_pages=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = {'Content-Type': content_type}
+        if total_pages is not None: self.headers['X-WP-TotalPages'] = str(total_pages)
+        self.content = b"{}"
+
+    def json(self):
+        if self.payload is None:
+            raise ValueError("not JSON")
+        return self.payload
+
+
+def api_item(n):
+    return {'permalink': f"{STORE}/product/item-{n}/", 'name': f"Item {n}", 'sku': f"S{n}", 'tags': [],
+            'prices': {'price': '1250', 'currency_minor_unit': 2, 'currency_prefix': '$'}}
+
+
+class StoreAPIFallbackTest(unittest.TestCase):
+    """Which listing source iter_category_pages reads for each first-page answer of the Store API."""
+    def setUp(self):
+        self.api_requests = []
+        self.html_listings = []
+        self.responses = []
+        patches = [
+            mock.patch.object(woo, 'catalog_source', "auto"),
+            mock.patch.object(woo, 'store_api_disabled', set()),
+            mock.patch.object(woo, 'request_with_backoff', self.fake_request),
+            mock.patch.object(woo, 'iter_product_link_pages', self.fake_html_listing),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def fake_request(self, session, url, limiter, **kwargs):
+        self.api_requests.append(url)
+        return self.responses.pop(0)
+
+    def fake_html_listing(self, category_url):
+        self.html_listings.append(category_url)
+        yield [f"{STORE}/product/html-1/"]
+
+    def pages(self, category_url=CATEGORY_URL):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return list(woo.iter_category_pages(category_url))
+
+    def test_store_api_listing(self):
+        self.responses = [FakeResponse(200, [api_item(1), api_item(2)], total_pages=1)]
+        (page,) = self.pages()
+        self.assertEqual([link for link, _ in page], [f"{STORE}/product/item-1/", f"{STORE}/product/item-2/"])
+        self.assertEqual(page[0][1], {'title': "Item 1", 'price': "$12.50", 'tag': 'N/A', 'sku': "S1"})
+        self.assertIn("category=buttons", self.api_requests[0])
+        self.assertEqual(self.html_listings, [])
+
+    def test_missing_api_falls_back_to_html_for_the_rest_of_the_run(self):
+        for status in woo.STORE_API_UNAVAILABLE_STATUSES:
+            with self.subTest(status=status):
+                woo.store_api_disabled.clear()
+                self.api_requests, self.html_listings = [], []
+                self.responses = [FakeResponse(status, content_type="text/html")]
+                self.assertEqual(self.pages(), [[(f"{STORE}/product/html-1/", None)]])
+                self.assertEqual(woo.store_api_disabled, {STORE})
+                self.pages(f"{STORE}/product-category/other/") # Same store: the API is not asked again
+                self.assertEqual(len(self.api_requests), 1)
+                self.assertEqual(len(self.html_listings), 2)
+
+    def test_html_answer_on_first_page_falls_back(self):
+        self.responses = [FakeResponse(200, content_type="text/html; charset=UTF-8")]
+        self.assertEqual(self.pages(), [[(f"{STORE}/product/html-1/", None)]])
+        self.assertEqual(woo.store_api_disabled, {STORE})
+
+    def test_overloaded_store_does_not_fall_back(self):
+        for status in (429, 503):
+            with self.subTest(status=status):
+                self.responses = [FakeResponse(status, content_type="text/html")]
+                with self.assertRaises(woo.StoreAPIError):
+                    self.pages()
+                self.assertEqual(woo.store_api_disabled, set())
+                self.assertEqual(self.html_listings, [])
+
+    def test_later_page_failure_leaves_category_incomplete(self):
+        self.responses = [FakeResponse(200, [api_item(n) for n in range(woo.STORE_API_PAGE_SIZE)], total_pages=2),
+                          FakeResponse(404, content_type="text/html")]
+        with self.assertRaises(woo.StoreAPIError) as raised:
+            self.pages()
+        self.assertNotIsInstance(raised.exception, woo.StoreAPIUnavailable)
+        self.assertEqual(woo.store_api_disabled, set())
+
+    def test_store_api_only_source_does_not_fall_back(self):
+        self.responses = [FakeResponse(404, content_type="text/html")]
+        with mock.patch.object(woo, 'catalog_source', "store_api"), self.assertRaises(woo.StoreAPIUnavailable):
+            self.pages()
+        self.assertEqual(self.html_listings, [])
+
+    def test_html_source_never_asks_the_api(self):
+        with mock.patch.object(woo, 'catalog_source', "html"):
+            self.pages()
+        self.assertEqual(self.api_requests, [])
+        self.assertEqual(len(self.html_listings), 1)
+
+
+class URLFrontierTest(unittest.TestCase):
+    def test_shared_and_done_urls(self):
+        frontier = woo.URLFrontier("run-1")
+        frontier.seed_done([f"{STORE}/product/old/"])
+        self.assertTrue(frontier.add(f"{STORE}/product/a/", 'A'))
+        self.assertFalse(frontier.add(f"{STORE}/product/a/", 'B'))
+        self.assertFalse(frontier.add(f"{STORE}/product/old/", 'A'))
+        self.assertEqual((frontier.counts['unique'], frontier.counts['shared'], frontier.counts['done']), (1, 1, 1))
+
+    def test_only_new_memberships_are_written(self):
+        stored_hash = woo.hashlib.sha1(f"{STORE}/product/a/".encode('utf-8')).hexdigest()
+        writer = mock.Mock()
+        frontier = woo.URLFrontier("run-1", writer).load(RecordingConnection(lambda sql, params: [(stored_hash, 'A')]))
+        frontier.add(f"{STORE}/product/a/", 'A')
+        frontier.add(f"{STORE}/product/a/", 'B')
+        writer.add.assert_called_once_with((stored_hash, 'B', f"{STORE}/product/a/", "run-1"))
+        self.assertEqual(frontier.counts['memberships_added'], 1)
+
+    def test_retire_deletes_unlisted_memberships_in_batches(self):
+        stored = [(f"{n:040x}", 'A') for n in range(5)] + [(f"{9:040x}", 'B')]
+        frontier = woo.URLFrontier("run-1").load(RecordingConnection(lambda sql, params: stored))
+        conn = RecordingConnection(params_per_row=2) # (url_hash, category) pairs
+        self.assertEqual(frontier.retire(conn, {'A'}, batch_size=2), 5)
+        self.assertEqual([len(params) // 2 for _, params in conn.statements], [2, 2, 1])
+        self.assertNotIn(f"{9:040x}", [value for _, params in conn.statements for value in params])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import unittest
+
+from support import RecordingConnection
+
+from common.writers import BulkUpserter, _infile_field
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+class BulkUpserterSQLTest(unittest.TestCase):
+    def test_multi_row_upsert(self):
+        conn = RecordingConnection()
+        writer = BulkUpserter(conn, 'products', ('product_url', 'title', 'price'), ('title', 'price'), batch_size=10)
+        writer.add_many([('u1', 'A', '1'), ('u2', 'B', '2')])
+        with quiet():
+            writer.close()
+        (sql, params), = conn.statements
+        self.assertEqual(sql, "INSERT INTO products (product_url, title, price) VALUES (%s, %s, %s), (%s, %s, %s) "
+                              "ON DUPLICATE KEY UPDATE title = VALUES(title), price = VALUES(price), scraped_at = CURRENT_TIMESTAMP")
+        self.assertEqual(params, ['u1', 'A', '1', 'u2', 'B', '2'])
+        self.assertEqual((writer.rows_written, writer.round_trips, conn.commits), (2, 1, 1))
+
+    def test_insert_ignore_without_updates(self):
+        conn = RecordingConnection()
+        writer = BulkUpserter(conn, 'memberships', ('url_hash', 'category'), (), extra_updates=())
+        writer.add(('h', 'A'))
+        writer.flush()
+        self.assertEqual(conn.sql(), ["INSERT IGNORE INTO memberships (url_hash, category) VALUES (%s, %s)"])
+
+    def test_flushes_in_batches(self):
+        conn = RecordingConnection()
+        writer = BulkUpserter(conn, 't', ('k', 'v'), ('v',), batch_size=2, flush_interval=0)
+        writer.add(('0', 'x'))
+        self.assertEqual(conn.statements, []) # Below batch_size: still buffered
+        writer.add_many([(str(i), 'x') for i in range(1, 5)])
+        self.assertEqual([len(params) for _, params in conn.statements], [4, 4, 2])
+        self.assertEqual((writer.rows_written, writer.round_trips), (5, 3))
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        conn = RecordingConnection(fail=lambda sql: sql.count("(%s, %s)") > 1)
+        writer = BulkUpserter(conn, 't', ('k', 'v'), ('v',), batch_size=10)
+        writer.add_many([('a', '1'), ('b', '2')])
+        with quiet():
+            self.assertEqual(writer.flush(), 2)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual([params for _, params in conn.statements[1:]], [('a', '1'), ('b', '2')])
+
+    def test_on_flush_runs_after_commit(self):
+        conn = RecordingConnection()
+        commits_seen = []
+        writer = BulkUpserter(conn, 't', ('k',), (), extra_updates=(), on_flush=lambda: commits_seen.append(conn.commits))
+        writer.add(('a',))
+        writer.flush()
+        self.assertEqual(commits_seen, [1])
+
+
+class InfileFieldTest(unittest.TestCase):
+    def test_null_and_escapes(self):
+        self.assertEqual(_infile_field(None), "\\N")
+        self.assertEqual(_infile_field('a"b\\c\nd'), '"a\\"b\\\\c\\nd"')
+        self.assertEqual(_infile_field(12), '"12"')
+
+
+if __name__ == "__main__":
+    unittest.main()
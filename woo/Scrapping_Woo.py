@@ -1,12 +1,48 @@
-from requests_html import HTMLSession
+import requests
+import lxml.html
+from lxml.cssselect import CSSSelector
 import time
-import mysql.connector
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse, urlencode
+from html import unescape
 import argparse
 import json
-from flask import Flask, jsonify, request # Import Flask
 import threading # For background tasks
+import sys
 import os # For environment variables like FLASK_PORT
+import hashlib
+import uuid
+import queue
+import atexit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The common package sits at the repository root
+from common import db, httpcache
+from common.changes import ChangeFeed
+from common.checkpoint import CrawlCheckpoint
+from common.db import db_config_from_args
+from common.delta import DeltaTracker, load_existing_fingerprints, row_fingerprint
+from common.fetch import DEFAULT_MAX_HOST_RATE, DEFAULT_MIN_HOST_RATE, HostRateLimiter, limiter_from_args, request_with_backoff
+from common.httpcache import cache_stats_delta, configure_http_session
+from common.jobs import JobRegistry, ScrapeJob
+from common.metrics import run_metrics
+from common.parquet_sink import ParquetSink, import_pyarrow
+from common.revisit import DEFAULT_MAX_REVISIT_HOURS, DEFAULT_MIN_REVISIT_HOURS, DEFAULT_REVISIT_TARGET_SHARE, RevisitScheduler
+from common.server import serve_with_gunicorn
+from common.sharding import DEFAULT_LEASE_TTL, ShardLeases, fan_out_to_peers
+from common.workers import ScrapeWorker, open_parse_pool
+from common.writers import BulkUpserter, InfileUpserter, ShadowSwap
+
+# --- Deferred Imports ---
+# mysql.connector, pyarrow and flask are imported on first use rather than here: spawned scrape and
+# parse processes import this module too, and the API should answer /ready before MySQL is needed.
+mysql = None # Bound by import_mysql()
+
+
+def import_mysql():
+    """Imports mysql.connector (and its pooling module) on first use, here and in the common package."""
+    global mysql
+    if mysql is None:
+        mysql = db.import_mysql()
+    return mysql
 
 # --- Default Configurations ---
 DEFAULT_DB_CONFIG_DEFAULTS = { # Renamed for clarity
@@ -16,6 +52,34 @@ DEFAULT_DB_CONFIG_DEFAULTS = { # Renamed for clarity
     'database': 'scrap_test'
 }
 DEFAULT_CATEGORIES_FILE = "woo_stores.json"
+DEFAULT_DB_BATCH_SIZE = 100
+DEFAULT_DB_FLUSH_INTERVAL = 30.0 # Seconds; products trickle in one per request, so flush partial batches periodically
+DEFAULT_SCRAPE_MODE = "incremental"
+DEFAULT_RESUME = "auto"
+DEFAULT_FULL_REFRESH = "delete" # "swap" loads a full refresh into shadow tables and publishes them with RENAME TABLE
+DEFAULT_SHADOW_LOAD = "infile" # How rows reach the shadow tables: LOAD DATA LOCAL INFILE, or "insert" for multi-row inserts
+DEFAULT_SHADOW_BATCH_ROWS = 50000 # Rows spooled per LOAD DATA
+DEFAULT_SHARD_MODE = "off"
+DEFAULT_PRICE_HISTORY = "on" # Append price/availability changes to the price_history table
+DEFAULT_CHANGE_FEED_PATH = "" # Disabled; enable with a file on persistent storage (a container's working directory is lost on restart)
+DEFAULT_PARQUET_DIR = "" # Root of the Parquet snapshots; empty string disables the sink
+DEFAULT_REVISIT = "off" # "adaptive" only crawls the scopes the revisit scheduler says are due
+DEFAULT_SCHEDULE_EVERY_MINUTES = 0 # Built-in timer that triggers runs (0 = only on POST)
+DEFAULT_HTTP_CACHE_PATH = "http_cache.sqlite" # Empty string disables the cache
+DEFAULT_HTTP_CACHE_MAX_MB = 256
+DEFAULT_DB_POOL_SIZE = 4 # MySQL connections kept open between runs (0 disables the pool)
+DEFAULT_HTTP_POOL_HOSTS = 8 # Hosts whose keep-alive connection pools are kept
+DEFAULT_HTTP_POOL_MAXSIZE = 8 # Keep-alive connections kept per host
+DEFAULT_PIPELINE_WORKERS = 4
+DEFAULT_PIPELINE_QUEUE_SIZE = 50 # Bounded queues between stages; producers block when they are full
+DEFAULT_PER_HOST_CONCURRENCY = 4
+DEFAULT_PER_HOST_DELAY = 0.5 # Min seconds between two request starts to the same host
+DEFAULT_HTML_PARSER = "lxml" # "requests_html" keeps the previous pyquery-based path
+DEFAULT_CATALOG_SOURCE = "auto" # Store API first, HTML scraping for stores that disable it
+DEFAULT_SERVER = "flask" # "gunicorn" serves the API from one gthread worker, for production
+DEFAULT_SERVER_THREADS = 8 # Request threads of the gunicorn worker
+DEFAULT_SCRAPE_IN = "thread" # "process" runs each crawl in its own process, so it never holds the API's GIL
+DEFAULT_PARSE_PROCESSES = 0 # Processes CPU-bound page parsing is spread over (0 = parse in the fetch threads)
 DEFAULT_CATEGORIES_CONTENT = [
     {'name': 'Version 1', 'url': 'https://barefootbuttons.com/product-category/version-1/'},
     {'name': 'Version 2', 'url': 'https://barefootbuttons.com/product-category/version-2/'},
@@ -30,15 +94,88 @@ parser.add_argument("--db_user", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['u
 parser.add_argument("--db_password", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['password'], help="Database password")
 parser.add_argument("--db_name", type=str, default=DEFAULT_DB_CONFIG_DEFAULTS['database'], help="Database name")
 parser.add_argument("--categories_file_path", type=str, default=DEFAULT_CATEGORIES_FILE, help="Path to categories JSON file")
+parser.add_argument("--db_batch_size", type=int, default=DEFAULT_DB_BATCH_SIZE, help="Rows per multi-row upsert")
+parser.add_argument("--db_flush_interval", type=float, default=DEFAULT_DB_FLUSH_INTERVAL, help="Max seconds rows wait in the write buffer")
+parser.add_argument("--scrape_mode", choices=["incremental", "full"], default=DEFAULT_SCRAPE_MODE,
+                    help="incremental: write only changed rows and retire unseen ones; full: empty the table first")
+parser.add_argument("--full_refresh", choices=["delete", "swap"], default=DEFAULT_FULL_REFRESH,
+                    help="How --scrape_mode full replaces rows. delete: empty the table first; swap: fill shadow tables, then swap them in atomically")
+parser.add_argument("--shadow_load", choices=["infile", "insert"], default=DEFAULT_SHADOW_LOAD,
+                    help="infile: LOAD DATA LOCAL INFILE from spooled CSV batches (falls back to insert if refused); insert: multi-row inserts")
+parser.add_argument("--resume", choices=["auto", "never"], default=DEFAULT_RESUME,
+                    help="auto: continue an interrupted run from its checkpoints; never: always start over")
+parser.add_argument("--shard_mode", choices=["off", "lease"], default=DEFAULT_SHARD_MODE,
+                    help="lease: replicas split the work by claiming scopes in the crawl_leases table")
+parser.add_argument("--peer_service", type=str, default="", help="Headless service name resolving to all replicas; a trigger fans out to them")
+parser.add_argument("--lease_ttl", type=int, default=DEFAULT_LEASE_TTL, help="Seconds before an unrenewed lease can be taken over")
+parser.add_argument("--price_history", choices=["on", "off"], default=DEFAULT_PRICE_HISTORY,
+                    help="Append an event to the price_history table whenever a product's price or availability changes")
+parser.add_argument("--change_feed_path", type=str, default=DEFAULT_CHANGE_FEED_PATH, help="NDJSON file the change events are appended to ('' to disable)")
+parser.add_argument("--revisit", choices=["off", "adaptive"], default=DEFAULT_REVISIT,
+                    help="adaptive: crawl only the categories due for a revisit, spaced by their learned change rate")
+parser.add_argument("--min_revisit_hours", type=float, default=DEFAULT_MIN_REVISIT_HOURS, help="Shortest interval between two crawls of a category")
+parser.add_argument("--max_revisit_hours", type=float, default=DEFAULT_MAX_REVISIT_HOURS, help="Longest interval between two crawls of a category")
+parser.add_argument("--revisit_target_share", type=float, default=DEFAULT_REVISIT_TARGET_SHARE,
+                    help="Revisit a category once about this share of its products is expected to have changed")
+parser.add_argument("--schedule_every_minutes", type=float, default=DEFAULT_SCHEDULE_EVERY_MINUTES,
+                    help="Trigger a run this often from inside the API process (0 = only when triggered over HTTP)")
+parser.add_argument("--parquet_dir", type=str, default=DEFAULT_PARQUET_DIR,
+                    help="Also write each run's products as Parquet files partitioned by store and date under this directory (needs pyarrow)")
+parser.add_argument("--http_cache_path", type=str, default=DEFAULT_HTTP_CACHE_PATH, help="SQLite file for the conditional-request HTTP cache ('' to disable)")
+parser.add_argument("--http_cache_max_mb", type=float, default=DEFAULT_HTTP_CACHE_MAX_MB, help="Max size of cached bodies before LRU eviction")
+parser.add_argument("--db_pool_size", type=int, default=DEFAULT_DB_POOL_SIZE, help="MySQL connection pool size created at startup (0 = no pool)")
+parser.add_argument("--http_pool_hosts", type=int, default=DEFAULT_HTTP_POOL_HOSTS, help="Number of per-host keep-alive pools kept by the HTTP session")
+parser.add_argument("--http_pool_maxsize", type=int, default=DEFAULT_HTTP_POOL_MAXSIZE, help="Keep-alive connections kept per host")
+parser.add_argument("--workers", type=int, default=DEFAULT_PIPELINE_WORKERS, help="Product page fetch/parse worker threads")
+parser.add_argument("--queue_size", type=int, default=DEFAULT_PIPELINE_QUEUE_SIZE, help="Capacity of the queues between pipeline stages (backpressure)")
+parser.add_argument("--per_host_concurrency", type=int, default=DEFAULT_PER_HOST_CONCURRENCY, help="Max in-flight requests per host")
+parser.add_argument("--per_host_delay", type=float, default=DEFAULT_PER_HOST_DELAY, help="Initial seconds between requests to the same host (the rate then adapts)")
+parser.add_argument("--min_host_rate", type=float, default=DEFAULT_MIN_HOST_RATE, help="Lowest requests/s a host is slowed down to after 429/5xx")
+parser.add_argument("--max_host_rate", type=float, default=DEFAULT_MAX_HOST_RATE, help="Highest requests/s a fast, healthy host is sped up to")
+parser.add_argument("--html_parser", choices=["lxml", "requests_html"], default=DEFAULT_HTML_PARSER, help="Engine used to extract data from HTML pages")
+parser.add_argument("--catalog_source", choices=["auto", "store_api", "html"], default=DEFAULT_CATALOG_SOURCE,
+                    help="auto: read the WooCommerce Store API, falling back to HTML scraping where it is disabled; store_api/html: only that source")
+parser.add_argument("--server", choices=["flask", "gunicorn"], default=DEFAULT_SERVER,
+                    help="flask: Flask's development server; gunicorn: one gthread worker serving the API (needs gunicorn)")
+parser.add_argument("--server_threads", type=int, default=DEFAULT_SERVER_THREADS, help="Request threads of the gunicorn worker")
+parser.add_argument("--scrape_in", choices=["thread", "process"], default=DEFAULT_SCRAPE_IN,
+                    help="thread: crawl in a thread of the API process; process: crawl in a separate process that reports progress back")
+parser.add_argument("--parse_processes", type=int, default=DEFAULT_PARSE_PROCESSES, help="Processes that parse fetched pages (0 = parse in the fetch threads)")
 
 # Global variable to store parsed arguments from container startup
 script_args = None
 
+# --- Connection Pooling ---
+db_pool = None # Created once at Flask startup; db_connect() falls back to plain connections without it
+db_pool_config = None
+
+def init_db_pool(db_config, pool_size):
+    """Creates the process-wide MySQL connection pool. Returns None (and logs) if MySQL is unreachable."""
+    global db_pool, db_pool_config
+    import_mysql()
+    try:
+        db_pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name="woo_scraper", pool_size=pool_size, pool_reset_session=True, **db_config)
+        db_pool_config = dict(db_config)
+        print(f"MySQL connection pool for Woo created ({pool_size} connections to {db_config.get('database', 'N/A')}).")
+    except mysql.connector.Error as err:
+        print(f"Could not create MySQL connection pool for Woo ({err}); runs will open their own connections.")
+        db_pool, db_pool_config = None, None
+    return db_pool
+
 # --- Database Connection Function (accepts config) ---
 def db_connect(current_db_config):
     if not current_db_config:
         print("Error: db_connect called with no configuration for Woo scraper.")
         return None
+    import_mysql()
+    if db_pool is not None and current_db_config == db_pool_config:
+        try:
+            conn = db_pool.get_connection() # close() hands it back to the pool
+            print(f"Reusing pooled MySQL connection for Woo: {current_db_config.get('database', 'N/A')}")
+            return conn
+        except mysql.connector.Error as pool_err:
+            print(f"MySQL pool unavailable ({pool_err}); opening a dedicated connection.")
     try:
         conn = mysql.connector.connect(**current_db_config)
         print(f"Successfully connected to MySQL database for Woo: {current_db_config.get('database', 'N/A')}")
@@ -58,11 +195,13 @@ def db_connect(current_db_config):
 # the config created within run_woo_scraper_logic.
 # For simplicity, the db_connect used by these will be the one called inside run_woo_scraper_logic.
 
-# --- Global Session for requests_html (initialized once) ---
+# --- Global HTTP Session (initialized once) ---
 # It's better to initialize session and headers once if they are global.
 # If run_woo_scraper_logic might be called truly concurrently (unlikely with current threading model for one script),
 # you might need thread-local sessions or pass sessions around. For now, global is fine.
-html_session = HTMLSession()
+# A plain requests session: pages are never rendered with JS, so requests_html's HTMLSession (which imports
+# pyppeteer) is not needed to fetch them. The requests_html engine builds its documents from the bytes instead.
+html_session = requests.Session()
 REQUEST_HEADERS = { # Renamed from HEADERS to avoid conflict if Flask uses HEADERS
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36'
 }
@@ -84,130 +223,625 @@ def create_barefoot_table_if_not_exists(cursor):
                 scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
             );
         """)
-        try:
-            cursor.execute("ALTER TABLE barefoot_products ADD COLUMN category VARCHAR(100) AFTER sku;")
-            # print("Ensured 'category' column exists in 'barefoot_products'.") # Less verbose
-        except mysql.connector.Error as alter_err:
-            if alter_err.errno == 1060: pass
-            else: raise
+        for alter_sql in ("ALTER TABLE barefoot_products ADD COLUMN category VARCHAR(100) AFTER sku;",
+                          "ALTER TABLE barefoot_products ADD COLUMN content_hash CHAR(40) AFTER category;"):
+            try:
+                cursor.execute(alter_sql)
+                # print("Ensured column exists in 'barefoot_products'.") # Less verbose
+            except mysql.connector.Error as alter_err:
+                if alter_err.errno == 1060: pass
+                else: raise
         print("Table 'barefoot_products' checked/created successfully.")
     except mysql.connector.Error as err:
         print(f"Error with barefoot_products table setup: {err}")
 
-def insert_product_data(db_conn, product_data, product_url, category_name_from_config):
-    if not db_conn: return
-    cursor = None # Initialize cursor
+
+def create_category_membership_table_if_not_exists(cursor):
+    """Every category a product is listed in; barefoot_products.category only holds the first one."""
     try:
-        cursor = db_conn.cursor()
-        sql = """
-        INSERT INTO barefoot_products (product_url, title, price, tag, sku, category)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            title = VALUES(title), price = VALUES(price), tag = VALUES(tag),
-            sku = VALUES(sku), category = VALUES(category), scraped_at = CURRENT_TIMESTAMP;
-        """
-        values = (
-            product_url, product_data.get('title', 'N/A'), product_data.get('price', 'N/A'),
-            product_data.get('tag', 'N/A'), product_data.get('sku', 'N/A'), category_name_from_config
-        )
-        cursor.execute(sql, values)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS barefoot_product_categories (
+                url_hash CHAR(40) NOT NULL,
+                category VARCHAR(100) NOT NULL,
+                product_url VARCHAR(1024) NOT NULL,
+                run_id VARCHAR(64),
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                PRIMARY KEY (url_hash, category),
+                INDEX idx_category (category)
+            );
+        """)
     except mysql.connector.Error as err:
-        print(f"DB Error for {product_url} (Woo): {err}")
-    finally:
-        if cursor: cursor.close()
+        print(f"Error with barefoot_product_categories table setup: {err}")
+
+BAREFOOT_PRODUCT_COLUMNS = ('product_url', 'title', 'price', 'tag', 'sku', 'category', 'content_hash')
+# Every column but the key, category included: a product that moved category follows it (see insert_product_data)
+BAREFOOT_UPDATE_COLUMNS = BAREFOOT_PRODUCT_COLUMNS[1:]
+CATEGORY_MEMBERSHIP_COLUMNS = ('url_hash', 'category', 'product_url', 'run_id') # run_id: the run that first listed the pair
+# Columns of the Parquet snapshot as (name, pyarrow type) pairs; `store` is the product URL's host
+BAREFOOT_PARQUET_FIELDS = (('product_url', 'string'), ('title', 'string'), ('price', 'string'), ('tag', 'string'),
+                           ('sku', 'string'), ('category', 'string'), ('store', 'string'))
+PARQUET_DICTIONARY_FIELDS = ('tag', 'category', 'store')
+
+# --- Run Metrics ---
+METRICS_PREFIX = "woo_scraper_" # Metric names on /metrics; the series themselves live in common.metrics
 
+# --- Product Rows ---
+def insert_product_data(writer, product_data, product_url, category_name_from_config, tracker=None, feed=None, sink=None):
+    """Queues one product row on the bulk writer; it is persisted on the writer's next flush.
 
-def fetch_page_with_retries(url, retries=3, delay=5, timeout=25):
+    With a tracker, a product listed in several categories during this run is stored under the first
+    one it was seen in, and rows whose fingerprint matches the stored one are skipped. Queued rows are
+    reported to `feed`; every row, changed or not, goes to the Parquet `sink`. Returns True if queued.
+    """
+    if not writer: return False
+    if tracker: # First-seen wins within a run only, so a product that moved category is not stuck with the old one
+        category_name_from_config = tracker.first_scope(product_url, category_name_from_config)
+    row = (
+        product_url, product_data.get('title', 'N/A'), product_data.get('price', 'N/A'),
+        product_data.get('tag', 'N/A'), product_data.get('sku', 'N/A'), category_name_from_config
+    )
+    if sink: sink.add_many([row + (urlparse(product_url).netloc,)])
+    content_hash = row_fingerprint(row)
+    if tracker and tracker.classify(product_url, content_hash, category_name_from_config) == 'unchanged':
+        return False
+    writer.add(row + (content_hash,))
+    if feed: feed.observe(product_url, category_name_from_config, row[2])
+    return True
+
+
+host_limiter = HostRateLimiter(1 / DEFAULT_PER_HOST_DELAY, max_concurrency=DEFAULT_PER_HOST_CONCURRENCY) # Reconfigured from the run arguments in run_woo_scraper_logic
+
+
+def fetch_page_with_retries(url, retries=3, timeout=25):
+    """Fetches `url` through the per-host rate limiter, which handles backoff between retries."""
     global html_session # Use the global session
-    for i in range(retries):
-        try:
-            r = html_session.get(url, timeout=timeout)
-            r.raise_for_status()
-            return r
-        except Exception as e:
-            print(f"Error fetching {url} (Attempt {i+1}/{retries}): {e}")
-            if i < retries - 1: time.sleep(delay)
-            else: return None
+    try:
+        r = request_with_backoff(html_session, url, host_limiter, retries=retries, timeout=timeout)
+        r.raise_for_status()
+        if not getattr(r, 'from_cache', False):
+            run_metrics.inc('bytes_downloaded_total', len(r.content), host=urlparse(url).netloc)
+        return r
+    except Exception as e:
+        print(f"Error fetching {url} after {retries} attempts: {e}")
+        return None
+
+# --- HTML Extraction Engines ---
+# lxml: every selector is compiled to XPath once at import, and each page is parsed
+# into a single tree that all selectors are evaluated against.
+html_parser = DEFAULT_HTML_PARSER # Set from the run arguments in run_woo_scraper_logic
+parse_pool = None # ProcessPoolExecutor of the run with --parse_processes; lxml extraction then runs there
+
+LISTING_ITEM_SELECTOR = 'div.product-small.box'
+LISTING_LINK_SELECTORS = ('a.woocommerce-LoopProduct-link', 'p.name.product-title > a', 'a') # First match wins
+NEXT_PAGE_SELECTOR = 'a.next.page-numbers'
+PRODUCT_SELECTORS = {
+    'title': 'h1.product_title.entry-title',
+    'price': 'span.woocommerce-Price-amount.amount bdi',
+    'price_fallback': 'p.price span.woocommerce-Price-amount.amount',
+    'tag': 'span.tagged_as a[rel=tag]',
+    'sku': 'span.sku',
+}
+_LISTING_ITEM_XPATH = CSSSelector(LISTING_ITEM_SELECTOR)
+_LISTING_LINK_XPATHS = tuple(CSSSelector(sel) for sel in LISTING_LINK_SELECTORS)
+_NEXT_PAGE_XPATH = CSSSelector(NEXT_PAGE_SELECTOR)
+_PRODUCT_XPATHS = {name: CSSSelector(sel) for name, sel in PRODUCT_SELECTORS.items()}
+
+
+def _first_text(elements):
+    return elements[0].text_content().strip() if elements else 'N/A'
+
+
+def extract_listing_lxml(content):
+    """Returns ([href or None per product item], next page href or None) from a category page."""
+    tree = lxml.html.fromstring(content)
+    hrefs = []
+    for item in _LISTING_ITEM_XPATH(tree):
+        link_tag = None
+        for link_xpath in _LISTING_LINK_XPATHS:
+            found = link_xpath(item)
+            if found:
+                link_tag = found[0]
+                break
+        hrefs.append(link_tag.get('href') if link_tag is not None else None)
+    next_tags = _NEXT_PAGE_XPATH(tree)
+    return hrefs, (next_tags[0].get('href') if next_tags else None)
+
+
+def extract_listing_requests_html(html):
+    hrefs = []
+    for item in html.find(LISTING_ITEM_SELECTOR):
+        link_tag = None
+        for link_selector in LISTING_LINK_SELECTORS:
+            link_tag = item.find(link_selector, first=True)
+            if link_tag: break
+        hrefs.append(link_tag.attrs.get('href') if link_tag else None)
+    next_page_tag = html.find(NEXT_PAGE_SELECTOR, first=True)
+    return hrefs, (next_page_tag.attrs.get('href') if next_page_tag else None)
+
+
+def extract_product_lxml(content):
+    tree = lxml.html.fromstring(content)
+    found = {name: xpath(tree) for name, xpath in _PRODUCT_XPATHS.items()}
+    prices = found['price']
+    if len(prices) > 1: price = prices[1].text_content().strip() # Sale price follows the struck-through one
+    elif prices: price = prices[0].text_content().strip()
+    else: price = _first_text(found['price_fallback'])
+    return {'title': _first_text(found['title']), 'price': price,
+            'tag': _first_text(found['tag']), 'sku': _first_text(found['sku'])}
+
+
+def extract_product_requests_html(html):
+    product_details = {}
+    title_el = html.find(PRODUCT_SELECTORS['title'], first=True)
+    product_details['title'] = title_el.full_text.strip() if title_el else 'N/A'
+    price_elements = html.find(PRODUCT_SELECTORS['price'])
+    if len(price_elements) > 1: product_details['price'] = price_elements[1].full_text.strip()
+    elif price_elements: product_details['price'] = price_elements[0].full_text.strip()
+    else:
+        price_any = html.find(PRODUCT_SELECTORS['price_fallback'], first=True)
+        product_details['price'] = price_any.text.strip() if price_any else 'N/A'
+    tag_el = html.find(PRODUCT_SELECTORS['tag'], first=True)
+    product_details['tag'] = tag_el.full_text.strip() if tag_el else 'N/A'
+    sku_el = html.find(PRODUCT_SELECTORS['sku'], first=True)
+    product_details['sku'] = sku_el.full_text.strip() if sku_el else 'N/A'
+    return product_details
+
+
+def requests_html_document(response):
+    """requests_html's HTML for a fetched page; requests_html is only imported once this engine is used."""
+    from requests_html import HTML
+    return HTML(url=response.url, html=response.content, default_encoding=response.encoding or 'utf-8')
+
+
+def run_extractor(extract, content):
+    """Runs an lxml extractor in the parse pool if the run has one, otherwise in the calling thread."""
+    return parse_pool.submit(extract, content).result() if parse_pool else extract(content)
+
 
 def get_product_links_from_category_page(page_url):
-    # ... (Your existing logic for this function) ...
-    # Ensure it uses the global html_session or takes session as an argument
     print(f"Fetching product links from: {page_url}")
     r = fetch_page_with_retries(page_url) # Uses global html_session via fetch_page_with_retries
-    if not r or not r.html:
+    if not r or not r.content:
         print(f"Failed to fetch/parse HTML for {page_url}")
         return [], None
+    try:
+        parse_started_at = time.monotonic()
+        if html_parser == "requests_html":
+            hrefs, next_href = extract_listing_requests_html(requests_html_document(r))
+        else:
+            hrefs, next_href = run_extractor(extract_listing_lxml, r.content)
+        run_metrics.observe('parse_seconds', time.monotonic() - parse_started_at, kind="listing")
+    except Exception as e:
+        print(f"Failed to fetch/parse HTML for {page_url}: {e}")
+        return [], None
 
-    product_item_selector = 'div.product-small.box'
-    items = r.html.find(product_item_selector)
     links = []
-    if not items: print(f"No product items found on {page_url} with selector '{product_item_selector}'.")
-
-    for item in items:
-        link_tag = item.find('a.woocommerce-LoopProduct-link', first=True) or \
-                   item.find('p.name.product-title > a', first=True) or \
-                   item.find('a', first=True)
-        if link_tag and 'href' in link_tag.attrs:
-            links.append(urljoin(page_url, link_tag.attrs['href']))
+    if not hrefs: print(f"No product items found on {page_url} with selector '{LISTING_ITEM_SELECTOR}'.")
+    for href in hrefs:
+        if href:
+            links.append(urljoin(page_url, href))
         else:
             print(f"Warning: Product item on {page_url} missing valid link.")
 
-    next_page_selector = 'a.next.page-numbers'
-    next_page_tag = r.html.find(next_page_selector, first=True)
-    next_page_url = urljoin(page_url, next_page_tag.attrs['href']) if next_page_tag and 'href' in next_page_tag.attrs else None
+    next_page_url = urljoin(page_url, next_href) if next_href else None
     if next_page_url: print(f"Found next page: {next_page_url}")
     else: print(f"No 'Next Page' link found on {page_url}.")
     return links, next_page_url
 
 
-def get_all_product_links_for_category(start_category_url):
-    # ... (Your existing logic for this function) ...
-    all_links_for_category = []
+def iter_product_link_pages(start_category_url, max_pages=20):
+    """Follows a category's pagination and yields the new (not yet seen) product links of each page."""
+    seen_links = set()
     current_page_url = start_category_url
-    max_pages, pages_scraped = 20, 0
+    pages_scraped = 0
     while current_page_url and pages_scraped < max_pages:
         pages_scraped += 1
         print(f"\n--- Scraping links from page {pages_scraped} of Woo category: {current_page_url} ---")
         links_on_page, next_page_url_candidate = get_product_links_from_category_page(current_page_url)
-        newly_added = 0
+        new_links = []
         for link in links_on_page:
-            if link not in all_links_for_category:
-                all_links_for_category.append(link)
-                newly_added += 1
-        print(f"Collected {newly_added} new links. Total unique for category: {len(all_links_for_category)}")
-        if not links_on_page and newly_added == 0: print(f"No links found or added from {current_page_url}.")
+            if link not in seen_links:
+                seen_links.add(link)
+                new_links.append(link)
+        print(f"Collected {len(new_links)} new links. Total unique for category: {len(seen_links)}")
+        if not links_on_page: print(f"No links found or added from {current_page_url}.")
+        yield new_links
 
         if next_page_url_candidate and next_page_url_candidate != current_page_url:
             current_page_url = next_page_url_candidate
-            time.sleep(1.5)
         else:
             if next_page_url_candidate == current_page_url and next_page_url_candidate is not None:
                  print(f"Warning: Woo Next page URL is same as current. Stopping pagination.")
             current_page_url = None
     if pages_scraped == max_pages and current_page_url: print(f"Warning: Reached max_pages for {start_category_url}.")
-    return all_links_for_category
+
+
+def get_all_product_links_for_category(start_category_url):
+    return [link for links_on_page in iter_product_link_pages(start_category_url) for link in links_on_page]
+
+
+# --- WooCommerce Store API ---
+# The public Store API (WooCommerce 6+/Blocks) returns a listing page of up to 100 products with
+# their prices, SKU and tags, so a category costs a few requests instead of one per product.
+catalog_source = DEFAULT_CATALOG_SOURCE # Set from the run arguments in run_woo_scraper_logic
+store_api_disabled = set() # Store base URLs whose Store API is off this run; they use the HTML path
+STORE_API_PATH = "/wp-json/wc/store/v1/products"
+STORE_API_PAGE_SIZE = 100 # Largest per_page the Store API accepts
+STORE_API_UNAVAILABLE_STATUSES = (400, 401, 403, 404) # Disabled, blocked, or a filter this store does not support
+
+
+class StoreAPIError(Exception):
+    """A Store API page could not be read; the category is left incomplete."""
+
+
+class StoreAPIUnavailable(StoreAPIError):
+    """The store does not serve the Store API, detected on the first page."""
+
+
+def store_api_base(category_url):
+    """Splits a configured URL into (store base URL, category slug). A URL without /product-category/ means the whole store."""
+    url = category_url.split('?')[0]
+    if '/product-category/' in url:
+        base, _, category_path = url.partition('/product-category/')
+        return base.rstrip('/'), category_path.strip('/').split('/')[-1]
+    return url.rstrip('/'), None
+
+
+def format_store_api_price(prices):
+    """Formats Store API `prices` (amounts in minor units) the way the product page shows them, e.g. '$25.00'."""
+    if not prices or prices.get('price') in (None, ''):
+        return 'N/A'
+    minor_unit = int(prices.get('currency_minor_unit', 2))
+    amount = f"{int(prices['price']) / 10 ** minor_unit:,.{minor_unit}f}"
+    amount = amount.replace(',', '\0').replace('.', prices.get('currency_decimal_separator', '.'))
+    amount = amount.replace('\0', prices.get('currency_thousand_separator', ','))
+    return f"{prices.get('currency_prefix', '')}{amount}{prices.get('currency_suffix', '')}"
+
+
+def product_from_store_api(item):
+    """Maps one Store API product to the fields the HTML extractors return."""
+    tags = item.get('tags') or []
+    return {'title': unescape(item.get('name') or 'N/A'), 'price': format_store_api_price(item.get('prices')),
+            'tag': unescape(tags[0].get('name', 'N/A')) if tags else 'N/A', 'sku': item.get('sku') or 'N/A'}
+
+
+def iter_store_api_pages(category_url):
+    """Yields [(product URL, product fields)] per Store API page of a category, or of a whole store.
+
+    Raises StoreAPIUnavailable if the first page shows the endpoint is off, StoreAPIError if a later page fails
+    or any page still answers 429/5xx after request_with_backoff's retries (an overloaded store, not a missing API).
+    """
+    base_url, category_slug = store_api_base(category_url)
+    seen_links = set()
+    page, total_pages = 1, None
+    while total_pages is None or page <= total_pages:
+        params = {'per_page': STORE_API_PAGE_SIZE, 'page': page}
+        if category_slug: params['category'] = category_slug
+        page_url = f"{base_url}{STORE_API_PATH}?{urlencode(params)}"
+        print(f"Fetching Store API page: {page_url}")
+        try:
+            r = request_with_backoff(html_session, page_url, host_limiter, timeout=25)
+        except requests.exceptions.RequestException as e:
+            raise StoreAPIError(f"{page_url}: {e}")
+        if r.status_code == 429 or r.status_code >= 500:
+            raise StoreAPIError(f"{page_url} still answered {r.status_code} after retries")
+        if page == 1 and (r.status_code in STORE_API_UNAVAILABLE_STATUSES or 'json' not in r.headers.get('Content-Type', '')):
+            raise StoreAPIUnavailable(f"{page_url} answered {r.status_code} ({r.headers.get('Content-Type', 'no content type')})")
+        if r.status_code != 200:
+            raise StoreAPIError(f"{page_url} answered {r.status_code}")
+        if not getattr(r, 'from_cache', False):
+            run_metrics.inc('bytes_downloaded_total', len(r.content), host=urlparse(page_url).netloc)
+        parse_started_at = time.monotonic()
+        try:
+            items = r.json()
+        except ValueError as e:
+            raise (StoreAPIUnavailable if page == 1 else StoreAPIError)(f"{page_url} is not JSON: {e}")
+        if not isinstance(items, list):
+            raise (StoreAPIUnavailable if page == 1 else StoreAPIError)(f"{page_url} did not return a product list")
+        products = []
+        for item in items:
+            link = item.get('permalink')
+            if link and link not in seen_links:
+                seen_links.add(link)
+                products.append((link, product_from_store_api(item)))
+        run_metrics.observe('parse_seconds', time.monotonic() - parse_started_at, kind="store_api")
+        print(f"Store API page {page}: {len(products)} new products. Total unique for category: {len(seen_links)}")
+        yield products
+
+        if r.headers.get('X-WP-TotalPages', '').isdigit():
+            total_pages = int(r.headers['X-WP-TotalPages'])
+        elif len(items) < STORE_API_PAGE_SIZE:
+            break
+        page += 1
+
+
+def iter_category_pages(category_url):
+    """Yields each listing page of a category as [(product URL, product fields or None)].
+
+    Reads the Store API unless --catalog_source html or the store has it off (auto falls back to HTML
+    for the rest of the run). On the HTML path the fields are None: each product page is still to fetch.
+    """
+    base_url = store_api_base(category_url)[0]
+    if catalog_source != "html" and base_url not in store_api_disabled:
+        try:
+            yield from iter_store_api_pages(category_url)
+            return
+        except StoreAPIUnavailable as e:
+            if catalog_source == "store_api":
+                raise
+            print(f"Store API unavailable for {base_url} ({e}). Falling back to HTML scraping.")
+            store_api_disabled.add(base_url)
+    for links_on_page in iter_product_link_pages(category_url):
+        yield [(link, None) for link in links_on_page]
+
+
+# --- Run-Wide URL Frontier ---
+class URLFrontier:
+    """Product URLs handed to the pipeline this run, so a product listed in several categories is fetched once.
+
+    URLs are kept as 64-bit prefixes of their SHA-1 rather than as strings. seed_done() marks the URLs
+    an interrupted run already processed, whichever category listed them. (URL, category) memberships
+    are compared with the ones load() read from barefoot_product_categories: only pairs not stored yet
+    are queued on `membership_writer`, and retire() removes the stored pairs of fully crawled
+    categories that this run did not list.
+    """
+    def __init__(self, run_id, membership_writer=None):
+        self.run_id = run_id
+        self.membership_writer = membership_writer
+        self.counts = {'unique': 0, 'shared': 0, 'done': 0, 'memberships_added': 0, 'memberships_retired': 0}
+        self._seen = set()
+        self._done = set()
+        self._stored = {} # category -> url_hash of each stored membership
+        self._listed = {} # category -> url_hash of each membership listed this run
+        self._lock = threading.Lock()
+
+    def load(self, db_conn):
+        cursor = db_conn.cursor()
+        try:
+            cursor.execute("SELECT url_hash, category FROM barefoot_product_categories")
+            for url_hash, category_name in cursor.fetchall():
+                self._stored.setdefault(category_name, set()).add(url_hash)
+        except mysql.connector.Error as err:
+            print(f"Error loading category memberships: {err}")
+        finally:
+            cursor.close()
+        return self
+
+    def seed_done(self, product_urls):
+        with self._lock:
+            self._done.update(int.from_bytes(hashlib.sha1(url.encode('utf-8')).digest()[:8], 'big') for url in product_urls)
+
+    def add(self, product_url, category_name):
+        """Records that `product_url` is listed in `category_name`. True if the URL is new to this run and not done."""
+        digest = hashlib.sha1(product_url.encode('utf-8')).digest()
+        url_hash, key = digest.hex(), int.from_bytes(digest[:8], 'big')
+        with self._lock:
+            self._listed.setdefault(category_name, set()).add(url_hash)
+            stored = self._stored.setdefault(category_name, set())
+            new_membership = url_hash not in stored
+            stored.add(url_hash)
+            if new_membership: self.counts['memberships_added'] += 1
+            first = key not in self._seen and key not in self._done
+            self.counts['done' if key in self._done else 'unique' if first else 'shared'] += 1
+            self._seen.add(key)
+        if new_membership and self.membership_writer:
+            self.membership_writer.add((url_hash, category_name, product_url, self.run_id))
+        return first
+
+    def retire(self, db_conn, completed_categories, batch_size=DEFAULT_DB_BATCH_SIZE):
+        """Deletes stored memberships of fully crawled categories that this run did not list, `batch_size` pairs per DELETE."""
+        with self._lock:
+            stale = [(url_hash, category_name) for category_name in sorted(completed_categories)
+                     for url_hash in self._stored.get(category_name, set()) - self._listed.get(category_name, set())]
+        if not stale:
+            return 0
+        batch_size = max(1, batch_size)
+        cursor = db_conn.cursor()
+        try:
+            for start in range(0, len(stale), batch_size):
+                batch = stale[start:start + batch_size]
+                cursor.execute("DELETE FROM barefoot_product_categories WHERE (url_hash, category) IN "
+                               f"({', '.join(['(%s, %s)'] * len(batch))})", [value for pair in batch for value in pair])
+                db_conn.commit()
+                self.counts['memberships_retired'] += cursor.rowcount
+        except mysql.connector.Error as err:
+            print(f"Error retiring category memberships: {err}")
+            db_conn.rollback()
+        finally:
+            cursor.close()
+        return self.counts['memberships_retired']
+
+# --- Streaming Extraction Pipeline ---
+class StageMetrics:
+    """Item count, busy time and backpressure (time blocked on a full downstream queue) for one stage."""
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items=1, busy_s=0.0, blocked_s=0.0):
+        with self._lock:
+            self.items += items
+            self.busy_s += busy_s
+            self.blocked_s += blocked_s
+
+    def snapshot(self, wall_s):
+        with self._lock:
+            return {"items": self.items, "busy_s": round(self.busy_s, 2), "blocked_s": round(self.blocked_s, 2),
+                    "items_per_s": round(self.items / wall_s, 2) if wall_s > 0 else 0.0}
+
+
+_PIPELINE_DONE = object() # Sentinel passed down the queues when a stage has no more work
+
+
+def _timed_put(target_queue, item, metrics):
+    started_at = time.monotonic()
+    target_queue.put(item)
+    metrics.record(items=0, blocked_s=time.monotonic() - started_at)
+
+
+def run_extraction_pipeline(categories, writer, tracker, workers=DEFAULT_PIPELINE_WORKERS, queue_size=DEFAULT_PIPELINE_QUEUE_SIZE,
+                            checkpoint=None, job=None, leases=None, on_claim=None, feed=None, sink=None, frontier=None):
+    """Discovers, extracts and persists products of `categories` as three overlapping stages.
+
+    discover (1 thread): paginates categories and feeds product links into a bounded queue. Store API
+    pages already carry the product fields, so their products skip extract and go straight to write.
+    extract (`workers` threads): fetch and parse product pages while pagination is still running.
+    write (calling thread): hands results to the bulk writer, which persists them in batches.
+    Bounded queues provide backpressure: a stage blocks instead of buffering unboundedly.
+    With a checkpoint, completed categories and already processed product URLs are skipped, and
+    every processed URL and finished category is recorded. Progress is counted on `job`.
+    With `leases`, only categories this replica claims are crawled; `on_claim(category_name, cursor)`
+    runs in the claiming transaction. Written rows are reported to the change `feed` and the Parquet `sink`.
+    With a `frontier`, a product already discovered under an earlier category only has its membership recorded.
+    """
+    workers = max(1, workers)
+    link_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    stage_metrics = {name: StageMetrics(name) for name in ("discover", "extract", "write")}
+    completed_categories = set()
+    category_counts = {c['name']: 0 for c in categories}
+    peak_queue_depth = {"links": 0, "results": 0}
+    enqueued = {c['name']: 0 for c in categories} # Links handed to the extract stage, per category
+    processed = {c['name']: 0 for c in categories} # Results handled by the write stage, per category
+    discovered = set() # Categories whose pagination has finished
+    finished = set() # Categories whose every discovered product has been handled by the write stage
+
+    def discover():
+        try:
+            for category_config in categories:
+                category_name, category_url = category_config['name'], category_config['url']
+                if checkpoint and category_name in checkpoint.completed_scopes:
+                    print(f"Woo category '{category_name}' was completed by the interrupted run. Skipping.")
+                    completed_categories.add(category_name)
+                    if job: job.advance(categories_done=1)
+                    continue
+                if leases and not leases.claim(category_name, prepare=on_claim and (lambda cursor: on_claim(category_name, cursor))):
+                    print(f"Woo category '{category_name}' is claimed by another replica. Skipping.")
+                    if job: job.advance(categories_done=1)
+                    continue
+                print(f"\n{'='*20} Discovering Woo Category: {category_name} ({category_url}) {'='*20}")
+                done_urls = checkpoint.done_urls.get(category_name, set()) if checkpoint else set()
+                found = 0
+                shared = 0
+                complete = True
+                page_started_at = time.monotonic()
+                try:
+                    for products_on_page in iter_category_pages(category_url):
+                        stage_metrics["discover"].record(items=len(products_on_page), busy_s=time.monotonic() - page_started_at)
+                        new_products = [(link, info) for link, info in products_on_page if link not in done_urls]
+                        if frontier: # Every listed link records its membership; only unseen, unprocessed ones go on
+                            unseen_products = [(link, info) for link, info in products_on_page if frontier.add(link, category_name)]
+                            shared += len(new_products) - len(unseen_products)
+                            new_products = unseen_products
+                        if job: job.advance(pages=1, products_total=len(new_products))
+                        for link, product_info in new_products:
+                            enqueued[category_name] += 1
+                            if product_info is None:
+                                _timed_put(link_queue, (link, category_name), stage_metrics["discover"])
+                            else:
+                                _timed_put(result_queue, (link, category_name, product_info), stage_metrics["discover"])
+                        found += len(products_on_page)
+                        peak_queue_depth["links"] = max(peak_queue_depth["links"], link_queue.qsize())
+                        page_started_at = time.monotonic()
+                except StoreAPIError as e:
+                    print(f"Store API crawl of Woo category '{category_name}' stopped early: {e}")
+                    complete = False # Its unseen rows must not be retired
+                discovered.add(category_name)
+                if found and complete:
+                    completed_categories.add(category_name)
+                    print(f"Found {found} total product links for Woo '{category_name}'"
+                          + (f", {shared} already found under an earlier category" if shared else "")
+                          + (f" ({found - shared - enqueued[category_name]} already processed before the restart)." if done_urls else "."))
+                elif not found:
+                    print(f"No product links for Woo category '{category_name}'. Skipping.")
+        except Exception as e:
+            print(f"Exception in Woo link discovery stage: {e}")
+        finally:
+            for _ in range(workers):
+                link_queue.put(_PIPELINE_DONE)
+
+    def extract():
+        try:
+            while True:
+                item = link_queue.get()
+                if item is _PIPELINE_DONE:
+                    break
+                link, category_name = item
+                started_at = time.monotonic()
+                try:
+                    product_info = get_product_data(link)
+                except Exception as e:
+                    print(f"Exception extracting Woo product {link}: {e}")
+                    product_info = None
+                stage_metrics["extract"].record(busy_s=time.monotonic() - started_at)
+                _timed_put(result_queue, (link, category_name, product_info), stage_metrics["extract"])
+                peak_queue_depth["results"] = max(peak_queue_depth["results"], result_queue.qsize())
+        finally:
+            result_queue.put(_PIPELINE_DONE)
+
+    pipeline_started_at = time.monotonic()
+    threads = [threading.Thread(target=discover, name="woo-discover", daemon=True)]
+    threads += [threading.Thread(target=extract, name=f"woo-extract-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    def finish_category(category_name):
+        if category_name in finished or category_name not in discovered or processed[category_name] != enqueued[category_name]:
+            return
+        finished.add(category_name)
+        if checkpoint and category_name in completed_categories:
+            checkpoint.complete(category_name)
+        if leases: leases.release(category_name)
+        if job: job.advance(categories_done=1)
+
+    finished_workers = 0
+    while finished_workers < workers:
+        item = result_queue.get()
+        if item is _PIPELINE_DONE:
+            finished_workers += 1
+            continue
+        link, category_name, product_info = item
+        started_at = time.monotonic()
+        if product_info:
+            insert_product_data(writer, product_info, link, category_name, tracker, feed, sink)
+            category_counts[category_name] = category_counts.get(category_name, 0) + 1
+        else:
+            tracker.mark_seen(link) # Fetch failed; keep the stored row rather than retiring it
+        processed[category_name] += 1
+        if job: job.advance(products=1)
+        if checkpoint:
+            checkpoint.url_done(category_name, link) # Saved once the row above is flushed
+            writer.poll()
+        finish_category(category_name)
+        stage_metrics["write"].record(busy_s=time.monotonic() - started_at)
+    for category_name in list(discovered):
+        finish_category(category_name) # Categories whose last result arrived before their discovery finished
+    writer.flush()
+    for thread in threads:
+        thread.join()
+
+    wall_s = time.monotonic() - pipeline_started_at
+    metrics = {name: m.snapshot(wall_s) for name, m in stage_metrics.items()}
+    metrics["wall_s"] = round(wall_s, 2)
+    metrics["peak_queue_depth"] = peak_queue_depth
+    print(f"(Woo Pipeline) Stage metrics: {metrics}")
+    return {"completed_categories": completed_categories, "category_counts": category_counts, "metrics": metrics}
 
 
 def get_product_data(product_url):
-    # ... (Your existing logic for this function) ...
-    # Ensure it uses the global html_session or takes session as an argument
     print(f"Scraping Woo product data from: {product_url}")
     r = fetch_page_with_retries(product_url) # Uses global html_session
-    if not r or not r.html: return None
-    product_details = {}
+    if not r or not r.content: return None
     try:
-        title_el = r.html.find('h1.product_title.entry-title', first=True)
-        product_details['title'] = title_el.full_text.strip() if title_el else 'N/A'
-        price_elements = r.html.find('span.woocommerce-Price-amount.amount bdi')
-        if len(price_elements) > 1: product_details['price'] = price_elements[1].full_text.strip()
-        elif price_elements: product_details['price'] = price_elements[0].full_text.strip()
+        parse_started_at = time.monotonic()
+        if html_parser == "requests_html":
+            product_details = extract_product_requests_html(requests_html_document(r))
         else:
-            price_any = r.html.find('p.price span.woocommerce-Price-amount.amount', first=True)
-            product_details['price'] = price_any.text.strip() if price_any else 'N/A'
-        tag_el = r.html.find('span.tagged_as a[rel=tag]', first=True)
-        product_details['tag'] = tag_el.full_text.strip() if tag_el else 'N/A'
-        sku_el = r.html.find('span.sku', first=True)
-        product_details['sku'] = sku_el.full_text.strip() if sku_el else 'N/A'
+            product_details = run_extractor(extract_product_lxml, r.content)
+        run_metrics.observe('parse_seconds', time.monotonic() - parse_started_at, kind="product")
         print(f"Scraped Woo: {product_details}")
         return product_details
     except Exception as e:
@@ -215,133 +849,447 @@ def get_product_data(product_url):
         return {k: 'N/A (Parse Error)' for k in ['title', 'price', 'tag', 'sku']}
 
 # --- Main WooCommerce Scraping Logic ---
-def run_woo_scraper_logic(cmd_args):
-    print(f"WooCommerce scraper logic triggered with args: {cmd_args}")
-    current_run_db_config = {
-        'host': cmd_args.db_host, 'user': cmd_args.db_user,
-        'password': cmd_args.db_password, 'database': cmd_args.db_name
-    }
-    print(f"DEBUG (Woo scraper logic): current_run_db_config set to: {current_run_db_config}")
-
-    BAREFOOT_CATEGORIES_TO_SCRAPE = [] # Initialize
+def load_categories(categories_file_path):
+    categories = [] # Initialize
     try:
-        print(f"DEBUG (Woo scraper logic): Attempting to load categories from: {cmd_args.categories_file_path}")
-        with open(cmd_args.categories_file_path, 'r') as f:
+        print(f"DEBUG (Woo scraper logic): Attempting to load categories from: {categories_file_path}")
+        with open(categories_file_path, 'r') as f:
             categories_data = json.load(f)
-        if isinstance(categories_data, list) and all(isinstance(c, dict) and 'name' in c and 'url' in c for c in categories_data):
-            BAREFOOT_CATEGORIES_TO_SCRAPE = categories_data
-            print(f"DEBUG (Woo scraper logic): Categories loaded: {len(BAREFOOT_CATEGORIES_TO_SCRAPE)}")
+        if isinstance(categories_data, list) and all(isinstance(c, str) or (isinstance(c, dict) and 'name' in c and 'url' in c)
+                                                     for c in categories_data):
+            # A plain URL string (like an entry of the Shopify stores.json) is a whole store, named after its host
+            categories = [{'name': urlparse(c).netloc, 'url': c} if isinstance(c, str) else c for c in categories_data]
+            print(f"DEBUG (Woo scraper logic): Categories loaded: {len(categories)}")
         else:
             print(f"Error (Woo scraper logic): Invalid categories file format. Using fallback.")
-            BAREFOOT_CATEGORIES_TO_SCRAPE = DEFAULT_CATEGORIES_CONTENT
+            categories = DEFAULT_CATEGORIES_CONTENT
     except Exception as e:
-        print(f"Error (Woo scraper logic): Loading categories file '{cmd_args.categories_file_path}': {e}. Using fallback.")
-        BAREFOOT_CATEGORIES_TO_SCRAPE = DEFAULT_CATEGORIES_CONTENT
+        print(f"Error (Woo scraper logic): Loading categories file '{categories_file_path}': {e}. Using fallback.")
+        categories = DEFAULT_CATEGORIES_CONTENT
+    return categories
+
+
+def select_categories(categories, requested):
+    """Picks the configured categories named in `requested` (names or URLs). Returns (selected, unknown)."""
+    by_key = {}
+    for category_config in categories:
+        by_key[category_config['name']] = category_config
+        by_key[category_config['url'].rstrip('/')] = category_config
+    selected, unknown = [], []
+    for entry in requested:
+        category_config = by_key.get(str(entry).rstrip('/'))
+        if category_config is None:
+            unknown.append(entry)
+        elif category_config not in selected:
+            selected.append(category_config)
+    return selected, unknown
+
+
+def run_woo_scraper_logic(cmd_args, job=None, scope=None, shard_run_id=None):
+    """Runs one crawl. `scope` limits it to some configured categories; progress is reported on `job`.
+
+    With --shard_mode lease, this replica only crawls the categories it claims for run `shard_run_id`
+    (defaults to the job ID when this replica is the one that was triggered).
+    """
+    global host_limiter, html_parser, catalog_source, store_api_disabled, parse_pool
+    print(f"WooCommerce scraper logic triggered with args: {cmd_args}")
+    run_metrics.reset()
+    current_run_db_config = db_config_from_args(cmd_args)
+    print(f"DEBUG (Woo scraper logic): current_run_db_config set to: {current_run_db_config}")
+
+    BAREFOOT_CATEGORIES_TO_SCRAPE = load_categories(cmd_args.categories_file_path)
+    if scope:
+        BAREFOOT_CATEGORIES_TO_SCRAPE, unknown_categories = select_categories(BAREFOOT_CATEGORIES_TO_SCRAPE, scope)
+        if unknown_categories:
+            return {"status": "error", "message": f"Categories not in the configured list: {unknown_categories}"}
+        print(f"(Woo Scraper Logic) Scoped run over {len(BAREFOOT_CATEGORIES_TO_SCRAPE)} categories.")
 
     if not BAREFOOT_CATEGORIES_TO_SCRAPE:
         print("Critical (Woo scraper logic): No categories to process.")
         return {"status": "error", "message": "No categories configured."}
+    job = job or ScrapeJob(None, "categories", scope)
 
     db_connection = db_connect(current_run_db_config)
     if not db_connection:
         print("Could not connect to database for Woo scraper.")
         return {"status": "error", "message": "DB connection failed."}
 
+    scheduler = None
+    skipped_categories = []
+    if cmd_args.revisit == "adaptive":
+        scheduler = RevisitScheduler(db_connection, 'woo', cmd_args.min_revisit_hours, cmd_args.max_revisit_hours,
+                                     cmd_args.revisit_target_share)
+        scheduler.load()
+        if not scope: # An explicitly scoped run crawls its categories whether or not they are due
+            due_categories = set(scheduler.due([c['name'] for c in BAREFOOT_CATEGORIES_TO_SCRAPE]))
+            skipped_categories = [c['name'] for c in BAREFOOT_CATEGORIES_TO_SCRAPE if c['name'] not in due_categories]
+            BAREFOOT_CATEGORIES_TO_SCRAPE = [c for c in BAREFOOT_CATEGORIES_TO_SCRAPE if c['name'] in due_categories]
+            print(f"(Woo Scraper Logic) Revisit schedule: {len(BAREFOOT_CATEGORIES_TO_SCRAPE)} categories due, "
+                  f"{len(skipped_categories)} skipped until their next visit.")
+        if not BAREFOOT_CATEGORIES_TO_SCRAPE:
+            if db_connection.is_connected(): db_connection.close()
+            return {"status": "success", "message": "No WooCommerce categories are due for a revisit.",
+                    "revisit": {"skipped": len(skipped_categories), "next_visit_hours": {}}}
+    job.start(len(BAREFOOT_CATEGORIES_TO_SCRAPE))
+
     cursor = db_connection.cursor()
     create_barefoot_table_if_not_exists(cursor)
+    create_category_membership_table_if_not_exists(cursor)
     
+    leases = None
+    if cmd_args.shard_mode == "lease":
+        lease_connection = db_connect(current_run_db_config)
+        if not lease_connection:
+            if cursor: cursor.close()
+            if db_connection and db_connection.is_connected(): db_connection.close()
+            return {"status": "error", "message": "Database connection for shard leases failed."}
+        leases = ShardLeases(lease_connection, 'woo', shard_run_id or job.id or uuid.uuid4().hex[:12], cmd_args.lease_ttl).open()
+        print(f"(Woo Scraper Logic) Sharded run {leases.run_id}: claiming categories as {leases.owner}.")
+
+    shadow = None
+    if cmd_args.scrape_mode == "full" and cmd_args.full_refresh == "swap":
+        if leases:
+            print("(Woo Scraper Logic) Full mode, sharded: replicas write to the live table, so --full_refresh swap is not used.")
+        else:
+            shadow = ShadowSwap(db_connection, {'barefoot_products': BAREFOOT_PRODUCT_COLUMNS}, 'category')
+
+    # Scoped and sharded runs cover only part of the category list, so they leave full-run progress alone.
+    # A swapped refresh always starts over, since its shadow table is rebuilt.
+    checkpoint = CrawlCheckpoint(db_connection, 'woo', enabled=not scope and not leases and not shadow)
+    run_id = leases.run_id if leases else job.id or uuid.uuid4().hex[:12]
+    feed = ChangeFeed(db_connection, 'woo', run_id, history=cmd_args.price_history == "on", feed_path=cmd_args.change_feed_path,
+                      track=scheduler is not None)
     try:
-        delete_query = "DELETE FROM barefoot_products" # Deletes all rows
-        # You could also use TRUNCATE TABLE barefoot_products for potentially faster deletion
-        # delete_query = "TRUNCATE TABLE barefoot_products"
-        
-        cursor.execute(delete_query)
-        deleted_rows_count = cursor.rowcount
-        db_connection.commit() # Commit the delete operation
-        print(f"(Woo Scraper Logic) DELETED {deleted_rows_count} existing product entries from the 'barefoot_products' table.")
+        if checkpoint.begin(resume=cmd_args.resume == "auto"):
+            print(f"(Woo Scraper Logic) Resuming interrupted run: {len(checkpoint.completed_scopes)} categories done, "
+                  f"{sum(len(urls) for urls in checkpoint.done_urls.values())} products already processed.")
+        # Read before full mode empties the table, so the feed still compares against the previous run
+        feed.load('barefoot_products', 'product_url', 'price', None, 'category') # The table has no availability column
+        if cmd_args.scrape_mode == "full" and checkpoint.resumed:
+            print("(Woo Scraper Logic) Full mode: table was already emptied by the interrupted run; keeping its rows.")
+            tracker = DeltaTracker({})
+        elif cmd_args.scrape_mode == "full" and leases:
+            print("(Woo Scraper Logic) Full mode, sharded: each category's rows are deleted when this replica claims it.")
+            tracker = DeltaTracker({})
+        elif cmd_args.scrape_mode == "full" and shadow:
+            shadow.open()
+            print("(Woo Scraper Logic) Full mode, shadow swap: loading barefoot_products_shadow; the live table stays readable until the swap.")
+            tracker = DeltaTracker({})
+        elif cmd_args.scrape_mode == "full":
+            delete_query = "DELETE FROM barefoot_products" # Deletes all rows
+            # You could also use TRUNCATE TABLE barefoot_products for potentially faster deletion
+            # delete_query = "TRUNCATE TABLE barefoot_products"
+            delete_params = None
+            if scope or skipped_categories: # Only empty the categories this run is going to re-crawl
+                delete_params = [c['name'] for c in BAREFOOT_CATEGORIES_TO_SCRAPE]
+                delete_query += f" WHERE category IN ({', '.join(['%s'] * len(delete_params))})"
+
+            cursor.execute(delete_query, delete_params)
+            deleted_rows_count = cursor.rowcount
+            db_connection.commit() # Commit the delete operation
+            print(f"(Woo Scraper Logic) DELETED {deleted_rows_count} existing product entries from the 'barefoot_products' table.")
+            tracker = DeltaTracker({})
+        else:
+            tracker = DeltaTracker(load_existing_fingerprints(db_connection, 'barefoot_products', 'category'))
+            print(f"(Woo Scraper Logic) Incremental mode: {len(tracker.known)} stored products loaded for change detection.")
     except mysql.connector.Error as err:
-        print(f"Error deleting all data from 'barefoot_products' table: {err}")
+        print(f"Error preparing 'barefoot_products' table ({cmd_args.scrape_mode} mode): {err}")
         # CRITICAL: Decide if you want to stop if deletion fails.
+        if leases: leases.close()
         if cursor: cursor.close()
         if db_connection and db_connection.is_connected(): db_connection.close()
-        return {"status": "error", "message": f"Failed to clear barefoot_products table: {err}"}
+        return {"status": "error", "message": f"Failed to prepare barefoot_products table: {err}"}
     except Exception as e_del:
-        print(f"Unexpected error during data deletion: {e_del}")
+        print(f"Unexpected error preparing 'barefoot_products' table: {e_del}")
+        if leases: leases.close()
         if cursor: cursor.close()
         if db_connection and db_connection.is_connected(): db_connection.close()
-        return {"status": "error", "message": f"Unexpected error clearing barefoot_products table: {e_del}"}
-    # --- End of NEW deletion logic ---
-    
+        return {"status": "error", "message": f"Unexpected error preparing barefoot_products table: {e_del}"}
+    # --- End of deletion / delta-baseline logic ---
+    for urls in checkpoint.done_urls.values():
+        for url in urls:
+            tracker.mark_seen(url) # Processed before the restart, so not a retirement candidate
     
-    cursor.close() # Close cursor after table creation, new ones will be opened by insert_product_data
+    cursor.close() # Close cursor after table creation, the bulk writer opens its own per flush
+    write_lock = threading.RLock() # Both writers share the run's connection
+    load_connection = db_connection
+    if shadow and cmd_args.shadow_load == "infile": # LOCAL INFILE has to be allowed when the connection is opened
+        load_connection = db_connect({**current_run_db_config, 'allow_local_infile': True}) or db_connection
+    if shadow:
+        writer = InfileUpserter(load_connection, 'barefoot_products_shadow', BAREFOOT_PRODUCT_COLUMNS, BAREFOOT_UPDATE_COLUMNS,
+                                batch_size=DEFAULT_SHADOW_BATCH_ROWS, flush_interval=cmd_args.db_flush_interval,
+                                on_flush=lambda: (feed.flush(), checkpoint.on_flush()), lock=write_lock,
+                                infile=cmd_args.shadow_load == "infile", insert_batch_size=cmd_args.db_batch_size)
+    else:
+        writer = BulkUpserter(db_connection, 'barefoot_products', BAREFOOT_PRODUCT_COLUMNS, BAREFOOT_UPDATE_COLUMNS,
+                              batch_size=cmd_args.db_batch_size, flush_interval=cmd_args.db_flush_interval,
+                              on_flush=lambda: (feed.flush(), checkpoint.on_flush()), lock=write_lock)
+    # INSERT IGNORE: the frontier only queues pairs that are not stored yet
+    membership_writer = BulkUpserter(db_connection, 'barefoot_product_categories', CATEGORY_MEMBERSHIP_COLUMNS, (), extra_updates=(),
+                                     batch_size=cmd_args.db_batch_size, flush_interval=cmd_args.db_flush_interval, lock=write_lock)
+    frontier = URLFrontier(run_id, membership_writer).load(db_connection)
+    # A URL processed before the restart counts as done in every category, not only the one that saw it first
+    frontier.seed_done(url for urls in checkpoint.done_urls.values() for url in urls)
 
-    total_products_processed_for_db = 0
-    for category_config in BAREFOOT_CATEGORIES_TO_SCRAPE:
-        category_name_for_db = category_config['name']
-        category_start_url = category_config['url']
-        print(f"\n{'='*20} Processing Woo Category: {category_name_for_db} ({category_start_url}) {'='*20}")
+    sink = None
+    if cmd_args.parquet_dir and import_pyarrow() is None:
+        print("(Woo Scraper Logic) pyarrow is not installed; --parquet_dir is ignored.")
+    elif cmd_args.parquet_dir:
+        sink = ParquetSink(cmd_args.parquet_dir, 'woo', run_id, BAREFOOT_PARQUET_FIELDS, 'store', PARQUET_DICTIONARY_FIELDS)
 
-        product_page_links = get_all_product_links_for_category(category_start_url)
-        if not product_page_links:
-            print(f"No product links for Woo category '{category_name_for_db}'. Skipping.")
-            continue
+    cache = configure_http_session(html_session, cmd_args)
+    cache_stats_before = cache.snapshot() if cache else None
 
-        print(f"\nFound {len(product_page_links)} total product links for Woo '{category_name_for_db}'. Extracting data...")
-        products_in_this_category_db = 0
-        for i, link in enumerate(product_page_links):
-            print(f"Processing Woo product {i+1}/{len(product_page_links)}...")
-            product_info = get_product_data(link)
-            if product_info:
-                insert_product_data(db_connection, product_info, link, category_name_for_db)
-                products_in_this_category_db +=1
-            time.sleep(1) # Respectful delay
-
-        db_connection.commit() # Commit after each category
-        print(f"Woo Category '{category_name_for_db}' completed. {products_in_this_category_db} products processed.")
-        total_products_processed_for_db += products_in_this_category_db
-        time.sleep(3)
+    host_limiter = limiter_from_args(cmd_args)
+    html_parser = cmd_args.html_parser
+    catalog_source = cmd_args.catalog_source
+    store_api_disabled = set()
+    if html_parser == "lxml":
+        parse_pool = open_parse_pool(cmd_args.parse_processes)
+        if parse_pool: print(f"(Woo Scraper Logic) Parsing HTML pages in {cmd_args.parse_processes} parse processes.")
+    delete_category_rows = None
+    if cmd_args.scrape_mode == "full" and leases:
+        delete_category_rows = lambda category_name, lease_cursor: lease_cursor.execute(
+            "DELETE FROM barefoot_products WHERE category = %s", (category_name,))
+    try:
+        pipeline_result = run_extraction_pipeline(BAREFOOT_CATEGORIES_TO_SCRAPE, writer, tracker,
+                                                  workers=cmd_args.workers, queue_size=cmd_args.queue_size, checkpoint=checkpoint,
+                                                  job=job, leases=leases, on_claim=delete_category_rows, feed=feed, sink=sink,
+                                                  frontier=frontier)
+    finally:
+        if leases: leases.close()
+        if parse_pool:
+            parse_pool.shutdown()
+            parse_pool = None
+    if leases:
+        print(f"(Woo Scraper Logic) This replica crawled {len(leases.claimed)} of {len(BAREFOOT_CATEGORIES_TO_SCRAPE)} categories "
+              f"in sharded run {leases.run_id}.")
+    completed_categories = pipeline_result["completed_categories"]
+    for category_name, count in pipeline_result["category_counts"].items():
+        print(f"Woo Category '{category_name}' completed. {count} products processed.")
+    total_products_processed_for_db = sum(pipeline_result["category_counts"].values())
 
+    writer.close()
+    membership_writer.close()
+    if load_connection is not db_connection and load_connection.is_connected(): load_connection.close()
+    shadow_result = None
+    if shadow:
+        try:
+            carried = shadow.publish(completed_categories)
+            shadow_result = {"published": True, "carried_over": carried}
+            print(f"(Woo Scraper Logic) Shadow table swapped in; {carried} rows of categories not crawled completely were carried over.")
+        except mysql.connector.Error as err:
+            print(f"(Woo Scraper Logic) Publishing the shadow table failed ({err}); the live table is unchanged.")
+            db_connection.rollback()
+            shadow.abort()
+            shadow_result = {"published": False, "error": str(err)}
+    if cmd_args.scrape_mode == "incremental":
+        tracker.retire_unseen(db_connection, 'barefoot_products', completed_categories, batch_size=cmd_args.db_batch_size)
+    # Categories finished or started by an interrupted run were partly crawled by that run, so this one
+    # neither retires their memberships nor measures their change rate
+    fresh_categories = completed_categories - set(checkpoint.completed_scopes) - set(checkpoint.done_urls)
+    frontier.retire(db_connection, fresh_categories, cmd_args.db_batch_size)
+    print(f"(Woo Scraper Logic) URL frontier: {frontier.counts}")
+    feed.retire(tracker.seen, completed_categories)
+    feed.close()
+    if scheduler:
+        seen_by_category = tracker.seen_by_scope()
+        for category_name in fresh_categories:
+            scheduler.record(category_name, seen_by_category.get(category_name, 0),
+                             feed.scope_counts.get(category_name, {}).get('changed', 0))
+        scheduler.save()
+        print(f"(Woo Scraper Logic) Next visits in hours: {scheduler.next_visit_hours}")
+    if sink: sink.close()
+    checkpoint.finish()
     if db_connection and db_connection.is_connected(): db_connection.close()
     print(f"\nDone scraping all Woo categories. Total products processed: {total_products_processed_for_db}")
-    return {"status": "success", "message": f"WooCommerce scraping finished. Products processed: {total_products_processed_for_db}"}
+    print(f"(Woo Scraper Logic) Delta counters: {tracker.counts}")
+    run_cache_stats = cache_stats_delta(cache_stats_before, cache.snapshot()) if cache else None
+    if run_cache_stats: print(f"(Woo Scraper Logic) HTTP cache: {run_cache_stats}")
+    wall_s = pipeline_result["metrics"]["wall_s"]
+    run_summary = {"rows_per_s": round(writer.rows_written / wall_s, 2) if wall_s > 0 else 0.0, **run_metrics.summary()}
+    print(f"(Woo Scraper Logic) Run metrics: {run_summary}")
+    return {"status": "error" if shadow_result and not shadow_result["published"] else "success",
+            "message": f"WooCommerce scraping finished. Products processed: {total_products_processed_for_db}",
+            "shadow": shadow_result,
+            "resumed": checkpoint.resumed, **tracker.counts, "changes": feed.counts, "frontier": frontier.counts,
+            "revisit": {"skipped": len(skipped_categories), "next_visit_hours": scheduler.next_visit_hours} if scheduler else None,
+            "parquet_files": sink.files if sink else None, "http_cache": run_cache_stats, "pipeline": pipeline_result["metrics"],
+            "host_rates": host_limiter.snapshot(), "metrics": run_summary,
+            "shard": {"run_id": leases.run_id, "owner": leases.owner, "categories": leases.claimed} if leases else None}
 # --- End of Main WooCommerce Scraping Logic ---
 
 
+# --- Scrape Processes ---
+scrape_worker = ScrapeWorker("woo", "WooCommerce", "categories", run_woo_scraper_logic, init_db_pool)
+atexit.register(scrape_worker.stop) # Runs before multiprocessing's own exit handler would wait for the worker
+
+
+def run_in_scrape_process(cmd_args, job, scope=None, shard_run_id=None):
+    """run_woo_scraper_logic in the scrape worker process; its progress is applied to `job`.
+
+    The API process then only relays events, so parsing in the crawl never competes with requests for the GIL.
+    """
+    return scrape_worker.run(cmd_args, job, scope=scope, shard_run_id=shard_run_id)
+
+
 # --- Flask App Setup ---
-app = Flask(__name__)
-is_scraping_woo = False
+jobs = JobRegistry("categories")
 scraper_thread_woo = None
+trigger_lock = threading.Lock() # Held while checking for a running job and starting a new one
+last_run_result = None # Result (with its metrics summary) of the most recently finished run
+
+def create_app():
+    """Builds the Flask API. Flask is imported here, so processes that only run scrapes never load it."""
+    from flask import Flask, jsonify, request, Response
+    app = Flask(__name__)
+
+    @app.route('/run_woo_scrape', methods=['POST'])
+    def trigger_woo_scrape():
+        if script_args is None:
+            return jsonify({"status": "error", "message": "Woo script arguments not initialized."}), 500
+
+        # Optional JSON body {"categories": [...]} limits the run to some of the configured categories.
+        # "shard_run_id" is sent by the replica that fanned a sharded run out to this one.
+        body = request.get_json(silent=True) or {}
+        scope = body.get("categories")
+        shard_run_id = body.get("shard_run_id")
+        if scope is not None:
+            if not isinstance(scope, list) or not scope:
+                return jsonify({"status": "error", "message": "'categories' must be a non-empty list of category names or URLs."}), 400
+            _, unknown_categories = select_categories(load_categories(script_args.categories_file_path), scope)
+            if unknown_categories:
+                return jsonify({"status": "error", "message": f"Categories not in the configured list: {unknown_categories}"}), 400
+
+        print("API: Received request to run WooCommerce scraper.")
+        with trigger_lock: # Checked and started together, so two triggers (or a trigger and the timer) cannot both start a run
+            active_job = jobs.active()
+            if active_job and scraper_thread_woo and scraper_thread_woo.is_alive():
+                return jsonify({"status": "busy", "message": "WooCommerce scraping is already in progress.",
+                                "job_id": active_job.id, "status_url": f"/jobs/{active_job.id}"}), 429
+            job = start_scrape_job(scope, shard_run_id)
+
+        peers = None
+        if script_args.shard_mode == "lease" and script_args.peer_service and not shard_run_id:
+            peers = fan_out_to_peers(script_args.peer_service, '/run_woo_scrape', job.id, int(os.environ.get("FLASK_PORT_WOO", 5002)), "categories", scope)
+
+        return jsonify({"status": "triggered", "message": "WooCommerce scraping process started in background.",
+                        "job_id": job.id, "status_url": f"/jobs/{job.id}",
+                        "shard_run_id": (shard_run_id or job.id) if script_args.shard_mode == "lease" else None, "peers": peers}), 202
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        return jsonify([{key: value for key, value in job.snapshot().items() if key != "result"} for job in jobs.recent()]), 200
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Unknown job '{job_id}'."}), 404
+        return jsonify(job.snapshot()), 200
 
-@app.route('/run_woo_scrape', methods=['POST'])
-def trigger_woo_scrape():
-    global is_scraping_woo, scraper_thread_woo, script_args # Access global script_args
+    @app.route('/http_cache_stats', methods=['GET'])
+    def get_http_cache_stats():
+        cache = httpcache.http_cache
+        if cache is None:
+            return jsonify({"enabled": False}), 200
+        return jsonify({"enabled": True, "path": cache.path, **cache.snapshot()}), 200
 
-    if script_args is None:
-        return jsonify({"status": "error", "message": "Woo script arguments not initialized."}), 500
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(scrape_worker.current_metrics().render_prometheus(METRICS_PREFIX), mimetype="text/plain; version=0.0.4")
 
-    if is_scraping_woo and scraper_thread_woo and scraper_thread_woo.is_alive():
-        return jsonify({"status": "busy", "message": "WooCommerce scraping is already in progress."}), 429
+    @app.route('/last_run', methods=['GET'])
+    def get_last_run():
+        if last_run_result is None:
+            return jsonify({"status": "none", "message": "No WooCommerce run has finished yet."}), 404
+        return jsonify(last_run_result), 200
 
-    print("API: Received request to run WooCommerce scraper.")
-    is_scraping_woo = True
-    scraper_thread_woo = threading.Thread(target=run_scraper_with_status_update_woo, args=(script_args,))
+    @app.route('/ready', methods=['GET'])
+    def get_ready():
+        """Readiness probe: ready once whatever runs crawls (the scrape worker with --scrape_in process) takes triggers.
+
+        `db_pool` is the state of the pool those crawls use; until it is open they use direct connections.
+        """
+        if script_args is None:
+            return jsonify({"status": "starting"}), 503
+        if script_args.scrape_in == "process":
+            # Crawls run in the scrape worker, with its pool; until it is up a trigger would have to wait for it
+            if not scrape_worker.ready:
+                return jsonify({"status": "starting", "scrape_worker": False, "db_pool": None}), 503
+            return jsonify({"status": "ready", "scrape_worker": True, "db_pool": scrape_worker.db_pool}), 200
+        return jsonify({"status": "ready", "scrape_worker": None, "db_pool": db_pool is not None}), 200
+
+    return app
+
+def start_scrape_job(scope=None, shard_run_id=None):
+    """Creates a job and starts its run in the background. Callers hold trigger_lock."""
+    global scraper_thread_woo
+    job = jobs.create(scope)
+    scraper_thread_woo = threading.Thread(target=run_scraper_with_status_update_woo, args=(script_args, job, shard_run_id))
     scraper_thread_woo.start()
-    return jsonify({"status": "triggered", "message": "WooCommerce scraping process started in background."}), 202
+    return job
+
+def run_schedule_timer(interval_s):
+    """Built-in trigger (--schedule_every_minutes): starts a run every `interval_s` seconds unless one is still going.
+
+    Combined with --revisit adaptive, each of these runs only crawls what is due.
+    """
+    while True:
+        time.sleep(interval_s)
+        with trigger_lock:
+            if scraper_thread_woo and scraper_thread_woo.is_alive():
+                print("Scheduler: the previous WooCommerce run is still in progress; skipping this tick.")
+                continue
+            job = start_scrape_job()
+        print(f"Scheduler: started WooCommerce run (job {job.id}).")
+
+def start_schedule_timer():
+    if script_args.schedule_every_minutes <= 0:
+        return
+    if script_args.shard_mode == "lease":
+        # Every replica would run its own timer; trigger sharded runs from outside (e.g. a CronJob) instead
+        print("Scheduler: --schedule_every_minutes is ignored with --shard_mode lease.")
+        return
+    print(f"Scheduler: triggering a WooCommerce run every {script_args.schedule_every_minutes:g} minutes.")
+    threading.Thread(target=run_schedule_timer, args=(script_args.schedule_every_minutes * 60,), name="woo-schedule", daemon=True).start()
+
+def on_server_start():
+    """Runs in the serving process (the gunicorn worker) once it is up.
+
+    The DB pool opens where crawls run: in the scrape worker with --scrape_in process, otherwise in the
+    background here, so a slow or unreachable MySQL does not hold up /ready.
+    """
+    if script_args.scrape_in == "process":
+        scrape_worker.start(script_args)
+    elif script_args.db_pool_size > 0:
+        threading.Thread(target=init_db_pool, args=(db_config_from_args(script_args), script_args.db_pool_size),
+                         name="woo-db-pool", daemon=True).start()
+    start_schedule_timer()
 
-def run_scraper_with_status_update_woo(current_script_args_for_thread):
-    global is_scraping_woo
+def run_scraper_with_status_update_woo(current_script_args_for_thread, job, shard_run_id=None):
+    global last_run_result
+    result = None
     try:
-        run_woo_scraper_logic(current_script_args_for_thread)
+        run = run_in_scrape_process if current_script_args_for_thread.scrape_in == "process" else run_woo_scraper_logic
+        result = last_run_result = run(current_script_args_for_thread, job=job, scope=job.scope, shard_run_id=shard_run_id)
     except Exception as e:
         print(f"Exception during WooCommerce scraper execution thread: {e}")
+        result = {"status": "error", "message": f"Exception during WooCommerce scraping: {e}"}
     finally:
-        is_scraping_woo = False
-        print("WooCommerce scraper thread finished.")
+        job.finish(result)
+        print(f"WooCommerce scraper thread finished (job {job.id}: {job.status}).")
 
 if __name__ == '__main__':
     script_args = parser.parse_args() # Parse args ONCE when the script starts
     print(f"Initial Barefoot (Woo) scraper arguments parsed: {script_args}")
 
     port = int(os.environ.get("FLASK_PORT_WOO", 5002)) # Use a different port/env var
-    print(f"Starting WooCommerce (Barefoot) Scraper Flask API on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    if script_args.server == "gunicorn":
+        print(f"Starting WooCommerce (Barefoot) Scraper API under gunicorn on port {port} ({script_args.server_threads} threads)")
+        serve_with_gunicorn(create_app(), port, script_args.server_threads, on_worker_start=on_server_start)
+    else:
+        app = create_app()
+        on_server_start()
+        print(f"Starting WooCommerce (Barefoot) Scraper Flask API on port {port}")
+        app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file